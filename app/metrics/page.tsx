@@ -1,7 +1,7 @@
 'use client';
 
 import { useEffect, useState } from 'react';
-import { metricsAPI, customerAPI } from '@/lib/api';
+import { metricsAPI } from '@/lib/api';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, LineChart, Line } from 'recharts';
 import { RefreshCw, TrendingUp, TrendingDown } from 'lucide-react';
 import ImportExport from '@/components/ImportExport';
@@ -9,7 +9,7 @@ import ImportExport from '@/components/ImportExport';
 interface CustomerMetric {
   id: number;
   customer_id: number;
-  customer?: { name: string };
+  customer_name: string;
   total_orders: number;
   total_order_value: number;
   payment_frequency_score: number;
@@ -34,22 +34,9 @@ export default function MetricsPage() {
   const loadMetrics = async () => {
     try {
       setLoading(true);
-      // Get all customers and their metrics
-      const customersRes = await customerAPI.getAll(0, 1000);
-      const customers = customersRes.data;
-
-      // Fetch metrics for each customer
-      const metricsPromises = customers.map(async (customer: any) => {
-        try {
-          const metricsRes = await metricsAPI.getCustomerMetrics(customer.id);
-          return { ...metricsRes.data, customer };
-        } catch {
-          return null;
-        }
-      });
-
-      const allMetrics = (await Promise.all(metricsPromises)).filter((m) => m !== null);
-      setMetrics(allMetrics);
+      // Metrics joined with customer names, best first, in one request
+      const metricsRes = await metricsAPI.getAll({ limit: 1000, sort_by: 'overall_score', order: 'desc' });
+      setMetrics(metricsRes.data);
     } catch (error) {
       console.error('Error loading metrics:', error);
     } finally {
@@ -76,7 +63,7 @@ export default function MetricsPage() {
     .sort((a, b) => b.overall_score - a.overall_score)
     .slice(0, 10)
     .map((m) => ({
-      name: m.customer?.name || `Customer ${m.customer_id}`,
+      name: m.customer_name || `Customer ${m.customer_id}`,
       score: m.overall_score,
       performance: m.performance_score,
       payment: m.payment_frequency_score,
@@ -102,7 +89,7 @@ export default function MetricsPage() {
           <ImportExport
             exportData={metrics.map(m => ({
               'Customer ID': m.customer_id,
-              'Customer Name': m.customer?.name || '',
+              'Customer Name': m.customer_name || '',
               'Overall Score': m.overall_score,
               'Performance Score': m.performance_score,
               'Payment Frequency Score': m.payment_frequency_score,
@@ -232,44 +219,42 @@ export default function MetricsPage() {
                 </tr>
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
-                {metrics
-                  .sort((a, b) => b.overall_score - a.overall_score)
-                  .map((metric) => (
-                    <tr key={metric.id} className="hover:bg-gray-50">
-                      <td className="px-6 py-4 whitespace-nowrap">
-                        <div className="text-sm font-medium text-gray-900">
-                          {metric.customer?.name || `Customer ${metric.customer_id}`}
-                        </div>
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap">
-                        <div className="flex items-center">
-                          <span className="text-sm font-bold text-gray-900">
-                            {metric.overall_score.toFixed(1)}
-                          </span>
-                          {metric.overall_score >= 70 ? (
-                            <TrendingUp className="h-4 w-4 text-green-500 ml-2" />
-                          ) : (
-                            <TrendingDown className="h-4 w-4 text-red-500 ml-2" />
-                          )}
-                        </div>
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                        {metric.performance_score.toFixed(1)}
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                        {metric.payment_frequency_score.toFixed(1)}
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                        {metric.credit_period_score.toFixed(1)}
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                        {metric.total_orders}
-                      </td>
-                      <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
-                        {metric.on_time_payment_percentage.toFixed(1)}%
-                      </td>
-                    </tr>
-                  ))}
+                {metrics.map((metric) => (
+                  <tr key={metric.id} className="hover:bg-gray-50">
+                    <td className="px-6 py-4 whitespace-nowrap">
+                      <div className="text-sm font-medium text-gray-900">
+                        {metric.customer_name || `Customer ${metric.customer_id}`}
+                      </div>
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap">
+                      <div className="flex items-center">
+                        <span className="text-sm font-bold text-gray-900">
+                          {metric.overall_score.toFixed(1)}
+                        </span>
+                        {metric.overall_score >= 70 ? (
+                          <TrendingUp className="h-4 w-4 text-green-500 ml-2" />
+                        ) : (
+                          <TrendingDown className="h-4 w-4 text-red-500 ml-2" />
+                        )}
+                      </div>
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                      {metric.performance_score.toFixed(1)}
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                      {metric.payment_frequency_score.toFixed(1)}
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                      {metric.credit_period_score.toFixed(1)}
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                      {metric.total_orders}
+                    </td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                      {metric.on_time_payment_percentage.toFixed(1)}%
+                    </td>
+                  </tr>
+                ))}
               </tbody>
             </table>
           </div>
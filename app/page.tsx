@@ -1,7 +1,7 @@
 'use client';
 
 import { useEffect, useState } from 'react';
-import { customerAPI, inventoryAPI, orderAPI, paymentAPI, healthCheck } from '@/lib/api';
+import { dashboardAPI, healthCheck } from '@/lib/api';
 import { Users, Package, ShoppingCart, CreditCard, TrendingUp, AlertCircle } from 'lucide-react';
 import Link from 'next/link';
 
@@ -11,6 +11,7 @@ interface Stats {
   orders: number;
   payments: number;
   pendingOrders: number;
+  overduePayments: number;
   serverStatus: 'online' | 'offline';
 }
 
@@ -21,6 +22,7 @@ export default function Dashboard() {
     orders: 0,
     payments: 0,
     pendingOrders: 0,
+    overduePayments: 0,
     serverStatus: 'offline',
   });
   const [loading, setLoading] = useState(true);
@@ -41,23 +43,16 @@ export default function Dashboard() {
         setStats((prev) => ({ ...prev, serverStatus: 'offline' }));
       }
 
-      // Load statistics
-      const [customersRes, inventoryRes, ordersRes, paymentsRes] = await Promise.all([
-        customerAPI.getAll(0, 1),
-        inventoryAPI.getAll(0, 1),
-        orderAPI.getAll({ limit: 1 }),
-        paymentAPI.getAll({ limit: 1 }),
-      ]);
-
-      // Get pending orders count
-      const pendingOrdersRes = await orderAPI.getAll({ status: 'pending', limit: 1 });
+      // Load statistics (totals counted by the server in one request)
+      const { data: summary } = await dashboardAPI.getSummary();
 
       setStats({
-        customers: customersRes.data.length > 0 ? 839 : 0, // Approximate from import
-        inventory: inventoryRes.data.length > 0 ? 513 : 0, // Approximate from import
-        orders: ordersRes.data.length,
-        payments: paymentsRes.data.length,
-        pendingOrders: pendingOrdersRes.data.length,
+        customers: summary.customers,
+        inventory: summary.inventory_items,
+        orders: summary.orders,
+        payments: summary.payments,
+        pendingOrders: summary.pending_orders,
+        overduePayments: summary.overdue_payments,
         serverStatus: 'online',
       });
     } catch (error) {
@@ -216,6 +211,31 @@ export default function Dashboard() {
           </div>
         </div>
       )}
+
+      {/* Overdue Payments Alert */}
+      {stats.overduePayments > 0 && (
+        <div className="bg-red-50 border border-red-200 rounded-lg p-4">
+          <div className="flex items-center justify-between">
+            <div className="flex items-center gap-3">
+              <AlertCircle className="h-5 w-5 text-red-600" />
+              <div>
+                <p className="text-sm font-medium text-red-800">
+                  {stats.overduePayments} Overdue Payment{stats.overduePayments !== 1 ? 's' : ''}
+                </p>
+                <p className="text-sm text-red-600">
+                  Paid after their due date
+                </p>
+              </div>
+            </div>
+            <Link
+              href="/payments"
+              className="px-4 py-2 bg-red-600 text-white text-sm font-medium rounded-lg hover:bg-red-700 transition-colors"
+            >
+              View Payments
+            </Link>
+          </div>
+        </div>
+      )}
     </div>
   );
 }
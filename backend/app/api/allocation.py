@@ -1,78 +1,188 @@
 """
 API endpoints for order allocation
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 from app.database import get_db
-from app.models import Allocation, Order
+from app.models import Allocation, AllocationRun, Order
 from app.schemas import (
-    AllocationRequest, AllocationResult, AllocationResponse
+    AllocationRequest, AllocationResult, AllocationResponse, AllocationJob,
+    AllocationRun as AllocationRunSchema, SimulationRequest, SimulationResult
 )
-from app.services.allocation_service import AllocationService
+from app.services.allocation_service import AllocationService, AllocationConflictError
+from app.services.allocation_job_service import AllocationJobService, AllocationJobConflict
+from app.services.allocation_simulation_service import AllocationSimulationService
+from app.services.pagination_service import PaginationService, InvalidCursorError
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
 from app.services.export_service import ExportService
 
 router = APIRouter(prefix="/allocation", tags=["allocation"])
 
+# Sort keys of the allocation history, newest first (cursor pagination)
+HISTORY_PAGE_KEYS = [(Allocation.allocation_date, True), (Allocation.id, True)]
+
 
 @router.post("/allocate", response_model=List[AllocationResult])
 def allocate_orders(
     request: AllocationRequest,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Allocate orders to customers based on performance metrics and stock availability"""
+    """
+    Allocate orders to customers based on performance metrics and stock availability.
+    Returns 409, like POST /jobs, while a background allocation job is running.
+    """
+    if request.algorithm not in AllocationService.ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown allocation algorithm: {request.algorithm}"
+        )
+    
+    active_job_id = AllocationJobService.active_job_id()
+    if active_job_id is not None:
+        raise HTTPException(status_code=409, detail=str(AllocationJobConflict(active_job_id)))
+    
     try:
+        stats = {}
         results = AllocationService.allocate_orders(
             order_ids=request.order_ids,
             db=db,
-            recalculate_metrics=request.recalculate_metrics
+            recalculate_metrics=request.recalculate_metrics,
+            algorithm=request.algorithm,
+            parallel=request.parallel,
+            stats=stats
         )
         
+        # Report the run id and per-run persistence time
+        if 'run_id' in stats:
+            response.headers["X-Allocation-Run-Id"] = str(stats['run_id'])
+        if 'flush_seconds' in stats:
+            response.headers["X-Allocation-Flush-Seconds"] = f"{stats['flush_seconds']:.4f}"
+        
         # Automatically export to CSV after allocation
         if results:
             try:
-                # Export detailed allocation CSV
-                csv_path = ExportService.export_allocation_to_csv(
+                ExportService.export_allocation_run(
                     allocation_results=results,
                     order_ids=request.order_ids,
-                    db=db
-                )
-                
-                # Export summary CSV
-                summary_path = ExportService.export_allocation_summary_to_csv(
-                    allocation_results=results,
-                    db=db
+                    db=db,
+                    run_id=stats.get('run_id')
                 )
-                
-                # Add export paths to response metadata (optional)
-                # You can access these via the response or store in a separate endpoint
-                
             except Exception as export_error:
                 # Log error but don't fail the allocation
                 print(f"Warning: CSV export failed: {export_error}")
         
         return results
+    except AllocationConflictError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Allocation conflicted with concurrent changes, retry later: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Allocation failed: {str(e)}")
 
 
+@router.post("/jobs", response_model=AllocationJob, status_code=202)
+def create_allocation_job(request: AllocationRequest):
+    """Start an allocation in the background and return its job id immediately"""
+    if request.algorithm not in AllocationService.ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown allocation algorithm: {request.algorithm}"
+        )
+    
+    try:
+        return AllocationJobService.submit(
+            order_ids=request.order_ids,
+            recalculate_metrics=request.recalculate_metrics,
+            algorithm=request.algorithm,
+            parallel=request.parallel
+        )
+    except AllocationJobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=AllocationJob)
+def get_allocation_job(job_id: str):
+    """Get the phase, progress and (once completed) results of an allocation job"""
+    job = AllocationJobService.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Allocation job not found")
+    return job
+
+
+@router.post("/simulate", response_model=List[SimulationResult])
+def simulate_allocation(request: SimulationRequest, db: Session = Depends(get_db)):
+    """
+    Dry-run allocation under different weights and min/max percentages.
+    Pending orders are loaded once; nothing is written to the database.
+    """
+    if request.algorithm not in AllocationService.ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown allocation algorithm: {request.algorithm}"
+        )
+    
+    configs = [config.model_dump() for config in request.configs]
+    if request.grid:
+        try:
+            configs.extend(AllocationSimulationService.expand_grid(request.grid))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not configs:
+        # Simulate the current settings
+        configs = [{}]
+    if len(configs) > settings.simulation_max_configs:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many configurations ({len(configs)}), limit is {settings.simulation_max_configs}"
+        )
+    
+    return AllocationSimulationService.simulate(
+        configs=configs,
+        db=db,
+        order_ids=request.order_ids,
+        algorithm=request.algorithm,
+        include_customers=request.include_customers
+    )
+
+
 @router.get("/history", response_model=List[AllocationResponse])
 def get_allocation_history(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     order_id: int = None,
     inventory_id: int = None,
+    run_id: int = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get allocation history"""
-    query = db.query(Allocation)
+    """Get allocation history, newest first; pass X-Next-Cursor back as cursor for the next page"""
+    query = db.query(Allocation).options(joinedload(Allocation.inventory))
     
+    if run_id:
+        query = query.filter(Allocation.run_id == run_id)
     if order_id:
         query = query.filter(Allocation.order_id == order_id)
     if inventory_id:
         query = query.filter(Allocation.inventory_id == inventory_id)
     
-    allocations = query.order_by(Allocation.allocation_date.desc()).offset(skip).limit(limit).all()
+    try:
+        query = PaginationService.paginate(query, HISTORY_PAGE_KEYS, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    allocations = query.all()
+    allocations, next_cursor = PaginationService.page(allocations, HISTORY_PAGE_KEYS, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return allocations
 
 
@@ -83,6 +193,41 @@ def get_order_allocations(order_id: int, db: Session = Depends(get_db)):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    allocations = db.query(Allocation).filter(Allocation.order_id == order_id).all()
+    allocations = db.query(Allocation).options(joinedload(Allocation.inventory)).filter(
+        Allocation.order_id == order_id
+    ).all()
     return allocations
 
+
+
+@router.get("/runs", response_model=List[AllocationRunSchema])
+def get_allocation_runs(
+    skip: int = 0,
+    limit: int = 100,
+    status: str = None,
+    db: Session = Depends(get_db)
+):
+    """Get allocation runs, newest first"""
+    query = db.query(AllocationRun)
+    if status:
+        query = query.filter(AllocationRun.status == status)
+    return query.order_by(AllocationRun.id.desc()).offset(skip).limit(limit).all()
+
+
+@router.get("/runs/{run_id}", response_model=AllocationRunSchema)
+def get_allocation_run(run_id: int, db: Session = Depends(get_db)):
+    """Get the parameters, timings and counts of an allocation run"""
+    run = db.query(AllocationRun).filter(AllocationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Allocation run not found")
+    return run
+
+
+@router.get("/runs/{run_id}/allocations", response_model=List[AllocationResponse])
+def get_allocation_run_allocations(run_id: int, db: Session = Depends(get_db)):
+    """Get all allocations made by an allocation run"""
+    run = db.query(AllocationRun).filter(AllocationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Allocation run not found")
+    
+    return ExportService.get_run_allocations(run_id=run_id, db=db)
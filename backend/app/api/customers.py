@@ -1,16 +1,23 @@
 """
 API endpoints for customer management
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_db, get_async_db
 from app.models import Customer
 from app.schemas import CustomerCreate, CustomerUpdate, Customer as CustomerSchema
-from app.services.metrics_service import MetricsService
+from app.services.metrics_scheduler import MetricsRefreshScheduler
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.pagination_service import PaginationService, InvalidCursorError
 
 router = APIRouter(prefix="/customers", tags=["customers"])
 
+# Sort keys of the customer list (cursor pagination)
+PAGE_KEYS = [(Customer.id, False)]
+
 
 @router.post("/", response_model=CustomerSchema, status_code=201)
 def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
@@ -20,26 +27,37 @@ def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_customer)
     
-    # Initialize metrics
-    try:
-        MetricsService.calculate_all_metrics(db_customer.id, db)
-    except:
-        pass
+    # Metrics are initialized in the background
+    MetricsRefreshScheduler.enqueue([db_customer.id])
     
     return db_customer
 
 
 @router.get("/", response_model=List[CustomerSchema])
-def get_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all customers"""
-    customers = db.query(Customer).offset(skip).limit(limit).all()
+async def get_customers(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get all customers by id; pass X-Next-Cursor back as cursor for the next page"""
+    try:
+        query = PaginationService.paginate(select(Customer), PAGE_KEYS, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    customers = (await db.execute(query)).scalars().all()
+    customers, next_cursor = PaginationService.page(customers, PAGE_KEYS, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return customers
 
 
 @router.get("/{customer_id}", response_model=CustomerSchema)
-def get_customer(customer_id: int, db: Session = Depends(get_db)):
+async def get_customer(customer_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific customer"""
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
@@ -60,16 +78,16 @@ def update_customer(
     for field, value in update_data.items():
         setattr(customer, field, value)
     
+    # Mark metrics for recalculation if relevant fields changed
+    metrics_changed = any(field in update_data for field in ['credit_limit', 'credit_period_days', 'status'])
+    if metrics_changed:
+        MetricAggregateService.ensure(db, [customer_id])
+        MetricAggregateService.mark_stale([customer_id], db)
+    
     db.commit()
     db.refresh(customer)
-    
-    # Recalculate metrics if relevant fields changed
-    if any(field in update_data for field in ['credit_limit', 'credit_period_days', 'status']):
-        try:
-            MetricsService.calculate_all_metrics(customer_id, db)
-        except:
-            pass
-    
+    if metrics_changed:
+        MetricsRefreshScheduler.enqueue([customer_id])
     return customer
 
 
@@ -0,0 +1,19 @@
+"""
+API endpoints for the dashboard
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas import DashboardSummary
+from app.services.dashboard_service import DashboardService
+
+router = APIRouter(prefix="/dashboard", tags=["dashboard"])
+
+
+@router.get("/summary", response_model=DashboardSummary)
+def get_dashboard_summary(refresh: bool = False, db: Session = Depends(get_db)):
+    """
+    Totals for the dashboard: counts per entity, orders by status, stock and
+    overdue payments. Served from a short-lived cache; refresh=true recounts.
+    """
+    return DashboardService.summary(db, refresh)
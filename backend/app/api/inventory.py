@@ -1,17 +1,24 @@
 """
 API endpoints for inventory management
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_db, get_async_db
 from app.models import Inventory
 from app.schemas import (
     InventoryCreate, InventoryUpdate, Inventory as InventorySchema
 )
+from app.services.pagination_service import PaginationService, InvalidCursorError
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
+# Sort keys of the inventory list (cursor pagination)
+PAGE_KEYS = [(Inventory.id, False)]
+
 
 @router.post("/", response_model=InventorySchema, status_code=201)
 def create_inventory_item(item: InventoryCreate, db: Session = Depends(get_db)):
@@ -34,25 +41,39 @@ def create_inventory_item(item: InventoryCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/", response_model=List[InventorySchema])
-def get_inventory_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all inventory items"""
-    items = db.query(Inventory).offset(skip).limit(limit).all()
+async def get_inventory_items(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get all inventory items by id; pass X-Next-Cursor back as cursor for the next page"""
+    try:
+        query = PaginationService.paginate(select(Inventory), PAGE_KEYS, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    items = (await db.execute(query)).scalars().all()
+    items, next_cursor = PaginationService.page(items, PAGE_KEYS, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return items
 
 
 @router.get("/{inventory_id}", response_model=InventorySchema)
-def get_inventory_item(inventory_id: int, db: Session = Depends(get_db)):
+async def get_inventory_item(inventory_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific inventory item"""
-    item = db.query(Inventory).filter(Inventory.id == inventory_id).first()
+    item = await db.get(Inventory, inventory_id)
     if not item:
         raise HTTPException(status_code=404, detail="Inventory item not found")
     return item
 
 
 @router.get("/code/{product_code}", response_model=InventorySchema)
-def get_inventory_by_code(product_code: str, db: Session = Depends(get_db)):
+async def get_inventory_by_code(product_code: str, db: AsyncSession = Depends(get_async_db)):
     """Get inventory item by product code"""
-    item = db.query(Inventory).filter(Inventory.product_code == product_code).first()
+    item = await db.scalar(select(Inventory).filter(Inventory.product_code == product_code))
     if not item:
         raise HTTPException(status_code=404, detail="Inventory item not found")
     return item
@@ -70,10 +91,26 @@ def update_inventory_item(
         raise HTTPException(status_code=404, detail="Inventory item not found")
     
     update_data = item_update.model_dump(exclude_unset=True)
+    expected_version = update_data.pop('version', None)
+    if expected_version is not None and expected_version != item.version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Inventory item was modified (version {item.version}), reload and retry"
+        )
+    
     for field, value in update_data.items():
         setattr(item, field, value)
     
-    db.commit()
+    # The UPDATE only matches the version loaded above; an allocation that
+    # reserved stock in between makes it fail instead of overwriting the reservation
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Inventory item was modified concurrently, reload and retry"
+        )
     db.refresh(item)
     return item
 
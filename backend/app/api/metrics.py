@@ -1,19 +1,171 @@
 """
 API endpoints for customer metrics
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func
+from typing import List, Optional
+from datetime import datetime
 from app.database import get_db
 from app.models import CustomerMetric, Customer
-from app.schemas import CustomerMetric as CustomerMetricSchema
+from app.schemas import (
+    CustomerMetric as CustomerMetricSchema, CustomerMetricSummary,
+    CustomerMetricSnapshot as CustomerMetricSnapshotSchema, LeaderboardPage
+)
 from app.services.metrics_service import MetricsService
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metric_snapshot_service import MetricSnapshotService
+from app.services.metrics_scheduler import MetricsRefreshScheduler
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
+# Columns GET /metrics/ can sort by
+SORT_COLUMNS = {
+    'overall_score': CustomerMetric.overall_score,
+    'performance_score': CustomerMetric.performance_score,
+    'payment_frequency_score': CustomerMetric.payment_frequency_score,
+    'credit_period_score': CustomerMetric.credit_period_score,
+    'overall_score_90d': CustomerMetric.overall_score_90d,
+    'overall_score_180d': CustomerMetric.overall_score_180d,
+    'overall_score_365d': CustomerMetric.overall_score_365d,
+    'total_orders': CustomerMetric.total_orders,
+    'total_order_value': CustomerMetric.total_order_value,
+    'on_time_payment_percentage': CustomerMetric.on_time_payment_percentage,
+    'overdue_count': CustomerMetric.overdue_count,
+    'last_calculated': CustomerMetric.last_calculated,
+    'customer_name': Customer.name,
+    'customer_id': CustomerMetric.customer_id,
+}
 
-@router.get("/customer/{customer_id}", response_model=CustomerMetricSchema)
-def get_customer_metrics(customer_id: int, db: Session = Depends(get_db)):
-    """Get metrics for a specific customer"""
+
+@router.get("/", response_model=List[CustomerMetricSummary])
+def get_metrics(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    sort_by: str = "overall_score",
+    order: str = "desc",
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    status: Optional[str] = None,
+    compute_missing: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Get metrics for many customers, joined with customer names, in one query.
+    Filters by overall score range and customer status; the total match count
+    is returned in the X-Total-Count header. Customers without metrics are
+    left out unless compute_missing=true, which calculates them from running
+    aggregates first.
+    """
+    if sort_by not in SORT_COLUMNS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort_by. Choose from: {', '.join(SORT_COLUMNS)}"
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    
+    if compute_missing:
+        missing_query = db.query(Customer.id).outerjoin(
+            CustomerMetric, CustomerMetric.customer_id == Customer.id
+        ).filter(CustomerMetric.id.is_(None))
+        if status:
+            missing_query = missing_query.filter(Customer.status == status)
+        missing = [row.id for row in missing_query.all()]
+        if missing:
+            MetricsService.refresh_from_aggregates(missing, db)
+            db.commit()
+    
+    query = db.query(
+        CustomerMetric,
+        Customer.name.label('customer_name'),
+        Customer.status.label('customer_status')
+    ).join(Customer, Customer.id == CustomerMetric.customer_id)
+    if min_score is not None:
+        query = query.filter(CustomerMetric.overall_score >= min_score)
+    if max_score is not None:
+        query = query.filter(CustomerMetric.overall_score <= max_score)
+    if status:
+        query = query.filter(Customer.status == status)
+    
+    response.headers["X-Total-Count"] = str(query.count())
+    
+    sort_column = SORT_COLUMNS[sort_by]
+    sort_column = sort_column.asc() if order == "asc" else sort_column.desc()
+    rows = query.order_by(sort_column, CustomerMetric.customer_id).offset(skip).limit(limit).all()
+    
+    return [
+        {
+            **CustomerMetricSchema.model_validate(metrics).model_dump(),
+            'customer_name': customer_name,
+            'customer_status': customer_status
+        }
+        for metrics, customer_name, customer_status in rows
+    ]
+
+
+@router.get("/leaderboard", response_model=LeaderboardPage)
+def get_leaderboard(
+    limit: int = Query(50, ge=1, le=500),
+    after_score: Optional[float] = None,
+    after_customer_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Customers ranked by overall score, highest first (ties by customer id).
+    Pages with keyset pagination: pass the previous page's next_after_score
+    and next_after_customer_id. Served by the (overall_score, customer_id) index.
+    """
+    if (after_score is None) != (after_customer_id is None):
+        raise HTTPException(status_code=400, detail="after_score and after_customer_id must be given together")
+    
+    query = db.query(
+        CustomerMetric.customer_id, Customer.name.label('customer_name'), CustomerMetric.overall_score,
+        CustomerMetric.performance_score, CustomerMetric.payment_frequency_score,
+        CustomerMetric.credit_period_score
+    ).join(Customer, Customer.id == CustomerMetric.customer_id).filter(
+        CustomerMetric.overall_score.isnot(None)
+    )
+    
+    rank_offset = 0
+    if after_score is not None:
+        after = or_(
+            CustomerMetric.overall_score < after_score,
+            and_(CustomerMetric.overall_score == after_score, CustomerMetric.customer_id < after_customer_id)
+        )
+        query = query.filter(after)
+        # Rows ranked ahead of this page
+        rank_offset = db.query(func.count(CustomerMetric.id)).filter(
+            CustomerMetric.overall_score.isnot(None), ~after
+        ).scalar()
+    
+    rows = query.order_by(
+        CustomerMetric.overall_score.desc(), CustomerMetric.customer_id.desc()
+    ).limit(limit + 1).all()
+    
+    page = rows[:limit]
+    items = [dict(row._mapping, rank=rank_offset + i + 1) for i, row in enumerate(page)]
+    has_more = len(rows) > limit
+    return {
+        'items': items,
+        'next_after_score': page[-1].overall_score if has_more else None,
+        'next_after_customer_id': page[-1].customer_id if has_more else None
+    }
+
+
+@router.get(
+    "/customer/{customer_id}",
+    response_model=CustomerMetricSchema,
+    responses={202: {"description": "Metrics not calculated yet; scheduled for calculation"}}
+)
+def get_customer_metrics(customer_id: int, compute: bool = False, db: Session = Depends(get_db)):
+    """
+    Get metrics for a specific customer. Missing metrics are scheduled for
+    the background refresh (202 until it runs), or calculated inline with
+    compute=true.
+    """
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
@@ -23,12 +175,35 @@ def get_customer_metrics(customer_id: int, db: Session = Depends(get_db)):
     ).first()
     
     if not metrics:
+        if not compute:
+            MetricsRefreshScheduler.enqueue([customer_id])
+            return JSONResponse(status_code=202, content={
+                'customer_id': customer_id,
+                'status': "scheduled",
+                'detail': "Metrics not calculated yet for this customer; scheduled for calculation"
+            })
         # Calculate metrics if not available
         metrics = MetricsService.calculate_all_metrics(customer_id, db)
     
     return metrics
 
 
+@router.get("/customer/{customer_id}/history", response_model=List[CustomerMetricSnapshotSchema])
+def get_customer_metric_history(
+    customer_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Get a customer's score series between start and end, oldest first"""
+    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    return MetricSnapshotService.history(customer_id, db, start, end, limit)
+
+
 @router.post("/customer/{customer_id}/recalculate", response_model=CustomerMetricSchema)
 def recalculate_customer_metrics(customer_id: int, db: Session = Depends(get_db)):
     """Recalculate metrics for a specific customer"""
@@ -41,8 +216,45 @@ def recalculate_customer_metrics(customer_id: int, db: Session = Depends(get_db)
 
 
 @router.post("/recalculate-all")
-def recalculate_all_metrics(db: Session = Depends(get_db)):
-    """Recalculate metrics for all customers"""
-    count = MetricsService.recalculate_all_metrics(db)
-    return {"message": f"Recalculated metrics for {count} customers", "count": count}
+def recalculate_all_metrics(force: bool = False, db: Session = Depends(get_db)):
+    """
+    Recalculate metrics for customers whose payments, orders or settings
+    changed since their last calculation (all customers with force=true)
+    """
+    if force:
+        count = MetricsService.recalculate_all_metrics(db)
+        skipped = 0
+    else:
+        refresh = MetricsService.refresh_stale_metrics(db)
+        count, skipped = refresh['refreshed'], refresh['skipped']
+    return {
+        "message": f"Recalculated metrics for {count} customers ({skipped} unchanged)",
+        "count": count,
+        "skipped": skipped
+    }
+
+
+@router.get("/recalculate-all/progress")
+def get_recalculation_progress():
+    """Shard progress of the current or last parallel metrics recalculation"""
+    return MetricsService.recalculation_progress()
+
+
+@router.get("/scheduler")
+def get_refresh_scheduler_status():
+    """State of the background metrics refresh and its last run"""
+    return MetricsRefreshScheduler.status()
+
+
+@router.post("/snapshots/compact")
+def compact_metric_snapshots(db: Session = Depends(get_db)):
+    """Downsample old metric snapshots to weekly, then monthly granularity"""
+    removed = MetricSnapshotService.compact(db)
+    return {"message": f"Removed {sum(removed.values())} metric snapshots", "removed": removed}
+
 
+@router.post("/aggregates/rebuild")
+def rebuild_metric_aggregates(db: Session = Depends(get_db)):
+    """Rebuild running metric aggregates from payment and order history"""
+    count = MetricAggregateService.rebuild(db)
+    return {"message": f"Rebuilt metric aggregates for {count} customers", "count": count}
@@ -1,17 +1,32 @@
 """
 API endpoints for order management
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_db, get_async_db
 from app.models import Order, OrderItem, Inventory, Customer
 from app.schemas import (
     OrderCreate, OrderUpdate, Order as OrderSchema, OrderItemResponse
 )
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metrics_scheduler import MetricsRefreshScheduler
+from app.services.pagination_service import PaginationService, InvalidCursorError
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+# Relationships the Order schema serializes, loaded up front: async sessions can't
+# lazy load, and a page of orders takes 2 statements instead of one per order and item
+ORDER_LOAD_OPTIONS = [
+    joinedload(Order.customer),
+    selectinload(Order.order_items).joinedload(OrderItem.inventory),
+]
+
+# Sort keys of the order list (cursor pagination)
+PAGE_KEYS = [(Order.id, False)]
+
 
 @router.post("/", response_model=OrderSchema, status_code=201)
 def create_order(order: OrderCreate, db: Session = Depends(get_db)):
@@ -21,6 +36,9 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    # Build the customer's running aggregates before the new order is flushed
+    MetricAggregateService.ensure(db, [order.customer_id])
+    
     # Create order
     order_data = order.model_dump(exclude={'items'})
     db_order = Order(**order_data)
@@ -47,35 +65,47 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
         total_quantity += item_data.requested_quantity
     
     db_order.total_quantity = total_quantity
+    MetricAggregateService.apply(order.customer_id, MetricAggregateService.order_delta(db_order), db)
     db.commit()
     db.refresh(db_order)
+    MetricsRefreshScheduler.enqueue([order.customer_id])
     return db_order
 
 
 @router.get("/", response_model=List[OrderSchema])
-def get_orders(
+async def get_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: str = None,
     customer_id: int = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all orders with optional filters"""
-    query = db.query(Order)
+    """Get all orders by id with optional filters; pass X-Next-Cursor back as cursor for the next page"""
+    query = select(Order).options(*ORDER_LOAD_OPTIONS)
     
     if status:
         query = query.filter(Order.status == status)
     if customer_id:
         query = query.filter(Order.customer_id == customer_id)
     
-    orders = query.offset(skip).limit(limit).all()
+    try:
+        query = PaginationService.paginate(query, PAGE_KEYS, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    orders = (await db.execute(query)).scalars().all()
+    orders, next_cursor = PaginationService.page(orders, PAGE_KEYS, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return orders
 
 
 @router.get("/{order_id}", response_model=OrderSchema)
-def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific order"""
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.scalar(select(Order).options(*ORDER_LOAD_OPTIONS).filter(Order.id == order_id))
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
@@ -92,12 +122,21 @@ def update_order(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    MetricAggregateService.ensure(db, [order.customer_id])
+    old_delta = MetricAggregateService.order_delta(order)
+    
     update_data = order_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(order, field, value)
     
+    MetricAggregateService.apply(
+        order.customer_id,
+        MetricAggregateService.difference(MetricAggregateService.order_delta(order), old_delta),
+        db
+    )
     db.commit()
     db.refresh(order)
+    MetricsRefreshScheduler.enqueue([order.customer_id])
     return order
 
 
@@ -108,7 +147,11 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    MetricAggregateService.ensure(db, [order.customer_id])
+    customer_id = order.customer_id
+    MetricAggregateService.apply(customer_id, MetricAggregateService.order_delta(order), db, sign=-1)
     db.delete(order)
     db.commit()
+    MetricsRefreshScheduler.enqueue([customer_id])
     return None
 
@@ -1,16 +1,23 @@
 """
 API endpoints for payment management
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_db, get_async_db
 from app.models import Payment, Customer
 from app.schemas import PaymentCreate, PaymentUpdate, Payment as PaymentSchema
-from app.services.metrics_service import MetricsService
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metrics_scheduler import MetricsRefreshScheduler
+from app.services.pagination_service import PaginationService, InvalidCursorError
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
+# Sort keys of the payment list, newest first (cursor pagination)
+PAGE_KEYS = [(Payment.payment_date, True), (Payment.id, True)]
+
 
 @router.post("/", response_model=PaymentSchema, status_code=201)
 def create_payment(payment: PaymentCreate, db: Session = Depends(get_db)):
@@ -31,44 +38,57 @@ def create_payment(payment: PaymentCreate, db: Session = Depends(get_db)):
     payment_data = payment.model_dump()
     payment_data['status'] = status
     
+    MetricAggregateService.ensure(db, [payment.customer_id])
     db_payment = Payment(**payment_data)
     db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
     
-    # Recalculate customer metrics
-    try:
-        MetricsService.calculate_all_metrics(payment.customer_id, db)
-    except:
-        pass
+    # Update running aggregates and monthly buckets in the same transaction
+    delta = MetricAggregateService.payment_delta(db_payment)
+    MetricAggregateService.apply(payment.customer_id, delta, db)
+    MetricAggregateService.apply_month(
+        payment.customer_id, MetricAggregateService.payment_month(db_payment), delta, db
+    )
     
+    db.commit()
+    db.refresh(db_payment)
+    MetricsRefreshScheduler.enqueue([payment.customer_id])
     return db_payment
 
 
 @router.get("/", response_model=List[PaymentSchema])
-def get_payments(
+async def get_payments(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     customer_id: int = None,
     status: str = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all payments with optional filters"""
-    query = db.query(Payment)
+    """Get all payments, newest first, with optional filters; pass X-Next-Cursor back as cursor for the next page"""
+    query = select(Payment)
     
     if customer_id:
         query = query.filter(Payment.customer_id == customer_id)
     if status:
         query = query.filter(Payment.status == status)
     
-    payments = query.order_by(Payment.payment_date.desc()).offset(skip).limit(limit).all()
+    try:
+        query = PaginationService.paginate(query, PAGE_KEYS, limit, cursor, skip)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    payments = (await db.execute(query)).scalars().all()
+    payments, next_cursor = PaginationService.page(payments, PAGE_KEYS, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return payments
 
 
 @router.get("/{payment_id}", response_model=PaymentSchema)
-def get_payment(payment_id: int, db: Session = Depends(get_db)):
+async def get_payment(payment_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific payment"""
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    payment = await db.get(Payment, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     return payment
@@ -85,6 +105,10 @@ def update_payment(
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
+    MetricAggregateService.ensure(db, [payment.customer_id])
+    old_delta = MetricAggregateService.payment_delta(payment)
+    old_month = MetricAggregateService.payment_month(payment)
+    
     update_data = payment_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(payment, field, value)
@@ -96,15 +120,19 @@ def update_payment(
         else:
             payment.status = "overdue"
     
+    # Update running aggregates and monthly buckets in the same transaction
+    new_delta = MetricAggregateService.payment_delta(payment)
+    MetricAggregateService.apply(
+        payment.customer_id, MetricAggregateService.difference(new_delta, old_delta), db
+    )
+    MetricAggregateService.apply_month(payment.customer_id, old_month, old_delta, db, sign=-1)
+    MetricAggregateService.apply_month(
+        payment.customer_id, MetricAggregateService.payment_month(payment), new_delta, db
+    )
+    
     db.commit()
     db.refresh(payment)
-    
-    # Recalculate customer metrics
-    try:
-        MetricsService.calculate_all_metrics(payment.customer_id, db)
-    except:
-        pass
-    
+    MetricsRefreshScheduler.enqueue([payment.customer_id])
     return payment
 
 
@@ -116,14 +144,15 @@ def delete_payment(payment_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Payment not found")
     
     customer_id = payment.customer_id
+    MetricAggregateService.ensure(db, [customer_id])
+    delta = MetricAggregateService.payment_delta(payment)
+    MetricAggregateService.apply(customer_id, delta, db, sign=-1)
+    MetricAggregateService.apply_month(
+        customer_id, MetricAggregateService.payment_month(payment), delta, db, sign=-1
+    )
     db.delete(payment)
-    db.commit()
-    
-    # Recalculate customer metrics
-    try:
-        MetricsService.calculate_all_metrics(customer_id, db)
-    except:
-        pass
     
+    db.commit()
+    MetricsRefreshScheduler.enqueue([customer_id])
     return None
 
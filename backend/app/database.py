@@ -1,9 +1,12 @@
 """
 Database connection and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from contextvars import ContextVar
+import logging
 import sys
 from pathlib import Path
 
@@ -11,14 +14,71 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 # Create SQLite engine
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False}  # Needed for SQLite
 )
 
-# Create session factory
+def async_database_url(url: str) -> str:
+    """The database URL with SQLite's async driver (aiosqlite)"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+# Async engine for the read endpoints, on the same database
+async_engine = create_async_engine(async_database_url(settings.database_url))
+
+def sqlite_pragmas():
+    """PRAGMAs of the configured SQLite performance profile, in the order they are applied"""
+    return [
+        ("busy_timeout", settings.sqlite_busy_timeout_ms),
+        ("journal_mode", settings.sqlite_journal_mode),
+        ("synchronous", settings.sqlite_synchronous),
+        ("cache_size", settings.sqlite_cache_size),
+        ("mmap_size", settings.sqlite_mmap_size),
+        ("temp_store", settings.sqlite_temp_store),
+    ]
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def apply_sqlite_profile(dbapi_connection, connection_record):
+    """Apply the SQLite performance profile to every new pooled connection"""
+    if engine.dialect.name != "sqlite" or not settings.sqlite_performance_profile:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+# SQL statements run in the current context (one API request), when counting
+_query_counter: ContextVar = ContextVar("query_counter", default=None)
+
+def start_query_count():
+    """
+    Count the SQL statements run from here on in the current context.
+    Returns the counter; its 'count' keeps growing until the context ends.
+    Work started from this context (threadpool, async sessions) is counted too.
+    """
+    counter = {'count': 0}
+    _query_counter.set(counter)
+    return counter
+
+@event.listens_for(engine, "before_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """Add one to the current context's query counter, if any"""
+    counter = _query_counter.get()
+    if counter is not None:
+        counter['count'] += 1
+
+# Create session factories; async sessions keep loaded objects usable after commit
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
@@ -31,7 +91,50 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency for getting an async database session (read endpoints)"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+def add_missing_columns():
+    """
+    Add columns and indexes introduced after a table was created.
+    create_all only creates missing tables, so existing databases are
+    brought up to date here; new columns must be nullable or have a
+    server default. Tables that gained indexes are re-analyzed so the
+    query planner has statistics for them.
+    """
+    inspector = inspect(engine)
+    analyze = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                logger.info("Added column %s.%s", table.name, column.name)
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(bind=conn, checkfirst=True)
+                logger.info("Added index %s", index.name)
+                if table.name not in analyze:
+                    analyze.append(table.name)
+        for table_name in analyze:
+            conn.execute(text(f"ANALYZE {table_name}"))
 
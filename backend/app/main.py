@@ -1,10 +1,13 @@
 """
 Main FastAPI application for Order Allocation System
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import init_db
-from app.api import customers, inventory, orders, payments, allocation, metrics, export
+from app.database import init_db, SessionLocal, async_engine, start_query_count
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metrics_scheduler import MetricsRefreshScheduler
+from app.services.worker_pool import WorkerPool
+from app.api import customers, inventory, orders, payments, allocation, metrics, export, dashboard
 
 # Create FastAPI app
 app = FastAPI(
@@ -20,8 +23,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Allocation-Run-Id", "X-Query-Count"],
 )
 
+
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    """Report the number of SQL statements a request ran in the X-Query-Count header"""
+    counter = start_query_count()
+    response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter['count'])
+    return response
+
 # Include routers
 app.include_router(customers.router)
 app.include_router(inventory.router)
@@ -30,6 +43,7 @@ app.include_router(payments.router)
 app.include_router(allocation.router)
 app.include_router(metrics.router)
 app.include_router(export.router)
+app.include_router(dashboard.router)
 
 
 @app.on_event("startup")
@@ -37,6 +51,33 @@ async def startup_event():
     """Initialize database on startup"""
     init_db()
     print("Database initialized")
+    
+    # Build running metric aggregates and monthly payment buckets that don't exist yet
+    db = SessionLocal()
+    try:
+        built = MetricAggregateService.ensure(db)
+        months = MetricAggregateService.ensure_months(db)
+        db.commit()
+        if built:
+            print(f"Built metric aggregates for {built} customers")
+        if months:
+            print(f"Built {months} monthly payment buckets")
+    finally:
+        db.close()
+    
+    # Refresh stale metrics in the background
+    MetricsRefreshScheduler.start()
+    
+    # Start worker processes for parallel allocation, metrics and simulations
+    WorkerPool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and close async database connections"""
+    MetricsRefreshScheduler.stop()
+    WorkerPool.shutdown()
+    await async_engine.dispose()
 
 
 @app.get("/")
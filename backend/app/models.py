@@ -1,7 +1,7 @@
 """
 Database models for Order Allocation System
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -38,16 +38,21 @@ class Inventory(Base):
     available_quantity = Column(Float, default=0.0, nullable=False)
     reserved_quantity = Column(Float, default=0.0)
     unit = Column(String(20), default="pieces")
+    version = Column(Integer, nullable=False, server_default="1")  # Bumped on every stock change
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     order_items = relationship("OrderItem", back_populates="inventory")
     allocations = relationship("Allocation", back_populates="inventory")
+    
+    # ORM updates are conditional on the version they loaded
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (Index("ix_orders_status_customer", "status", "customer_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
@@ -66,6 +71,7 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (Index("ix_order_items_order_inventory", "order_id", "inventory_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
@@ -81,6 +87,10 @@ class OrderItem(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_customer_status_date", "customer_id", "status", "payment_date"),
+        Index("ix_payments_payment_date", "payment_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
@@ -99,6 +109,7 @@ class Payment(Base):
 
 class CustomerMetric(Base):
     __tablename__ = "customer_metrics"
+    __table_args__ = (Index("ix_customer_metrics_overall_score_customer", "overall_score", "customer_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), unique=True, nullable=False)
@@ -117,6 +128,17 @@ class CustomerMetric(Base):
     overdue_count = Column(Integer, default=0)
     total_payments = Column(Integer, default=0)
     
+    # Rolling-window scores from monthly payment buckets (performance stays lifetime)
+    payment_frequency_score_90d = Column(Float)
+    credit_period_score_90d = Column(Float)
+    overall_score_90d = Column(Float)
+    payment_frequency_score_180d = Column(Float)
+    credit_period_score_180d = Column(Float)
+    overall_score_180d = Column(Float)
+    payment_frequency_score_365d = Column(Float)
+    credit_period_score_365d = Column(Float)
+    overall_score_365d = Column(Float)
+    
     last_calculated = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -124,8 +146,81 @@ class CustomerMetric(Base):
     customer = relationship("Customer", back_populates="metrics")
 
 
+class MetricsVersion(Base):
+    """Single-row counter bumped whenever customer_metrics is written"""
+    __tablename__ = "metrics_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True))
+
+
+class CustomerMetricSnapshot(Base):
+    __tablename__ = "customer_metric_snapshots"
+    __table_args__ = (Index("ix_customer_metric_snapshots_customer_recorded", "customer_id", "recorded_at"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    recorded_at = Column(DateTime(timezone=True), nullable=False)
+    granularity = Column(String(10), default="raw", nullable=False)  # raw, week, month
+    
+    overall_score = Column(Float)
+    performance_score = Column(Float)
+    payment_frequency_score = Column(Float)
+    credit_period_score = Column(Float)
+
+
+class CustomerMetricAggregate(Base):
+    __tablename__ = "customer_metric_aggregates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), unique=True, nullable=False)
+    
+    # Running payment totals
+    total_payments = Column(Integer, default=0, nullable=False)
+    paid_count = Column(Integer, default=0, nullable=False)
+    on_time_count = Column(Integer, default=0, nullable=False)  # Paid on or before due date
+    paid_days = Column(Integer, default=0, nullable=False)  # Sum of whole days from due date, paid payments
+    overdue_count = Column(Integer, default=0, nullable=False)  # Status "overdue"
+    late_count = Column(Integer, default=0, nullable=False)  # Paid after due date, any status
+    late_days = Column(Integer, default=0, nullable=False)  # Sum of whole days late
+    
+    # Running order totals
+    total_orders = Column(Integer, default=0, nullable=False)
+    fulfilled_orders = Column(Integer, default=0, nullable=False)
+    total_order_value = Column(Float, default=0.0, nullable=False)
+    
+    # Set when the aggregates or the customer change, cleared when metrics are recalculated
+    metrics_stale = Column(Boolean, default=True, nullable=False, server_default="1")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class CustomerPaymentMonth(Base):
+    __tablename__ = "customer_payment_months"
+    __table_args__ = (UniqueConstraint("customer_id", "month"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    month = Column(String(7), nullable=False)  # YYYY-MM of the payment's due date
+    
+    # Payment aggregates of the month, same meaning as in CustomerMetricAggregate
+    total_payments = Column(Integer, default=0, nullable=False)
+    paid_count = Column(Integer, default=0, nullable=False)
+    on_time_count = Column(Integer, default=0, nullable=False)
+    paid_days = Column(Integer, default=0, nullable=False)
+    overdue_count = Column(Integer, default=0, nullable=False)
+    late_count = Column(Integer, default=0, nullable=False)
+    late_days = Column(Integer, default=0, nullable=False)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Allocation(Base):
     __tablename__ = "allocations"
+    __table_args__ = (
+        Index("ix_allocations_order_inventory", "order_id", "inventory_id"),
+        Index("ix_allocations_allocation_date", "allocation_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
@@ -133,9 +228,48 @@ class Allocation(Base):
     allocated_quantity = Column(Float, nullable=False)
     allocation_date = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     algorithm_version = Column(String(20), default="v1.0")
+    run_id = Column(Integer, ForeignKey("allocation_runs.id"), index=True)
     notes = Column(Text)
     
     # Relationships
     order = relationship("Order", back_populates="allocations")
     inventory = relationship("Inventory", back_populates="allocations")
+    run = relationship("AllocationRun", back_populates="allocations")
+
+
+class AllocationRun(Base):
+    __tablename__ = "allocation_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), default="running")  # running, completed, failed
+    
+    # Parameters
+    algorithm = Column(String(20), nullable=False)
+    algorithm_version = Column(String(20), nullable=False)
+    parallel = Column(Boolean, default=False)
+    recalculate_metrics = Column(Boolean, default=True)
+    order_ids = Column(Text)  # JSON list, null for all pending orders
+    
+    # Timing (seconds)
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+    load_seconds = Column(Float)
+    allocate_seconds = Column(Float)
+    flush_seconds = Column(Float)
+    
+    # Counts
+    retries = Column(Integer, default=0)
+    workers = Column(Integer)
+    orders_count = Column(Integer, default=0)
+    allocations_count = Column(Integer, default=0)
+    total_requested = Column(Float, default=0.0)
+    total_allocated = Column(Float, default=0.0)
+    metrics_refreshed = Column(Integer)  # customers whose metrics were recalculated
+    metrics_skipped = Column(Integer)  # customers whose metrics were already current
+    infeasible_items = Column(Integer)  # lp: items whose minimum shares exceed their stock
+    min_share_shortfall = Column(Float)  # lp: quantity of minimum shares left unfilled
+    error = Column(Text)
+    
+    # Relationships
+    allocations = relationship("Allocation", back_populates="run")
 
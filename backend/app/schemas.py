@@ -1,9 +1,10 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from datetime import datetime
-from typing import Optional, List
+import json
+from typing import Optional, List, Dict
 
 
 # Customer Schemas
@@ -61,11 +62,13 @@ class InventoryUpdate(BaseModel):
     available_quantity: Optional[float] = None
     reserved_quantity: Optional[float] = None
     unit: Optional[str] = None
+    version: Optional[int] = None  # If set, the update is rejected unless it matches the current version
 
 
 class Inventory(InventoryBase):
     id: int
     reserved_quantity: float
+    version: int
     created_at: datetime
     updated_at: Optional[datetime] = None
     
@@ -163,12 +166,73 @@ class CustomerMetric(BaseModel):
     average_days_to_payment: float
     overdue_count: int
     total_payments: int
+    payment_frequency_score_90d: Optional[float] = None
+    credit_period_score_90d: Optional[float] = None
+    overall_score_90d: Optional[float] = None
+    payment_frequency_score_180d: Optional[float] = None
+    credit_period_score_180d: Optional[float] = None
+    overall_score_180d: Optional[float] = None
+    payment_frequency_score_365d: Optional[float] = None
+    credit_period_score_365d: Optional[float] = None
+    overall_score_365d: Optional[float] = None
     last_calculated: datetime
     
     class Config:
         from_attributes = True
 
 
+class CustomerMetricSummary(CustomerMetric):
+    """Customer metrics with the customer's name and status, for list views"""
+    customer_name: str
+    customer_status: Optional[str] = None
+
+
+class CustomerMetricSnapshot(BaseModel):
+    recorded_at: datetime
+    granularity: str  # raw, week, month
+    overall_score: Optional[float] = None
+    performance_score: Optional[float] = None
+    payment_frequency_score: Optional[float] = None
+    credit_period_score: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    customer_id: int
+    customer_name: str
+    overall_score: float
+    performance_score: float
+    payment_frequency_score: float
+    credit_period_score: float
+
+
+class LeaderboardPage(BaseModel):
+    items: List[LeaderboardEntry]
+    # Keyset for the next page (pass as after_score / after_customer_id), null on the last page
+    next_after_score: Optional[float] = None
+    next_after_customer_id: Optional[int] = None
+
+
+# Dashboard Schemas
+class DashboardSummary(BaseModel):
+    customers: int
+    active_customers: int
+    inventory_items: int
+    orders: int
+    payments: int
+    allocations: int
+    orders_by_status: Dict[str, int]
+    pending_orders: int
+    total_available_quantity: float
+    total_reserved_quantity: float
+    overdue_payments: int
+    overdue_amount: float
+    generated_at: datetime  # When the totals were counted (they are cached briefly)
+
+
 # Allocation Schemas
 class AllocationResponse(BaseModel):
     id: int
@@ -177,16 +241,54 @@ class AllocationResponse(BaseModel):
     allocated_quantity: float
     allocation_date: datetime
     algorithm_version: str
+    run_id: Optional[int] = None
     inventory: Inventory
     
     class Config:
         from_attributes = True
 
 
+class AllocationRun(BaseModel):
+    id: int
+    status: str  # running, completed, failed
+    algorithm: str
+    algorithm_version: str
+    parallel: bool
+    recalculate_metrics: bool
+    order_ids: Optional[List[int]] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    load_seconds: Optional[float] = None
+    allocate_seconds: Optional[float] = None
+    flush_seconds: Optional[float] = None
+    retries: int = 0
+    workers: Optional[int] = None
+    orders_count: int = 0
+    allocations_count: int = 0
+    total_requested: float = 0.0
+    total_allocated: float = 0.0
+    metrics_refreshed: Optional[int] = None
+    metrics_skipped: Optional[int] = None
+    infeasible_items: Optional[int] = None
+    min_share_shortfall: Optional[float] = None
+    error: Optional[str] = None
+    
+    @field_validator('order_ids', mode='before')
+    @classmethod
+    def parse_order_ids(cls, value):
+        """order_ids is stored as a JSON list"""
+        return json.loads(value) if isinstance(value, str) else value
+    
+    class Config:
+        from_attributes = True
+
+
 # Allocation Request
 class AllocationRequest(BaseModel):
     order_ids: Optional[List[int]] = None  # If None, allocate all pending orders
     recalculate_metrics: bool = True
+    algorithm: str = "greedy"  # greedy (v1.0), vectorized or lp
+    parallel: bool = False  # Shard inventory items across worker processes
 
 
 class AllocationResult(BaseModel):
@@ -200,3 +302,54 @@ class AllocationResult(BaseModel):
     success: bool
     message: str
 
+
+# Allocation Jobs
+class AllocationJob(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed, failed
+    phase: str  # queued, recalculating_metrics, loading, allocating, persisting, exporting, completed
+    progress: float  # Fraction of phases completed (0-1)
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    stats: Optional[dict] = None
+    exports: Optional[dict] = None
+    results: Optional[List[AllocationResult]] = None
+
+
+# Allocation Simulation
+class SimulationConfig(BaseModel):
+    # Unset values fall back to the current settings
+    performance_weight: Optional[float] = None
+    payment_frequency_weight: Optional[float] = None
+    credit_period_weight: Optional[float] = None
+    min_allocation_percentage: Optional[float] = None
+    max_allocation_percentage: Optional[float] = None
+
+
+class SimulationRequest(BaseModel):
+    order_ids: Optional[List[int]] = None  # If None, simulate all pending orders
+    algorithm: str = "vectorized"
+    configs: List[SimulationConfig] = []
+    grid: Optional[Dict[str, List[float]]] = None  # Every combination of the listed values
+    include_customers: bool = True
+
+
+class SimulationCustomerShare(BaseModel):
+    customer_id: int
+    customer_name: str
+    priority: float
+    requested: float
+    allocated: float
+    share: float  # Percentage of all allocated stock
+    fill_rate: float  # Percentage of this customer's demand
+
+
+class SimulationResult(BaseModel):
+    config: SimulationConfig
+    total_available: float
+    total_requested: float
+    total_allocated: float
+    fill_rate: float
+    customers: List[SimulationCustomerShare] = []
@@ -0,0 +1,172 @@
+"""
+Service for running allocations as background jobs
+"""
+import threading
+import uuid
+from datetime import datetime
+from typing import List, Dict, Optional
+from app.database import SessionLocal
+from app.services.allocation_service import AllocationService
+from app.services.export_service import ExportService
+
+
+class AllocationJobConflict(Exception):
+    """Raised when an allocation job is submitted while another is still running"""
+
+    def __init__(self, active_job_id: str):
+        super().__init__(f"Allocation job {active_job_id} is already running")
+        self.active_job_id = active_job_id
+
+
+class AllocationJobService:
+    """Runs one allocation at a time in a background thread and tracks its progress"""
+
+    # Phases in the order a job moves through them
+    PHASES = [
+        "queued",
+        "recalculating_metrics",
+        "loading",
+        "allocating",
+        "persisting",
+        "exporting",
+        "completed",
+    ]
+
+    # Finished jobs kept in memory for polling
+    MAX_FINISHED_JOBS = 50
+
+    _jobs: Dict[str, Dict] = {}
+    _active_job_id: Optional[str] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def submit(
+        order_ids: List[int] = None,
+        recalculate_metrics: bool = True,
+        algorithm: str = "greedy",
+        parallel: bool = False
+    ) -> Dict:
+        """
+        Start an allocation job and return it immediately.
+        Raises AllocationJobConflict if another job is still running.
+        """
+        with AllocationJobService._lock:
+            if AllocationJobService._active_job_id is not None:
+                raise AllocationJobConflict(AllocationJobService._active_job_id)
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'status': "queued",
+                'phase': "queued",
+                'progress': 0.0,
+                'created_at': datetime.utcnow(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+                'stats': None,
+                'exports': None,
+                'results': None
+            }
+            AllocationJobService._jobs[job_id] = job
+            AllocationJobService._active_job_id = job_id
+            AllocationJobService._prune()
+
+        thread = threading.Thread(
+            target=AllocationJobService._run,
+            args=(job_id, order_ids, recalculate_metrics, algorithm, parallel),
+            name=f"allocation-job-{job_id}",
+            daemon=True
+        )
+        thread.start()
+        return AllocationJobService.get(job_id)
+
+    @staticmethod
+    def get(job_id: str) -> Optional[Dict]:
+        """Get a copy of a job's current state"""
+        with AllocationJobService._lock:
+            job = AllocationJobService._jobs.get(job_id)
+            return dict(job) if job else None
+
+    @staticmethod
+    def active_job_id() -> Optional[str]:
+        """Id of the job currently running, if any"""
+        with AllocationJobService._lock:
+            return AllocationJobService._active_job_id
+
+    @staticmethod
+    def _set_phase(job_id: str, phase: str):
+        """Record the phase a job has reached"""
+        with AllocationJobService._lock:
+            job = AllocationJobService._jobs[job_id]
+            job['phase'] = phase
+            job['progress'] = round(
+                AllocationJobService.PHASES.index(phase) / (len(AllocationJobService.PHASES) - 1), 2
+            )
+
+    @staticmethod
+    def _run(
+        job_id: str,
+        order_ids: List[int],
+        recalculate_metrics: bool,
+        algorithm: str,
+        parallel: bool
+    ):
+        """Run the allocation, then the CSV exports, in a dedicated session"""
+        with AllocationJobService._lock:
+            job = AllocationJobService._jobs[job_id]
+            job['status'] = "running"
+            job['started_at'] = datetime.utcnow()
+
+        db = SessionLocal()
+        try:
+            stats = {}
+            results = AllocationService.allocate_orders(
+                order_ids=order_ids,
+                db=db,
+                recalculate_metrics=recalculate_metrics,
+                algorithm=algorithm,
+                parallel=parallel,
+                stats=stats,
+                progress=lambda phase: AllocationJobService._set_phase(job_id, phase)
+            )
+
+            exports = None
+            if results:
+                AllocationJobService._set_phase(job_id, "exporting")
+                try:
+                    exports = ExportService.export_allocation_run(
+                        allocation_results=results,
+                        order_ids=order_ids,
+                        db=db,
+                        run_id=stats.get('run_id')
+                    )
+                except Exception as export_error:
+                    # Log error but don't fail the allocation
+                    print(f"Warning: CSV export failed: {export_error}")
+
+            AllocationJobService._set_phase(job_id, "completed")
+            with AllocationJobService._lock:
+                job['status'] = "completed"
+                job['stats'] = stats
+                job['exports'] = exports
+                job['results'] = results
+        except Exception as e:
+            with AllocationJobService._lock:
+                job['status'] = "failed"
+                job['error'] = str(e)
+        finally:
+            db.close()
+            with AllocationJobService._lock:
+                job['finished_at'] = datetime.utcnow()
+                AllocationJobService._active_job_id = None
+
+    @staticmethod
+    def _prune():
+        """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS (caller holds the lock)"""
+        finished = [
+            job_id for job_id, job in AllocationJobService._jobs.items()
+            if job['status'] in ("completed", "failed")
+        ]
+        for job_id in finished[:max(0, len(finished) - AllocationJobService.MAX_FINISHED_JOBS)]:
+            del AllocationJobService._jobs[job_id]
@@ -0,0 +1,282 @@
+"""
+Vectorized allocation kernel
+
+Applies the v1.0 two-pass allocation rules to every SKU at once. Demand is
+held in a SKU x customer matrix, so each pass is one loop over customers
+with array operations across all SKUs, instead of re-walking every order
+for every inventory item.
+
+Also hosts the v2.0 linear-programming engine (allocate_lp), which works on
+sparse SKU/customer pairs instead of the dense matrix.
+"""
+import numpy as np
+
+
+class AllocationKernel:
+    """Array implementation of the priority-weighted allocation algorithm"""
+
+    @staticmethod
+    def priority_rank(priorities: np.ndarray) -> np.ndarray:
+        """
+        Customer columns sorted by priority (descending).
+        Ties keep insertion order, matching sorted(..., reverse=True) in v1.0.
+        """
+        return np.argsort(-priorities, kind="stable")
+
+    @staticmethod
+    def demand_matrix(
+        line_sku: np.ndarray,
+        line_customer: np.ndarray,
+        line_requested: np.ndarray,
+        n_skus: int,
+        n_customers: int
+    ) -> np.ndarray:
+        """Build the SKU x customer demand matrix from order lines"""
+        demand = np.zeros((n_skus, n_customers))
+        # np.add.at accumulates in line order, same as summing orders/items in Python
+        np.add.at(demand, (line_sku, line_customer), line_requested)
+        return demand
+
+    @staticmethod
+    def allocate(
+        demand: np.ndarray,
+        available: np.ndarray,
+        priorities: np.ndarray,
+        min_percentage: float,
+        max_percentage: float
+    ):
+        """
+        Allocate stock to customers for all SKUs at once.
+
+        Returns (quantities, allocated): the quantity given to each customer
+        per SKU and a mask of the customers that received an allocation.
+        """
+        n_skus, n_customers = demand.shape
+        rank = AllocationKernel.priority_rank(priorities)
+        has_demand = demand > 0
+
+        quantities = np.zeros((n_skus, n_customers))
+        allocated = np.zeros((n_skus, n_customers), dtype=bool)
+        remaining = np.array(available, dtype=float)
+
+        # Total priority of customers with demand, summed in insertion order
+        total_priority = np.zeros(n_skus)
+        for c in range(n_customers):
+            total_priority = total_priority + np.where(has_demand[:, c], priorities[c], 0.0)
+
+        min_allocation = available * min_percentage
+        max_allocation = available * max_percentage
+
+        # First pass: priority-weighted share with min/max clamps
+        for c in rank:
+            priority = priorities[c]
+            if priority <= 0:
+                continue
+
+            active = has_demand[:, c] & (remaining > 0)
+            if not active.any():
+                continue
+
+            customer_demand = demand[:, c]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                priority_share = priority / total_priority
+
+            quantity = np.minimum(np.minimum(customer_demand, available * priority_share), remaining)
+            quantity = np.maximum(
+                min_allocation,
+                np.minimum(np.minimum(np.minimum(quantity, max_allocation), customer_demand), remaining)
+            )
+
+            take = active & (quantity > 0)
+            quantities[:, c] = np.where(take, quantity, 0.0)
+            allocated[:, c] = take
+            remaining = np.where(take, remaining - quantity, remaining)
+
+        # Second pass: distribute remaining stock by priority among allocated customers
+        allocated_priority = np.zeros(n_skus)
+        for c in rank:
+            allocated_priority = allocated_priority + np.where(allocated[:, c], priorities[c], 0.0)
+
+        for c in rank:
+            active = allocated[:, c] & (remaining > 0) & (allocated_priority > 0)
+            if not active.any():
+                continue
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                share = priorities[c] / allocated_priority
+
+            additional = np.minimum(remaining * share, demand[:, c] - quantities[:, c])
+            take = active & (additional > 0)
+            quantities[:, c] = np.where(take, quantities[:, c] + additional, quantities[:, c])
+            remaining = np.where(take, remaining - additional, remaining)
+
+        return quantities, allocated
+
+    @staticmethod
+    def line_order(
+        line_sku: np.ndarray,
+        line_customer: np.ndarray,
+        priorities: np.ndarray
+    ) -> np.ndarray:
+        """
+        Order in which v1.0 visits order lines: by SKU, then customer priority,
+        then the original order/item sequence.
+        """
+        position = np.empty(len(priorities), dtype=np.int64)
+        position[AllocationKernel.priority_rank(priorities)] = np.arange(len(priorities))
+        sequence = np.arange(len(line_sku))
+        return np.lexsort((sequence, position[line_customer], line_sku))
+
+    @staticmethod
+    def distribute(
+        line_sku: np.ndarray,
+        line_customer: np.ndarray,
+        line_requested: np.ndarray,
+        quantities: np.ndarray,
+        allocated: np.ndarray,
+        demand: np.ndarray,
+        available: np.ndarray,
+        priorities: np.ndarray
+    ):
+        """
+        Split each customer's allocation across their order lines in proportion
+        to the requested quantity, never exceeding the SKU's available stock.
+
+        Returns (line_allocated, sku_totals).
+        """
+        n_skus = demand.shape[0]
+        n_lines = len(line_sku)
+        line_allocated = np.zeros(n_lines)
+        sku_totals = np.zeros(n_skus)
+        if n_lines == 0:
+            return line_allocated, sku_totals
+
+        order = AllocationKernel.line_order(line_sku, line_customer, priorities)
+        sorted_sku = line_sku[order]
+
+        # Lay the lines out as SKU rows so the running stock cap is one column loop
+        counts = np.bincount(sorted_sku, minlength=n_skus)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        slot = np.arange(n_lines) - starts[sorted_sku]
+        width = int(counts.max())
+
+        line_index = np.full((n_skus, width), -1, dtype=np.int64)
+        line_index[sorted_sku, slot] = order
+
+        valid = line_index >= 0
+        index = np.where(valid, line_index, 0)
+        rows = np.arange(n_skus)[:, None]
+        customers = line_customer[index]
+        requested = line_requested[index]
+        eligible = valid & allocated[rows, customers]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target = np.minimum(
+                quantities[rows, customers] * (requested / demand[rows, customers]),
+                requested
+            )
+
+        for k in range(width):
+            quantity = np.minimum(target[:, k], available - sku_totals)
+            take = eligible[:, k] & (quantity > 0)
+            line_allocated[line_index[take, k]] = quantity[take]
+            sku_totals = np.where(take, sku_totals + quantity, sku_totals)
+
+        return line_allocated, sku_totals
+
+    @staticmethod
+    def allocate_lp(
+        line_sku: np.ndarray,
+        line_customer: np.ndarray,
+        line_requested: np.ndarray,
+        available: np.ndarray,
+        priorities: np.ndarray,
+        min_percentage: float,
+        max_percentage: float
+    ):
+        """
+        Optimization-based allocation for all SKUs in one batch.
+
+        For every SKU solves the linear program
+            maximize   sum(w_c * x_c)
+            subject to sum(x_c) <= available
+                       lo_c <= x_c <= hi_c
+        with w_c the customer's priority, lo_c the minimum share capped at the
+        customer's demand (0 for zero-priority customers) and hi_c the maximum
+        share capped at demand. The constraint matrix is a single-source
+        transportation network per SKU, whose optimum is reached by filling
+        lower bounds and then headroom in priority order. Zero-priority
+        customers rank last, so they only receive stock left over after
+        everyone else's headroom. That is computed in closed form with
+        per-SKU cumulative sums, so run time is O(lines log lines)
+        regardless of stock levels.
+
+        When the minimum shares of a SKU add up to more than its stock, the
+        program is infeasible; minimums are then filled in priority order
+        until stock runs out and the rest are left partial or empty.
+        Allocation runs record such SKUs and the unfilled quantity
+        (AllocationService._min_share_shortfall).
+
+        Returns (line_allocated, sku_totals).
+        """
+        n_skus = len(available)
+        n_customers = len(priorities)
+        n_lines = len(line_sku)
+        line_allocated = np.zeros(n_lines)
+        if n_lines == 0:
+            return line_allocated, np.zeros(n_skus)
+
+        # Aggregate demand per (SKU, customer) pair
+        pair_key, line_pair = np.unique(line_sku * n_customers + line_customer, return_inverse=True)
+        pair_demand = np.bincount(line_pair, weights=line_requested, minlength=len(pair_key))
+        pair_sku = pair_key // n_customers
+        pair_customer = pair_key % n_customers
+
+        # Visit pairs by SKU, then priority (descending, ties in insertion order)
+        position = np.empty(n_customers, dtype=np.int64)
+        position[AllocationKernel.priority_rank(priorities)] = np.arange(n_customers)
+        order = np.lexsort((position[pair_customer], pair_sku))
+        pair_sku = pair_sku[order]
+        pair_customer = pair_customer[order]
+        pair_demand = np.maximum(pair_demand[order], 0.0)
+
+        stock = np.maximum(available, 0.0)[pair_sku]
+        lower = np.where(
+            priorities[pair_customer] > 0,
+            np.minimum(stock * min_percentage, pair_demand),
+            0.0
+        )
+        upper = np.maximum(np.minimum(stock * max_percentage, pair_demand), lower)
+
+        # Running sums restart at every SKU, so a SKU's result doesn't depend on
+        # the magnitude of the SKUs before it (or on which SKUs share the batch)
+        segment_starts = np.flatnonzero(np.r_[True, pair_sku[1:] != pair_sku[:-1]])[1:]
+
+        def segment_exclusive_cumsum(values):
+            return np.concatenate([
+                np.cumsum(segment) - segment for segment in np.split(values, segment_starts)
+            ])
+
+        # Minimum shares first, in priority order while stock lasts
+        lower_filled = np.clip(stock - segment_exclusive_cumsum(lower), 0.0, lower)
+        remaining = np.maximum(available, 0.0) - np.bincount(pair_sku, weights=lower_filled, minlength=n_skus)
+
+        # Then headroom up to the maximum share, in priority order
+        headroom = upper - lower_filled
+        extra = np.clip(remaining[pair_sku] - segment_exclusive_cumsum(headroom), 0.0, headroom)
+        pair_allocated = lower_filled + extra
+
+        # Split each pair's allocation across its order lines by requested quantity
+        allocated_by_pair = np.zeros(len(pair_key))
+        demand_by_pair = np.zeros(len(pair_key))
+        allocated_by_pair[order] = pair_allocated
+        demand_by_pair[order] = pair_demand
+        with np.errstate(divide="ignore", invalid="ignore"):
+            line_allocated = np.where(
+                demand_by_pair[line_pair] > 0,
+                allocated_by_pair[line_pair] * (np.maximum(line_requested, 0.0) / demand_by_pair[line_pair]),
+                0.0
+            )
+
+        sku_totals = np.bincount(line_sku, weights=line_allocated, minlength=n_skus)
+        return line_allocated, sku_totals
@@ -2,14 +2,21 @@
 Service for allocating orders to customers based on multiple criteria
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, insert, update, bindparam
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Callable
 from app.models import (
-    Order, OrderItem, Inventory, Customer, CustomerMetric, Allocation
+    Order, OrderItem, Inventory, Customer, CustomerMetric, Allocation, AllocationRun
 )
 from app.services.metrics_service import MetricsService
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.allocation_kernel import AllocationKernel
+from app.services.allocation_snapshot import AllocationSnapshot
+from app.services.worker_pool import WorkerPool
+import numpy as np
+import json
 import sys
+import time
 from pathlib import Path
 
 # Add parent directory to path for config import
@@ -17,178 +24,568 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from config import settings
 
 
+class AllocationConflictError(Exception):
+    """Raised when stock or orders changed underneath an allocation run"""
+    pass
+
+
 class AllocationService:
     """Service to allocate orders based on customer performance and stock availability"""
     
+    # Allocation engines and the algorithm_version recorded on their allocations
+    ALGORITHMS = {
+        "greedy": "v1.0",
+        "vectorized": "v1.1-np",
+        "lp": "v2.0-lp",
+    }
+    
+    # Run stats copied onto the AllocationRun record
+    RUN_STATS = {
+        'load_seconds': 'load_seconds',
+        'allocate_seconds': 'allocate_seconds',
+        'flush_seconds': 'flush_seconds',
+        'retries': 'retries',
+        'workers': 'workers',
+        'orders': 'orders_count',
+        'allocations': 'allocations_count',
+        'total_requested': 'total_requested',
+        'total_allocated': 'total_allocated',
+        'metrics_refreshed': 'metrics_refreshed',
+        'metrics_skipped': 'metrics_skipped',
+        'infeasible_items': 'infeasible_items',
+        'min_share_shortfall': 'min_share_shortfall',
+    }
+    
     @staticmethod
-    def allocate_orders(order_ids: List[int] = None, db: Session = None, recalculate_metrics: bool = True) -> List[Dict]:
+    def allocate_orders(
+        order_ids: List[int] = None,
+        db: Session = None,
+        recalculate_metrics: bool = True,
+        algorithm: str = "greedy",
+        parallel: bool = False,
+        stats: Dict = None,
+        progress: Callable[[str], None] = None
+    ) -> List[Dict]:
         """
         Allocate orders to customers based on:
         - Customer performance (30%)
         - Payment frequency (25%)
         - Credit period adherence (25%)
         - Stock availability (20%)
+        
+        algorithm selects the engine: "greedy" walks each inventory item in turn,
+        "vectorized" applies the same rules to all inventory items at once and
+        "lp" solves the min/max share constraints as a linear program.
+        With parallel=True inventory items of large batches are sharded
+        across the shared worker pool (settings.allocation_workers shards)
+        and the results merged.
+        Each call is recorded as an AllocationRun whose id is stored on its
+        allocations. If a stats dict is passed it is filled with the run id
+        and per-run counts and timings.
+        progress, if given, is called with the name of each phase as it starts.
         """
+        if algorithm not in AllocationService.ALGORITHMS:
+            raise ValueError(f"Unknown allocation algorithm: {algorithm}")
+        
+        if stats is None:
+            stats = {}
+        if progress is None:
+            progress = lambda phase: None
+        
+        # Record the run up front so failed runs are kept in the ledger too
+        run_id = AllocationService._start_run(
+            db, algorithm, parallel, recalculate_metrics, order_ids
+        )
+        stats['run_id'] = run_id
+        try:
+            return AllocationService._run_allocation(
+                run_id, order_ids, db, recalculate_metrics, algorithm, parallel, stats, progress
+            )
+        except Exception as e:
+            db.rollback()
+            AllocationService._finish_run(run_id, "failed", stats, db, error=str(e))
+            raise
+    
+    @staticmethod
+    def _run_allocation(
+        run_id: int,
+        order_ids: List[int],
+        db: Session,
+        recalculate_metrics: bool,
+        algorithm: str,
+        parallel: bool,
+        stats: Dict,
+        progress: Callable[[str], None]
+    ) -> List[Dict]:
+        """Recalculate metrics, then load, allocate and persist (with retries)"""
         if recalculate_metrics:
-            # Recalculate all customer metrics
-            MetricsService.recalculate_all_metrics(db)
-        
-        # Get orders to allocate
-        if order_ids:
-            orders = db.query(Order).filter(
-                Order.id.in_(order_ids),
-                Order.status == "pending"
-            ).all()
-        else:
-            orders = db.query(Order).filter(Order.status == "pending").all()
-        
-        if not orders:
-            return []
-        
-        results = []
-        
-        # Group orders by customer
-        customer_orders = {}
-        for order in orders:
-            if order.customer_id not in customer_orders:
-                customer_orders[order.customer_id] = []
-            customer_orders[order.customer_id].append(order)
-        
-        # Get all inventory items needed
-        all_inventory_needed = {}
-        for order in orders:
-            for item in order.order_items:
-                inv_id = item.inventory_id
-                if inv_id not in all_inventory_needed:
-                    all_inventory_needed[inv_id] = {
-                        'total_requested': 0,
-                        'inventory': db.query(Inventory).filter(Inventory.id == inv_id).first()
-                    }
-                all_inventory_needed[inv_id]['total_requested'] += item.requested_quantity
+            # Recalculate metrics of customers that changed since their last
+            # calculation, plus the customers in this batch
+            progress("recalculating_metrics")
+            batch_customers = db.query(Order.customer_id).filter(Order.status == "pending")
+            if order_ids:
+                batch_customers = batch_customers.filter(Order.id.in_(order_ids))
+            refresh = MetricsService.refresh_stale_metrics(
+                db, [row.customer_id for row in batch_customers.distinct().all()]
+            )
+            stats['metrics_refreshed'] = refresh['refreshed']
+            stats['metrics_skipped'] = refresh['skipped']
         
-        # Allocate each inventory item
-        for inv_id, inv_data in all_inventory_needed.items():
-            inventory = inv_data['inventory']
-            if not inventory:
-                continue
+        # Stock is reserved optimistically: if another run or an inventory edit
+        # touched the same rows since they were loaded, reload and allocate again
+        for attempt in range(settings.allocation_max_retries + 1):
+            stats['retries'] = attempt
+            
+            # Load orders, order lines, inventory and priorities up front
+            progress("loading")
+            started = time.perf_counter()
+            snapshot = AllocationSnapshot.load(db, order_ids)
+            stats['load_seconds'] = time.perf_counter() - started
+            if not snapshot.orders:
+                AllocationService._finish_run(run_id, "completed", stats, db)
+                return []
+            
+            progress("allocating")
+            started = time.perf_counter()
+            if parallel:
+                allocations, inventory_totals, stats['workers'] = AllocationService._allocate_parallel(
+                    snapshot, algorithm
+                )
+            else:
+                allocations, inventory_totals = _allocate_shard(algorithm, snapshot)
+            if algorithm == "lp":
+                stats['infeasible_items'], stats['min_share_shortfall'] = AllocationService._min_share_shortfall(
+                    snapshot
+                )
             
-            total_requested = inv_data['total_requested']
-            available = inventory.available_quantity - inventory.reserved_quantity
+            # Process each order
+            allocated_by_item = {a['order_item_id']: a['quantity'] for a in allocations}
+            results = []
+            order_updates = []
+            for order in snapshot.orders:
+                result, order_update = AllocationService._process_order_allocation(
+                    order, snapshot, allocated_by_item
+                )
+                results.append(result)
+                order_updates.append(order_update)
+            stats['allocate_seconds'] = time.perf_counter() - started
             
+            stats['orders'] = len(results)
+            stats['allocations'] = len(allocations)
+            stats['total_requested'] = sum(r['total_requested'] for r in results)
+            stats['total_allocated'] = sum(r['total_allocated'] for r in results)
+            
+            progress("persisting")
+            try:
+                stats['flush_seconds'] = AllocationService._persist_allocations(
+                    allocations, inventory_totals, order_updates, snapshot,
+                    AllocationService.ALGORITHMS[algorithm], run_id, stats, db
+                )
+            except AllocationConflictError:
+                if attempt == settings.allocation_max_retries:
+                    raise
+                continue
+            
+            # Commit time is only known afterwards
+            AllocationService._update_run(run_id, {'flush_seconds': stats['flush_seconds']}, db)
+            return results
+    
+    @staticmethod
+    def _start_run(
+        db: Session,
+        algorithm: str,
+        parallel: bool,
+        recalculate_metrics: bool,
+        order_ids: List[int] = None
+    ) -> int:
+        """Create the AllocationRun record for a new run and return its id"""
+        run_id = db.execute(insert(AllocationRun).values(
+            status="running",
+            algorithm=algorithm,
+            algorithm_version=AllocationService.ALGORITHMS[algorithm],
+            parallel=parallel,
+            recalculate_metrics=recalculate_metrics,
+            order_ids=json.dumps(order_ids) if order_ids else None,
+            started_at=datetime.utcnow()
+        )).inserted_primary_key[0]
+        db.commit()
+        return run_id
+    
+    @staticmethod
+    def _run_values(status: str, stats: Dict, error: str = None) -> Dict:
+        """Column values recording a finished run"""
+        values = {
+            column: stats[key] for key, column in AllocationService.RUN_STATS.items() if key in stats
+        }
+        values.update(status=status, finished_at=datetime.utcnow(), error=error)
+        return values
+    
+    @staticmethod
+    def _update_run(run_id: int, values: Dict, db: Session):
+        """Update an AllocationRun record and commit"""
+        db.execute(
+            update(AllocationRun).where(AllocationRun.id == run_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    
+    @staticmethod
+    def _finish_run(run_id: int, status: str, stats: Dict, db: Session, error: str = None):
+        """Mark a run completed or failed outside the persistence transaction"""
+        AllocationService._update_run(run_id, AllocationService._run_values(status, stats, error), db)
+    
+    @staticmethod
+    def _allocate_lp(snapshot: AllocationSnapshot):
+        """
+        Allocate all inventory items at once as a linear program
+        Returns (allocations, inventory_totals)
+        """
+        inventory_ids = [inv_id for inv_id, available in snapshot.available.items() if available > 0]
+        if not inventory_ids:
+            return [], {}
+        
+        sku_index = {inv_id: i for i, inv_id in enumerate(inventory_ids)}
+        customer_index = {customer_id: i for i, customer_id in enumerate(snapshot.customer_ids)}
+        lines = [line for line in snapshot.lines if line['inventory_id'] in sku_index]
+        
+        line_sku = np.array([sku_index[line['inventory_id']] for line in lines], dtype=np.int64)
+        line_customer = np.array([customer_index[line['customer_id']] for line in lines], dtype=np.int64)
+        line_requested = np.array([line['requested_quantity'] for line in lines], dtype=float)
+        available = np.array([snapshot.available[inv_id] for inv_id in inventory_ids])
+        priorities = np.array(
+            [snapshot.priorities.get(cid, 0) for cid in snapshot.customer_ids], dtype=float
+        )
+        
+        line_allocated, sku_totals = AllocationKernel.allocate_lp(
+            line_sku, line_customer, line_requested, available, priorities,
+            snapshot.min_allocation_percentage,
+            snapshot.max_allocation_percentage
+        )
+        
+        allocations = []
+        for i in AllocationKernel.line_order(line_sku, line_customer, priorities):
+            if line_allocated[i] > 0:
+                allocations.append({
+                    'order_id': lines[i]['order_id'],
+                    'order_item_id': lines[i]['order_item_id'],
+                    'inventory_id': lines[i]['inventory_id'],
+                    'quantity': float(line_allocated[i])
+                })
+        
+        inventory_totals = {
+            inv_id: float(total) for inv_id, total in zip(inventory_ids, sku_totals)
+        }
+        return allocations, inventory_totals
+    
+    @staticmethod
+    def _min_share_shortfall(snapshot: AllocationSnapshot):
+        """
+        Inventory items whose minimum shares (as bounded by the lp engine)
+        add up to more than their stock, and the quantity of minimum shares
+        the lp engine therefore leaves unfilled.
+        Returns (infeasible_items, shortfall)
+        """
+        demand = {}
+        for line in snapshot.lines:
+            if snapshot.available.get(line['inventory_id'], 0) > 0 and snapshot.priorities.get(line['customer_id'], 0) > 0:
+                key = (line['inventory_id'], line['customer_id'])
+                demand[key] = demand.get(key, 0) + max(line['requested_quantity'], 0)
+        
+        minimums = {}
+        for (inv_id, customer_id), customer_demand in demand.items():
+            minimum = min(snapshot.available[inv_id] * snapshot.min_allocation_percentage, customer_demand)
+            minimums[inv_id] = minimums.get(inv_id, 0) + minimum
+        
+        shortfalls = [
+            minimum - snapshot.available[inv_id]
+            for inv_id, minimum in minimums.items()
+            if minimum > snapshot.available[inv_id] * (1 + 1e-9)
+        ]
+        return len(shortfalls), float(sum(shortfalls))
+    
+    @staticmethod
+    def _allocate_parallel(snapshot: AllocationSnapshot, algorithm: str):
+        """
+        Allocate shards of inventory items in the shared worker pool.
+        Customer priorities are fixed in the snapshot, so each inventory item
+        is allocated independently and the shards are simply merged.
+        Snapshots under settings.allocation_parallel_min_lines order lines
+        are allocated in-process.
+        Returns (allocations, inventory_totals, worker_count); worker_count
+        is 1 when the in-process path ran.
+        """
+        inventory_ids = [inv_id for inv_id, available in snapshot.available.items() if available > 0]
+        workers = min(settings.allocation_workers, WorkerPool.size(), len(inventory_ids))
+        if workers <= 1 or not WorkerPool.use_pool(len(snapshot.lines), settings.allocation_parallel_min_lines):
+            allocations, inventory_totals = _allocate_shard(algorithm, snapshot)
+            return allocations, inventory_totals, 1
+        
+        # Balance shards by order line count, largest inventory items first
+        line_counts = {}
+        for line in snapshot.lines:
+            line_counts[line['inventory_id']] = line_counts.get(line['inventory_id'], 0) + 1
+        shards = [[] for _ in range(workers)]
+        shard_lines = [0] * workers
+        for inv_id in sorted(inventory_ids, key=lambda i: line_counts.get(i, 0), reverse=True):
+            target = shard_lines.index(min(shard_lines))
+            shards[target].append(inv_id)
+            shard_lines[target] += line_counts.get(inv_id, 0)
+        
+        shard_results = WorkerPool.map(
+            _allocate_shard,
+            [algorithm] * workers,
+            [snapshot.subset(shard) for shard in shards]
+        )
+        
+        # Merge shards back in the snapshot's inventory order
+        allocations_by_inventory = {}
+        inventory_totals = {}
+        for shard_allocations, shard_totals in shard_results:
+            for a in shard_allocations:
+                allocations_by_inventory.setdefault(a['inventory_id'], []).append(a)
+            inventory_totals.update(shard_totals)
+        
+        allocations = []
+        for inv_id in snapshot.available:
+            allocations.extend(allocations_by_inventory.get(inv_id, []))
+        inventory_totals = {
+            inv_id: inventory_totals[inv_id] for inv_id in snapshot.available if inv_id in inventory_totals
+        }
+        return allocations, inventory_totals, workers
+    
+    @staticmethod
+    def _allocate_greedy(snapshot: AllocationSnapshot):
+        """
+        Allocate each inventory item in turn (v1.0 algorithm)
+        Returns (allocations, inventory_totals)
+        """
+        allocations = []
+        inventory_totals = {}
+        sku_lines = snapshot.sku_lines()
+        
+        for inv_id, available in snapshot.available.items():
             if available <= 0:
                 # No stock available
                 continue
             
-            # Get customer priorities for this inventory item
-            customer_priorities = AllocationService._calculate_customer_priorities(
-                customer_orders.keys(), db
-            )
+            customer_lines = sku_lines.get(inv_id, {})
+            
+            # Calculate total demand per customer for this inventory
+            customer_demands = {}
+            for customer_id, lines in customer_lines.items():
+                total_demand = 0
+                for line in lines:
+                    total_demand += line['requested_quantity']
+                if total_demand > 0:
+                    customer_demands[customer_id] = total_demand
             
             # Allocate stock to customers based on priority
             customer_allocations = AllocationService._allocate_inventory_to_customers(
-                inv_id, available, customer_priorities, customer_orders, db
+                available, snapshot.priorities, customer_demands,
+                snapshot.min_allocation_percentage, snapshot.max_allocation_percentage
             )
             
-            # Create allocation records for each order-item combination
+            # Distribute each customer's allocation across their order lines
             total_allocated = 0
             for customer_id, allocated_qty in [(a['customer_id'], a['quantity']) for a in customer_allocations]:
-                # Distribute allocation across orders for this customer
-                customer_orders_list = customer_orders.get(customer_id, [])
-                total_customer_demand = sum(
-                    item.requested_quantity 
-                    for order in customer_orders_list 
-                    for item in order.order_items 
-                    if item.inventory_id == inv_id
-                )
+                total_customer_demand = customer_demands[customer_id]
                 
-                if total_customer_demand > 0:
-                    for order in customer_orders_list:
-                        for item in order.order_items:
-                            if item.inventory_id == inv_id:
-                                # Calculate proportional allocation for this item
-                                item_share = item.requested_quantity / total_customer_demand
-                                item_allocated = min(
-                                    allocated_qty * item_share,
-                                    item.requested_quantity,
-                                    available - total_allocated
-                                )
-                                
-                                if item_allocated > 0:
-                                    # Create allocation record
-                                    allocation = Allocation(
-                                        order_id=order.id,
-                                        inventory_id=inv_id,
-                                        allocated_quantity=item_allocated,
-                                        allocation_date=datetime.utcnow(),
-                                        algorithm_version="v1.0"
-                                    )
-                                    db.add(allocation)
-                                    item.allocated_quantity = item_allocated
-                                    total_allocated += item_allocated
+                for line in customer_lines[customer_id]:
+                    # Calculate proportional allocation for this item
+                    item_share = line['requested_quantity'] / total_customer_demand
+                    item_allocated = min(
+                        allocated_qty * item_share,
+                        line['requested_quantity'],
+                        available - total_allocated
+                    )
+                    
+                    if item_allocated > 0:
+                        allocations.append({
+                            'order_id': line['order_id'],
+                            'order_item_id': line['order_item_id'],
+                            'inventory_id': inv_id,
+                            'quantity': item_allocated
+                        })
+                        total_allocated += item_allocated
             
-            # Update inventory
-            inventory.reserved_quantity += total_allocated
-            inventory.available_quantity -= total_allocated
+            inventory_totals[inv_id] = total_allocated
         
-        # Process each order
-        for order in orders:
-            result = AllocationService._process_order_allocation(order, db)
-            results.append(result)
+        return allocations, inventory_totals
+    
+    @staticmethod
+    def _allocate_vectorized(snapshot: AllocationSnapshot):
+        """
+        Allocate all inventory items at once using the array kernel
+        Returns (allocations, inventory_totals)
+        """
+        inventory_ids = [inv_id for inv_id, available in snapshot.available.items() if available > 0]
+        if not inventory_ids:
+            return [], {}
         
-        db.commit()
-        return results
+        sku_index = {inv_id: i for i, inv_id in enumerate(inventory_ids)}
+        customer_index = {customer_id: i for i, customer_id in enumerate(snapshot.customer_ids)}
+        lines = [line for line in snapshot.lines if line['inventory_id'] in sku_index]
+        
+        line_sku = np.array([sku_index[line['inventory_id']] for line in lines], dtype=np.int64)
+        line_customer = np.array([customer_index[line['customer_id']] for line in lines], dtype=np.int64)
+        line_requested = np.array([line['requested_quantity'] for line in lines], dtype=float)
+        
+        available = np.array([snapshot.available[inv_id] for inv_id in inventory_ids])
+        priorities = np.array(
+            [snapshot.priorities.get(cid, 0) for cid in snapshot.customer_ids], dtype=float
+        )
+        
+        demand = AllocationKernel.demand_matrix(
+            line_sku, line_customer, line_requested, len(inventory_ids), len(snapshot.customer_ids)
+        )
+        quantities, allocated = AllocationKernel.allocate(
+            demand, available, priorities,
+            snapshot.min_allocation_percentage,
+            snapshot.max_allocation_percentage
+        )
+        line_allocated, sku_totals = AllocationKernel.distribute(
+            line_sku, line_customer, line_requested,
+            quantities, allocated, demand, available, priorities
+        )
+        
+        # Keep allocations grouped by inventory item, as v1.0 produces them
+        allocations = []
+        for i in AllocationKernel.line_order(line_sku, line_customer, priorities):
+            if line_allocated[i] > 0:
+                allocations.append({
+                    'order_id': lines[i]['order_id'],
+                    'order_item_id': lines[i]['order_item_id'],
+                    'inventory_id': lines[i]['inventory_id'],
+                    'quantity': float(line_allocated[i])
+                })
+        
+        inventory_totals = {
+            inv_id: float(total) for inv_id, total in zip(inventory_ids, sku_totals)
+        }
+        return allocations, inventory_totals
     
     @staticmethod
-    def _calculate_customer_priorities(customer_ids: List[int], db: Session) -> Dict[int, float]:
-        """Calculate priority scores for customers"""
-        priorities = {}
-        
-        for customer_id in customer_ids:
-            metrics = db.query(CustomerMetric).filter(
-                CustomerMetric.customer_id == customer_id
-            ).first()
+    def _persist_allocations(
+        allocations: List[Dict],
+        inventory_totals: Dict[int, float],
+        order_updates: List[Dict],
+        snapshot: AllocationSnapshot,
+        algorithm_version: str,
+        run_id: int,
+        stats: Dict,
+        db: Session
+    ) -> float:
+        """
+        Write allocation records, order line quantities, order statuses and
+        inventory reservations as batched statements in a single transaction.
+        
+        Orders are only updated while still pending and stock is only reserved
+        while each inventory row still has the version read into the snapshot.
+        If any row changed the transaction is rolled back and
+        AllocationConflictError is raised. The run's record is completed in
+        the same transaction.
+        Returns the time taken to flush and commit, in seconds.
+        """
+        started = time.perf_counter()
+        allocation_date = datetime.utcnow()
+        
+        try:
+            # Running aggregates must exist before the orders they summarize change
+            MetricAggregateService.ensure(db, {order['customer_id'] for order in snapshot.orders})
             
-            if metrics:
-                # Use overall score as priority
-                priorities[customer_id] = metrics.overall_score
-            else:
-                # Calculate metrics if not available
-                try:
-                    metrics = MetricsService.calculate_all_metrics(customer_id, db)
-                    priorities[customer_id] = metrics.overall_score
-                except:
-                    priorities[customer_id] = 0.0
-        
-        # Normalize priorities (0-100 scale)
-        if priorities:
-            max_priority = max(priorities.values())
-            if max_priority > 0:
-                priorities = {k: (v / max_priority) * 100 for k, v in priorities.items()}
-        
-        return priorities
+            if order_updates:
+                order_table = Order.__table__
+                claimed = db.execute(
+                    update(order_table)
+                    .where(order_table.c.id == bindparam('order_id'))
+                    .where(order_table.c.status == "pending")
+                    .values(status=bindparam('new_status'), total_quantity=bindparam('new_total'))
+                    .execution_options(synchronize_session=False),
+                    [
+                        {'order_id': u['id'], 'new_status': u['status'], 'new_total': u['total_quantity']}
+                        for u in order_updates
+                    ]
+                ).rowcount
+                if claimed != len(order_updates):
+                    raise AllocationConflictError("Orders were allocated by another run")
+                
+                # Order totals change from requested to allocated quantity
+                previous_totals = {order['id']: order['total_quantity'] or 0 for order in snapshot.orders}
+                customer_by_order = {order['id']: order['customer_id'] for order in snapshot.orders}
+                order_value_deltas = {}
+                for u in order_updates:
+                    customer_id = customer_by_order[u['id']]
+                    delta = order_value_deltas.setdefault(customer_id, {'total_order_value': 0})
+                    delta['total_order_value'] += u['total_quantity'] - previous_totals[u['id']]
+                MetricAggregateService.apply_many(order_value_deltas, db)
+            
+            # Reserve stock as deltas, conditional on the version read into the snapshot
+            inventory_deltas = [
+                {
+                    'inventory_id': inv_id,
+                    'expected_version': snapshot.inventory[inv_id]['version'],
+                    'delta': total
+                }
+                for inv_id, total in inventory_totals.items()
+                if total > 0
+            ]
+            if inventory_deltas:
+                inventory_table = Inventory.__table__
+                reserved = db.execute(
+                    update(inventory_table)
+                    .where(inventory_table.c.id == bindparam('inventory_id'))
+                    .where(inventory_table.c.version == bindparam('expected_version'))
+                    .values(
+                        reserved_quantity=inventory_table.c.reserved_quantity + bindparam('delta'),
+                        available_quantity=inventory_table.c.available_quantity - bindparam('delta'),
+                        version=inventory_table.c.version + 1
+                    ),
+                    inventory_deltas
+                ).rowcount
+                if reserved != len(inventory_deltas):
+                    raise AllocationConflictError("Inventory changed during allocation")
+            
+            if allocations:
+                db.execute(insert(Allocation), [
+                    {
+                        'order_id': a['order_id'],
+                        'inventory_id': a['inventory_id'],
+                        'allocated_quantity': a['quantity'],
+                        'allocation_date': allocation_date,
+                        'algorithm_version': algorithm_version,
+                        'run_id': run_id
+                    }
+                    for a in allocations
+                ])
+                db.execute(update(OrderItem), [
+                    {'id': a['order_item_id'], 'allocated_quantity': a['quantity']}
+                    for a in allocations
+                ])
+            
+            db.execute(
+                update(AllocationRun).where(AllocationRun.id == run_id)
+                .values(**AllocationService._run_values("completed", stats))
+                .execution_options(synchronize_session=False)
+            )
+            
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        
+        return time.perf_counter() - started
     
     @staticmethod
     def _allocate_inventory_to_customers(
-        inventory_id: int,
         available_quantity: float,
         customer_priorities: Dict[int, float],
-        customer_orders: Dict[int, List[Order]],
-        db: Session
+        customer_demands: Dict[int, float],
+        min_allocation_percentage: float,
+        max_allocation_percentage: float
     ) -> List[Dict]:
         """Allocate inventory to customers based on priority and demand"""
         allocations = []
         
-        # Calculate total demand per customer for this inventory
-        customer_demands = {}
-        for customer_id, orders in customer_orders.items():
-            total_demand = 0
-            for order in orders:
-                for item in order.order_items:
-                    if item.inventory_id == inventory_id:
-                        total_demand += item.requested_quantity
-            if total_demand > 0:
-                customer_demands[customer_id] = total_demand
-        
         if not customer_demands:
             return allocations
         
@@ -226,8 +623,8 @@ class AllocationService:
                 allocated = min(demand, remaining_stock / len(customer_demands))
             
             # Apply min/max constraints
-            min_allocation = available_quantity * settings.min_allocation_percentage
-            max_allocation = available_quantity * settings.max_allocation_percentage
+            min_allocation = available_quantity * min_allocation_percentage
+            max_allocation = available_quantity * max_allocation_percentage
             
             allocated = max(min_allocation, min(allocated, max_allocation, demand, remaining_stock))
             
@@ -264,12 +661,19 @@ class AllocationService:
         return allocations
     
     @staticmethod
-    def _process_order_allocation(order: Order, db: Session) -> Dict:
-        """Process allocation for a single order"""
-        customer = db.query(Customer).filter(Customer.id == order.customer_id).first()
-        customer_name = customer.name if customer else "Unknown"
+    def _process_order_allocation(
+        order: Dict,
+        snapshot: AllocationSnapshot,
+        allocated_by_item: Dict[int, float]
+    ):
+        """
+        Process allocation for a single order
+        Returns (result, order_update) where order_update holds the new status
+        """
+        customer_name = snapshot.customer_names.get(order['customer_id'], "Unknown")
         
-        total_requested = sum(item.requested_quantity for item in order.order_items)
+        order_lines = snapshot.order_lines.get(order['id'], [])
+        total_requested = sum(line['requested_quantity'] for line in order_lines)
         total_allocated = 0
         allocation_items = []
         
@@ -277,59 +681,53 @@ class AllocationService:
         message = "Allocation completed"
         
         # Check each order item
-        for item in order.order_items:
-            inventory = db.query(Inventory).filter(Inventory.id == item.inventory_id).first()
+        for line in order_lines:
+            inventory = snapshot.inventory.get(line['inventory_id'])
             if not inventory:
                 continue
             
-            # Find allocation for this item
-            allocation = db.query(Allocation).filter(
-                Allocation.order_id == order.id,
-                Allocation.inventory_id == item.inventory_id
-            ).first()
+            allocated = allocated_by_item.get(line['order_item_id'])
             
-            if allocation:
-                item.allocated_quantity = allocation.allocated_quantity
-                total_allocated += allocation.allocated_quantity
+            if allocated:
+                total_allocated += allocated
                 allocation_items.append({
-                    'inventory_id': item.inventory_id,
-                    'product_code': inventory.product_code,
-                    'product_name': inventory.product_name,
-                    'requested': item.requested_quantity,
-                    'allocated': allocation.allocated_quantity
+                    'inventory_id': line['inventory_id'],
+                    'product_code': inventory['product_code'],
+                    'product_name': inventory['product_name'],
+                    'requested': line['requested_quantity'],
+                    'allocated': allocated
                 })
             else:
                 # No allocation found - might be insufficient stock
                 allocation_items.append({
-                    'inventory_id': item.inventory_id,
-                    'product_code': inventory.product_code if inventory else 'N/A',
-                    'product_name': inventory.product_name if inventory else 'N/A',
-                    'requested': item.requested_quantity,
+                    'inventory_id': line['inventory_id'],
+                    'product_code': inventory['product_code'],
+                    'product_name': inventory['product_name'],
+                    'requested': line['requested_quantity'],
                     'allocated': 0
                 })
-                if item.requested_quantity > 0:
+                if line['requested_quantity'] > 0:
                     success = False
                     message = "Partial allocation - insufficient stock for some items"
         
         # Update order status
         if total_allocated > 0:
             if total_allocated >= total_requested * 0.95:  # 95% threshold for "fulfilled"
-                order.status = "allocated"
+                status = "allocated"
             else:
-                order.status = "partially_allocated"
+                status = "partially_allocated"
         else:
-            order.status = "pending"
+            status = "pending"
             success = False
             message = "No allocation possible - insufficient stock"
         
-        order.total_quantity = total_allocated
-        db.commit()
+        order_update = {'id': order['id'], 'status': status, 'total_quantity': total_allocated}
         
         allocation_percentage = (total_allocated / total_requested * 100) if total_requested > 0 else 0
         
         return {
-            'order_id': order.id,
-            'customer_id': order.customer_id,
+            'order_id': order['id'],
+            'customer_id': order['customer_id'],
             'customer_name': customer_name,
             'total_requested': total_requested,
             'total_allocated': total_allocated,
@@ -337,7 +735,7 @@ class AllocationService:
             'items': allocation_items,
             'success': success,
             'message': message
-        }
+        }, order_update
     
     @staticmethod
     def create_allocations(
@@ -352,10 +750,21 @@ class AllocationService:
             inventory_id=inventory_id,
             allocated_quantity=quantity,
             allocation_date=datetime.utcnow(),
-            algorithm_version="v1.0"
+            algorithm_version=AllocationService.ALGORITHMS["greedy"]
         )
         db.add(allocation)
         db.commit()
         db.refresh(allocation)
         return allocation
 
+
+def _allocate_shard(algorithm: str, snapshot: AllocationSnapshot):
+    """
+    Run an allocation engine over a snapshot (or a shard of one).
+    Module-level so it can be sent to worker processes.
+    """
+    if algorithm == "vectorized":
+        return AllocationService._allocate_vectorized(snapshot)
+    if algorithm == "lp":
+        return AllocationService._allocate_lp(snapshot)
+    return AllocationService._allocate_greedy(snapshot)
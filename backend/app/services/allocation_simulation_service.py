@@ -0,0 +1,162 @@
+"""
+Service for what-if allocation simulations
+"""
+import copy
+import itertools
+from sqlalchemy.orm import Session
+from typing import List, Dict
+from app.services.allocation_service import AllocationService, _allocate_shard
+from app.services.allocation_snapshot import AllocationSnapshot
+from app.services.worker_pool import WorkerPool
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class AllocationSimulationService:
+    """
+    Evaluates allocation weight/constraint combinations in memory.
+    Inputs are loaded once and nothing is written to the database.
+    """
+
+    # Settings a simulation config may override
+    CONFIG_FIELDS = [
+        "performance_weight",
+        "payment_frequency_weight",
+        "credit_period_weight",
+        "min_allocation_percentage",
+        "max_allocation_percentage",
+    ]
+
+    @staticmethod
+    def expand_grid(grid: Dict[str, List[float]]) -> List[Dict]:
+        """Cartesian product of candidate values per setting"""
+        unknown = set(grid) - set(AllocationSimulationService.CONFIG_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown simulation settings: {', '.join(sorted(unknown))}")
+
+        fields = list(grid.keys())
+        return [dict(zip(fields, values)) for values in itertools.product(*grid.values())]
+
+    @staticmethod
+    def simulate(
+        configs: List[Dict],
+        db: Session,
+        order_ids: List[int] = None,
+        algorithm: str = "vectorized",
+        include_customers: bool = True
+    ) -> List[Dict]:
+        """
+        Run the allocation engine once per config against a single snapshot
+        of pending orders. Missing config values fall back to settings.
+        Customers without metrics are scored in memory the way a real run
+        would score them, without writing their metrics.
+        """
+        if algorithm not in AllocationService.ALGORITHMS:
+            raise ValueError(f"Unknown allocation algorithm: {algorithm}")
+
+        snapshot = AllocationSnapshot.load(db, order_ids, compute_missing_metrics=False)
+        configs = [AllocationSimulationService._resolve_config(config) for config in configs]
+
+        # Configs are evaluated in-process unless the grid is large enough to
+        # pay for shipping the snapshot to the shared worker pool
+        workers = min(WorkerPool.size(), len(configs))
+        if workers > 1 and WorkerPool.use_pool(
+            len(configs) * len(snapshot.lines), settings.simulation_parallel_min_lines
+        ):
+            chunks = [configs[i::workers] for i in range(workers)]
+            chunk_results = WorkerPool.map(
+                _simulate_configs,
+                [snapshot] * workers,
+                chunks,
+                [algorithm] * workers,
+                [include_customers] * workers
+            )
+            # Chunks interleave the configs; restore the requested order
+            results = [None] * len(configs)
+            for i, chunk in enumerate(chunk_results):
+                results[i::workers] = chunk
+            return results
+
+        return _simulate_configs(snapshot, configs, algorithm, include_customers)
+
+    @staticmethod
+    def _resolve_config(config: Dict) -> Dict:
+        """Fill unset values from settings"""
+        return {
+            field: config.get(field) if config.get(field) is not None else getattr(settings, field)
+            for field in AllocationSimulationService.CONFIG_FIELDS
+        }
+
+    @staticmethod
+    def evaluate(snapshot: AllocationSnapshot, config: Dict, algorithm: str, include_customers: bool) -> Dict:
+        """Allocate a snapshot under one config and summarize fill rates and shares"""
+        scenario = copy.copy(snapshot)
+        scenario.min_allocation_percentage = config['min_allocation_percentage']
+        scenario.max_allocation_percentage = config['max_allocation_percentage']
+
+        # Same weighted score as the priority column (MetricsService.priority_columns),
+        # from the snapshot's lifetime or rolling-window component scores
+        scenario.priorities = AllocationSnapshot.normalize_priorities({
+            customer_id: (
+                snapshot.scores.get(customer_id, {}).get('performance_score', 0.0) * config['performance_weight'] +
+                snapshot.scores.get(customer_id, {}).get('payment_frequency_score', 0.0) * config['payment_frequency_weight'] +
+                snapshot.scores.get(customer_id, {}).get('credit_period_score', 0.0) * config['credit_period_weight']
+            )
+            for customer_id in snapshot.customer_ids
+        })
+
+        allocations, inventory_totals = _allocate_shard(algorithm, scenario)
+
+        requested = {}
+        for line in snapshot.lines:
+            if line['inventory_id'] in snapshot.inventory:
+                requested[line['customer_id']] = requested.get(line['customer_id'], 0) + line['requested_quantity']
+
+        customer_by_order = {order['id']: order['customer_id'] for order in snapshot.orders}
+        allocated = {}
+        for a in allocations:
+            customer_id = customer_by_order[a['order_id']]
+            allocated[customer_id] = allocated.get(customer_id, 0) + a['quantity']
+
+        total_requested = sum(requested.values())
+        total_allocated = sum(inventory_totals.values())
+
+        customers = []
+        if include_customers:
+            for customer_id in snapshot.customer_ids:
+                customer_requested = requested.get(customer_id, 0)
+                customer_allocated = allocated.get(customer_id, 0)
+                customers.append({
+                    'customer_id': customer_id,
+                    'customer_name': snapshot.customer_names.get(customer_id, "Unknown"),
+                    'priority': round(scenario.priorities.get(customer_id, 0), 2),
+                    'requested': customer_requested,
+                    'allocated': customer_allocated,
+                    'share': round(customer_allocated / total_allocated * 100, 2) if total_allocated > 0 else 0,
+                    'fill_rate': round(customer_allocated / customer_requested * 100, 2) if customer_requested > 0 else 0
+                })
+            customers.sort(key=lambda c: c['allocated'], reverse=True)
+
+        return {
+            'config': config,
+            'total_available': sum(a for a in snapshot.available.values() if a > 0),
+            'total_requested': total_requested,
+            'total_allocated': total_allocated,
+            'fill_rate': round(total_allocated / total_requested * 100, 2) if total_requested > 0 else 0,
+            'customers': customers
+        }
+
+
+def _simulate_configs(snapshot: AllocationSnapshot, configs: List[Dict], algorithm: str, include_customers: bool) -> List[Dict]:
+    """
+    Evaluate configs against one snapshot, in order.
+    Module-level so it can be sent to worker processes.
+    """
+    return [
+        AllocationSimulationService.evaluate(snapshot, config, algorithm, include_customers)
+        for config in configs
+    ]
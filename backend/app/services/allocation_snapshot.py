@@ -0,0 +1,189 @@
+"""
+In-memory snapshot of the inputs to one allocation run
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from typing import List, Dict
+from app.models import Order, OrderItem, Inventory, Customer
+from app.services.metrics_service import MetricsService
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class AllocationSnapshot:
+    """
+    Pending orders, order lines, inventory and customer priorities for an
+    allocation run, loaded with a fixed number of set-based queries.
+
+    Everything is held as plain dicts, so allocation engines run purely in
+    memory and results are written back with bulk statements.
+    """
+
+    def __init__(self):
+        self.orders: List[Dict] = []  # Pending orders (id, customer_id, total_quantity), in query order
+        self.inventory: Dict[int, Dict] = {}  # inventory_id -> inventory row, in first-requested order
+        self.customer_ids: List[int] = []  # Customers in order of their first pending order
+        self.customer_names: Dict[int, str] = {}
+        self.priorities: Dict[int, float] = {}  # Normalized priority (0-100)
+        self.scores: Dict[int, Dict[str, float]] = {}  # Components of each customer's priority score
+        self.available: Dict[int, float] = {}  # Allocatable stock per inventory item
+        self.lines: List[Dict] = []  # Order lines grouped by customer, then order, then item
+        self.order_lines: Dict[int, List[Dict]] = {}  # order_id -> lines
+        self.min_allocation_percentage = settings.min_allocation_percentage
+        self.max_allocation_percentage = settings.max_allocation_percentage
+
+    @staticmethod
+    def load(
+        db: Session,
+        order_ids: List[int] = None,
+        compute_missing_metrics: bool = True
+    ) -> "AllocationSnapshot":
+        """
+        Load everything an allocation run needs.
+        With compute_missing_metrics=False metrics of customers without them
+        are computed in memory only, and nothing is written to the database.
+        """
+        snapshot = AllocationSnapshot()
+
+        order_filter = [Order.status == "pending"]
+        if order_ids:
+            order_filter.append(Order.id.in_(order_ids))
+        pending_order_ids = select(Order.id).where(*order_filter)
+        pending_customer_ids = select(Order.customer_id).where(*order_filter)
+
+        # Customer names in one query; scores come from the priority map, cached
+        # until metrics change. Missing metrics are calculated (and, for a
+        # run, committed) before anything else is read.
+        scores = {}
+        priority_scores = MetricsService.priority_scores(db)
+        priority_columns = MetricsService.priority_columns(settings.priority_score_window_days)
+        customer_rows = db.query(Customer.id, Customer.name).filter(
+            Customer.id.in_(pending_customer_ids)
+        ).all()
+
+        for row in customer_rows:
+            snapshot.customer_names[row.id] = row.name
+            cached = priority_scores.get(row.id, {})
+            component_scores = {
+                key: cached.get(key)
+                for key in ['overall_score', 'performance_score', 'payment_frequency_score', 'credit_period_score']
+            }
+            priority_score = cached.get('priority_score')
+            if component_scores['overall_score'] is None or priority_score is None:
+                component_scores = {key: component_scores[key] or 0.0 for key in component_scores}
+                priority_score = component_scores['overall_score'] if priority_score is None else priority_score
+                try:
+                    if compute_missing_metrics:
+                        metrics = MetricsService.calculate_all_metrics(row.id, db)
+                        column = lambda name: getattr(metrics, name)
+                    else:
+                        # Same scores, computed in memory and not written
+                        column = MetricsService.compute_customer_metrics(row.id, db).get
+                    component_scores = {
+                        key: column(priority_columns.get(key, key)) for key in component_scores
+                    }
+                    priority_score = column(priority_columns['priority_score'])
+                except Exception:
+                    pass
+            snapshot.scores[row.id] = component_scores
+            scores[row.id] = priority_score
+
+        snapshot.orders = [
+            {'id': order_id, 'customer_id': customer_id, 'total_quantity': total_quantity}
+            for order_id, customer_id, total_quantity in db.query(
+                Order.id, Order.customer_id, Order.total_quantity
+            ).filter(*order_filter).order_by(Order.id).all()
+        ]
+        if not snapshot.orders:
+            return snapshot
+
+        items = db.query(
+            OrderItem.id, OrderItem.order_id, OrderItem.inventory_id, OrderItem.requested_quantity
+        ).filter(
+            OrderItem.order_id.in_(pending_order_ids)
+        ).order_by(OrderItem.id).all()
+
+        inventory_rows = db.query(
+            Inventory.id, Inventory.product_code, Inventory.product_name,
+            Inventory.available_quantity, Inventory.reserved_quantity, Inventory.version
+        ).filter(
+            Inventory.id.in_(
+                select(OrderItem.inventory_id).where(OrderItem.order_id.in_(pending_order_ids))
+            )
+        ).all()
+        inventory_by_id = {row.id: dict(row._mapping) for row in inventory_rows}
+
+        items_by_order = {}
+        for item in items:
+            items_by_order.setdefault(item.order_id, []).append(item)
+
+        # Group orders by customer
+        customer_orders = {}
+        for order in snapshot.orders:
+            customer_orders.setdefault(order['customer_id'], []).append(order)
+            snapshot.order_lines[order['id']] = []
+            for item in items_by_order.get(order['id'], []):
+                inventory = inventory_by_id.get(item.inventory_id)
+                if inventory and item.inventory_id not in snapshot.inventory:
+                    snapshot.inventory[item.inventory_id] = inventory
+                    snapshot.available[item.inventory_id] = (
+                        inventory['available_quantity'] - inventory['reserved_quantity']
+                    )
+
+        snapshot.customer_ids = list(customer_orders.keys())
+        for customer_id, orders in customer_orders.items():
+            for order in orders:
+                for item in items_by_order.get(order['id'], []):
+                    line = {
+                        'order_item_id': item.id,
+                        'order_id': order['id'],
+                        'customer_id': customer_id,
+                        'inventory_id': item.inventory_id,
+                        'requested_quantity': item.requested_quantity
+                    }
+                    snapshot.lines.append(line)
+                    snapshot.order_lines[order['id']].append(line)
+
+        snapshot.priorities = AllocationSnapshot.normalize_priorities(
+            {customer_id: scores.get(customer_id, 0.0) for customer_id in snapshot.customer_ids}
+        )
+        return snapshot
+
+    @staticmethod
+    def normalize_priorities(scores: Dict[int, float]) -> Dict[int, float]:
+        """Normalize priorities (0-100 scale)"""
+        priorities = dict(scores)
+        if priorities:
+            max_priority = max(priorities.values())
+            if max_priority > 0:
+                priorities = {k: (v / max_priority) * 100 for k, v in priorities.items()}
+        return priorities
+
+    def sku_lines(self) -> Dict[int, Dict[int, List[Dict]]]:
+        """Order lines per inventory item and customer, in customer order"""
+        grouped = {}
+        for line in self.lines:
+            grouped.setdefault(line['inventory_id'], {}).setdefault(line['customer_id'], []).append(line)
+        return grouped
+
+    def subset(self, inventory_ids: List[int]) -> "AllocationSnapshot":
+        """
+        Snapshot restricted to some inventory items, for allocating a shard of
+        SKUs independently. Only the data the engines read is carried over.
+        """
+        inventory_ids = set(inventory_ids)
+        shard = AllocationSnapshot()
+        shard.customer_ids = list(self.customer_ids)
+        shard.priorities = dict(self.priorities)
+        shard.min_allocation_percentage = self.min_allocation_percentage
+        shard.max_allocation_percentage = self.max_allocation_percentage
+        shard.available = {
+            inv_id: available for inv_id, available in self.available.items()
+            if inv_id in inventory_ids
+        }
+        shard.lines = [line for line in self.lines if line['inventory_id'] in inventory_ids]
+        return shard
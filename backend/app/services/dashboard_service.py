@@ -0,0 +1,86 @@
+"""
+Service for the dashboard summary
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case
+from datetime import datetime
+from typing import Dict
+from app.models import Customer, Inventory, Order, Payment, Allocation
+import threading
+import time
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class DashboardService:
+    """
+    Totals for the dashboard cards: counts per entity, orders by status,
+    stock and overdue payments. The summary takes a few aggregate queries and
+    is cached in-process for settings.dashboard_summary_ttl_seconds, so
+    dashboard loads don't rescan the tables.
+    """
+
+    _cache: Dict = {'expires': 0.0, 'summary': None}
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def summary(db: Session, refresh: bool = False) -> Dict:
+        """The cached summary, recomputed when older than the TTL (or with refresh=True)"""
+        now = time.monotonic()
+        with DashboardService._cache_lock:
+            if not refresh and DashboardService._cache['summary'] is not None and now < DashboardService._cache['expires']:
+                return DashboardService._cache['summary']
+
+        summary = DashboardService.compute(db)
+        with DashboardService._cache_lock:
+            DashboardService._cache = {
+                'expires': now + settings.dashboard_summary_ttl_seconds,
+                'summary': summary
+            }
+        return summary
+
+    @staticmethod
+    def compute(db: Session) -> Dict:
+        """Compute the summary: one query per table"""
+        customers = db.query(
+            func.count(Customer.id).label('customers'),
+            func.coalesce(func.sum(case((Customer.status == "active", 1), else_=0)), 0).label('active_customers'),
+        ).one()
+
+        stock = db.query(
+            func.count(Inventory.id).label('inventory_items'),
+            func.coalesce(func.sum(Inventory.available_quantity), 0.0).label('total_available_quantity'),
+            func.coalesce(func.sum(Inventory.reserved_quantity), 0.0).label('total_reserved_quantity'),
+        ).one()
+
+        orders_by_status = {
+            status or "unknown": count
+            for status, count in db.query(Order.status, func.count(Order.id)).group_by(Order.status).all()
+        }
+
+        is_overdue = Payment.status == "overdue"
+        payments = db.query(
+            func.count(Payment.id).label('payments'),
+            func.coalesce(func.sum(case((is_overdue, 1), else_=0)), 0).label('overdue_payments'),
+            func.coalesce(func.sum(case((is_overdue, Payment.amount), else_=0.0)), 0.0).label('overdue_amount'),
+        ).one()
+
+        return {
+            'customers': customers.customers,
+            'active_customers': customers.active_customers,
+            'inventory_items': stock.inventory_items,
+            'orders': sum(orders_by_status.values()),
+            'payments': payments.payments,
+            'allocations': db.query(func.count(Allocation.id)).scalar(),
+            'orders_by_status': orders_by_status,
+            'pending_orders': orders_by_status.get("pending", 0),
+            'total_available_quantity': stock.total_available_quantity,
+            'total_reserved_quantity': stock.total_reserved_quantity,
+            'overdue_payments': payments.overdue_payments,
+            'overdue_amount': payments.overdue_amount,
+            'generated_at': datetime.utcnow(),
+        }
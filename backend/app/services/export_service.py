@@ -6,8 +6,8 @@ import os
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict
-from sqlalchemy.orm import Session
-from app.models import Allocation, Order, Customer, Inventory
+from sqlalchemy.orm import Session, joinedload
+from app.models import Allocation, AllocationRun, Order, Customer, Inventory
 
 class ExportService:
     """Service for exporting allocation data"""
@@ -23,11 +23,38 @@ class ExportService:
         ExportService.CSV_DIR.mkdir(parents=True, exist_ok=True)
         ExportService.PRINT_DIR.mkdir(parents=True, exist_ok=True)
     
+    @staticmethod
+    def get_run_allocations(
+        order_ids: List[int] = None,
+        run_id: int = None,
+        db: Session = None
+    ) -> List[Allocation]:
+        """
+        Allocations of one run, looked up by the indexed run_id.
+        Without a run_id the latest completed run is used; order_ids
+        narrows the result to those orders.
+        """
+        if run_id is None:
+            latest_run = db.query(AllocationRun.id).filter(
+                AllocationRun.status == "completed"
+            ).order_by(AllocationRun.id.desc()).first()
+            if not latest_run:
+                return []
+            run_id = latest_run.id
+        
+        query = db.query(Allocation).options(joinedload(Allocation.inventory)).filter(
+            Allocation.run_id == run_id
+        )
+        if order_ids:
+            query = query.filter(Allocation.order_id.in_(order_ids))
+        return query.order_by(Allocation.id).all()
+    
     @staticmethod
     def export_allocation_to_csv(
         allocation_results: List[Dict],
         order_ids: List[int] = None,
-        db: Session = None
+        db: Session = None,
+        run_id: int = None
     ) -> str:
         """
         Export allocation results to CSV file
@@ -45,21 +72,7 @@ class ExportService:
         filepath = ExportService.CSV_DIR / filename
         
         # Get detailed allocation data from database
-        if order_ids:
-            allocations = db.query(Allocation).filter(
-                Allocation.order_id.in_(order_ids)
-            ).order_by(Allocation.allocation_date.desc()).all()
-        else:
-            # Get latest allocations (from this run)
-            latest_date = db.query(Allocation).order_by(
-                Allocation.allocation_date.desc()
-            ).first()
-            if latest_date:
-                allocations = db.query(Allocation).filter(
-                    Allocation.allocation_date >= latest_date.allocation_date
-                ).all()
-            else:
-                allocations = []
+        allocations = ExportService.get_run_allocations(order_ids, run_id, db)
         
         # Write CSV file
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
@@ -168,31 +181,42 @@ class ExportService:
         
         return str(filepath)
     
+    @staticmethod
+    def export_allocation_run(
+        allocation_results: List[Dict],
+        order_ids: List[int] = None,
+        db: Session = None,
+        run_id: int = None
+    ) -> Dict[str, str]:
+        """
+        Export both the detailed and summary CSVs for an allocation run
+        Returns the file paths of the created CSVs
+        """
+        csv_path = ExportService.export_allocation_to_csv(
+            allocation_results=allocation_results,
+            order_ids=order_ids,
+            db=db,
+            run_id=run_id
+        )
+        summary_path = ExportService.export_allocation_summary_to_csv(
+            allocation_results=allocation_results,
+            db=db
+        )
+        return {'csv_path': csv_path, 'summary_path': summary_path}
+    
     @staticmethod
     def prepare_print_format_data(
         allocation_results: List[Dict],
         order_ids: List[int] = None,
-        db: Session = None
+        db: Session = None,
+        run_id: int = None
     ) -> Dict:
         """
         Prepare data for print format (to be implemented later)
         Returns structured data for print formatting
         """
         # Get allocations from database
-        if order_ids:
-            allocations = db.query(Allocation).filter(
-                Allocation.order_id.in_(order_ids)
-            ).order_by(Allocation.allocation_date.desc()).all()
-        else:
-            latest_date = db.query(Allocation).order_by(
-                Allocation.allocation_date.desc()
-            ).first()
-            if latest_date:
-                allocations = db.query(Allocation).filter(
-                    Allocation.allocation_date >= latest_date.allocation_date
-                ).all()
-            else:
-                allocations = []
+        allocations = ExportService.get_run_allocations(order_ids, run_id, db)
         
         # Group by order
         orders_data = {}
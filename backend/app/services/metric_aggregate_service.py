@@ -0,0 +1,446 @@
+"""
+Service for maintaining per-customer metric aggregates
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, or_, case, cast, select, insert, update, delete, bindparam, type_coerce, Integer, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+from typing import List, Dict, Iterable
+from app.models import Customer, Payment, Order, CustomerMetric, CustomerMetricAggregate, CustomerPaymentMonth
+
+
+class MetricAggregateService:
+    """
+    Keeps running payment and order totals per customer, so scores can be
+    derived without rescanning a customer's history.
+
+    Aggregates are built once from the payments and orders tables and then
+    updated by delta whenever a payment or order is inserted, updated or
+    deleted. Deltas are applied as atomic "column = column + delta"
+    statements in the caller's transaction.
+
+    Each row also carries a metrics_stale flag: applying a delta (or
+    marking the customer) sets it and bumps updated_at, recalculating the
+    customer's metrics clears it. Recalculations read without a lock, so
+    the flag is only cleared if updated_at is unchanged since they started
+    (see stale_versions and clear_stale). Customers without a row are
+    always stale.
+
+    Payment aggregates are also bucketed per customer and due-date month
+    (customer_payment_months), so rolling-window scores are summed from at
+    most a dozen buckets instead of rescanning payments.
+    """
+
+    # Aggregate columns, all additive
+    FIELDS = [
+        "total_payments",
+        "paid_count",
+        "on_time_count",
+        "paid_days",
+        "overdue_count",
+        "late_count",
+        "late_days",
+        "total_orders",
+        "fulfilled_orders",
+        "total_order_value",
+    ]
+
+    # Aggregate columns kept per monthly payment bucket
+    PAYMENT_FIELDS = FIELDS[:7]
+
+    # Rolling score windows in days
+    WINDOWS = [90, 180, 365]
+
+    @staticmethod
+    def empty() -> Dict:
+        """Aggregates of a customer with no payments or orders"""
+        return {field: 0 for field in MetricAggregateService.FIELDS}
+
+    @staticmethod
+    def payment_delta(payment: Payment) -> Dict:
+        """Contribution of one payment to its customer's aggregates"""
+        delta = MetricAggregateService.empty()
+        delta['total_payments'] = 1
+        days = (payment.payment_date - payment.due_date).days
+        late = payment.payment_date > payment.due_date
+
+        if payment.status == "paid":
+            delta['paid_count'] = 1
+            delta['on_time_count'] = 0 if late else 1
+            delta['paid_days'] = days
+        if payment.status == "overdue":
+            delta['overdue_count'] = 1
+        if late:
+            delta['late_count'] = 1
+            delta['late_days'] = days
+        return delta
+
+    @staticmethod
+    def order_delta(order: Order) -> Dict:
+        """Contribution of one order to its customer's aggregates"""
+        delta = MetricAggregateService.empty()
+        delta['total_orders'] = 1
+        delta['fulfilled_orders'] = 1 if order.status == "fulfilled" else 0
+        delta['total_order_value'] = order.total_quantity or 0
+        return delta
+
+    @staticmethod
+    def difference(new: Dict, old: Dict) -> Dict:
+        """Delta turning old contributions into new ones"""
+        return {field: new[field] - old[field] for field in MetricAggregateService.FIELDS}
+
+    @staticmethod
+    def ensure(db: Session, customer_ids: Iterable[int] = None) -> int:
+        """
+        Build aggregates from history for customers that have none yet
+        (all customers if customer_ids is None). Must run before the change
+        being recorded is flushed, or it would be counted twice.
+        Returns the number of customers built.
+        """
+        customer_query = db.query(Customer.id).filter(
+            ~Customer.id.in_(select(CustomerMetricAggregate.customer_id))
+        )
+        if customer_ids is not None:
+            customer_query = customer_query.filter(Customer.id.in_(list(customer_ids)))
+        missing = [row.id for row in customer_query.all()]
+        if not missing:
+            return 0
+
+        MetricAggregateService.store(
+            MetricAggregateService.aggregate_customer_stats(db, missing, active_only=False), db
+        )
+        MetricAggregateService.rebuild_months(db, missing)
+        return len(missing)
+
+    @staticmethod
+    def ensure_months(db: Session) -> int:
+        """
+        Build monthly payment buckets from history if there are none yet,
+        e.g. for a database whose running aggregates predate them.
+        Returns the number of buckets built.
+        """
+        if db.query(CustomerPaymentMonth.id).first() or not db.query(Payment.id).first():
+            return 0
+        return MetricAggregateService.rebuild_months(db)
+
+    @staticmethod
+    def apply(customer_id: int, delta: Dict, db: Session, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) a delta from a customer's aggregates"""
+        MetricAggregateService.apply_many({customer_id: delta}, db, sign)
+
+    @staticmethod
+    def apply_many(deltas: Dict[int, Dict], db: Session, sign: int = 1):
+        """Apply deltas for several customers as one statement batch"""
+        rows = []
+        for customer_id, delta in deltas.items():
+            row = {field: sign * delta.get(field, 0) for field in MetricAggregateService.FIELDS}
+            if not any(row.values()):
+                continue
+            row['customer_id'] = customer_id
+            row['metrics_stale'] = True
+            row['updated_at'] = datetime.utcnow()
+            rows.append(row)
+        if not rows:
+            return
+
+        table = CustomerMetricAggregate.__table__
+        statement = sqlite_insert(table)
+        set_ = {field: table.c[field] + statement.excluded[field] for field in MetricAggregateService.FIELDS}
+        set_['metrics_stale'] = True
+        set_['updated_at'] = statement.excluded.updated_at
+        db.execute(
+            statement.on_conflict_do_update(index_elements=[table.c.customer_id], set_=set_),
+            rows
+        )
+
+    @staticmethod
+    def payment_month(payment: Payment) -> str:
+        """Monthly bucket (YYYY-MM of the due date) a payment is counted in"""
+        return payment.due_date.strftime("%Y-%m")
+
+    @staticmethod
+    def apply_month(customer_id: int, month: str, delta: Dict, db: Session, sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) a payment delta from a customer's monthly bucket"""
+        row = {field: sign * delta.get(field, 0) for field in MetricAggregateService.PAYMENT_FIELDS}
+        if not any(row.values()):
+            return
+        row.update(customer_id=customer_id, month=month, updated_at=datetime.utcnow())
+
+        table = CustomerPaymentMonth.__table__
+        statement = sqlite_insert(table)
+        set_ = {field: table.c[field] + statement.excluded[field] for field in MetricAggregateService.PAYMENT_FIELDS}
+        set_['updated_at'] = statement.excluded.updated_at
+        db.execute(
+            statement.on_conflict_do_update(index_elements=[table.c.customer_id, table.c.month], set_=set_),
+            [row]
+        )
+
+    @staticmethod
+    def window_start_months(today: datetime = None) -> Dict[int, str]:
+        """First monthly bucket of each rolling window, e.g. 90 days -> the last 3 months"""
+        today = today or datetime.utcnow()
+        current = today.year * 12 + today.month - 1
+        starts = {}
+        for days in MetricAggregateService.WINDOWS:
+            first = current - max(1, round(days * 12 / 365)) + 1
+            starts[days] = f"{first // 12:04d}-{first % 12 + 1:02d}"
+        return starts
+
+    @staticmethod
+    def window_stats(customer_ids: List[int], db: Session, today: datetime = None) -> Dict[int, Dict[int, Dict]]:
+        """
+        Payment aggregates per customer and rolling window, summed from the
+        monthly buckets in one query.
+        Returns customer_id -> window days -> aggregates for every requested customer.
+        """
+        starts = MetricAggregateService.window_start_months(today)
+        stats = {
+            customer_id: {days: {field: 0 for field in MetricAggregateService.PAYMENT_FIELDS} for days in starts}
+            for customer_id in customer_ids
+        }
+        if not stats:
+            return stats
+
+        columns = [CustomerPaymentMonth.customer_id]
+        for days, start in starts.items():
+            for field in MetricAggregateService.PAYMENT_FIELDS:
+                columns.append(func.sum(
+                    case((CustomerPaymentMonth.month >= start, getattr(CustomerPaymentMonth, field)), else_=0)
+                ).label(f"{field}_{days}"))
+        rows = db.query(*columns).filter(
+            CustomerPaymentMonth.customer_id.in_(list(customer_ids)),
+            CustomerPaymentMonth.month >= min(starts.values())
+        ).group_by(CustomerPaymentMonth.customer_id).all()
+
+        for row in rows:
+            for days in starts:
+                stats[row.customer_id][days] = {
+                    field: row._mapping[f"{field}_{days}"] for field in MetricAggregateService.PAYMENT_FIELDS
+                }
+        return stats
+
+    @staticmethod
+    def rebuild_months(db: Session, customer_ids: List[int] = None) -> int:
+        """
+        Recompute monthly payment buckets from history (all customers if
+        customer_ids is None). The caller commits. Returns the number of buckets.
+        """
+        table = CustomerPaymentMonth.__table__
+        statement = delete(table)
+        if customer_ids is not None:
+            statement = statement.where(table.c.customer_id.in_(list(customer_ids)))
+        db.execute(statement)
+
+        month = func.strftime('%Y-%m', Payment.due_date)
+        query = db.query(
+            Payment.customer_id, month.label('month'), *MetricAggregateService._payment_aggregates()
+        )
+        if customer_ids is not None:
+            query = query.filter(Payment.customer_id.in_(list(customer_ids)))
+        updated_at = datetime.utcnow()
+        rows = [dict(row._mapping, updated_at=updated_at) for row in query.group_by(Payment.customer_id, month).all()]
+        if rows:
+            db.execute(insert(table), rows)
+        return len(rows)
+
+    @staticmethod
+    def store(stats: Dict[int, Dict], db: Session):
+        """Overwrite aggregates with freshly computed values, flagging the customers stale"""
+        if not stats:
+            return
+
+        updated_at = datetime.utcnow()
+        rows = [
+            dict(customer_stats, customer_id=customer_id, metrics_stale=True, updated_at=updated_at)
+            for customer_id, customer_stats in stats.items()
+        ]
+        table = CustomerMetricAggregate.__table__
+        statement = sqlite_insert(table)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.customer_id],
+                set_={
+                    column: statement.excluded[column]
+                    for column in MetricAggregateService.FIELDS + ['metrics_stale', 'updated_at']
+                }
+            ),
+            rows
+        )
+
+    @staticmethod
+    def mark_stale(customer_ids: Iterable[int], db: Session):
+        """Flag customers' metrics as needing recalculation"""
+        customer_ids = list(customer_ids)
+        if not customer_ids:
+            return
+        db.execute(
+            update(CustomerMetricAggregate.__table__)
+            .where(CustomerMetricAggregate.__table__.c.customer_id.in_(customer_ids))
+            .values(metrics_stale=True, updated_at=datetime.utcnow())
+        )
+
+    @staticmethod
+    def stale_versions(db: Session, customer_ids: Iterable[int] = None, active_only: bool = False) -> Dict[int, str]:
+        """
+        updated_at of customers flagged stale (all customers if customer_ids
+        is None), as stored. Read before recalculating and pass to clear_stale.
+        """
+        table = CustomerMetricAggregate.__table__
+        query = select(table.c.customer_id, type_coerce(table.c.updated_at, String)).where(
+            table.c.metrics_stale == True
+        )
+        if customer_ids is not None:
+            query = query.where(table.c.customer_id.in_(list(customer_ids)))
+        if active_only:
+            query = query.where(table.c.customer_id.in_(select(Customer.id).where(Customer.status == "active")))
+        return {customer_id: version for customer_id, version in db.execute(query).all()}
+
+    @staticmethod
+    def clear_stale(versions: Dict[int, str], db: Session):
+        """
+        Clear the stale flag of customers whose aggregates are unchanged since
+        versions were read (see stale_versions). A customer changed in
+        between keeps the flag and is recalculated by the next refresh.
+        """
+        if not versions:
+            return
+        table = CustomerMetricAggregate.__table__
+        db.execute(
+            update(table)
+            .where(
+                table.c.customer_id == bindparam('b_customer_id'),
+                type_coerce(table.c.updated_at, String).is_not_distinct_from(bindparam('b_version'))
+            )
+            .values(metrics_stale=False),
+            [{'b_customer_id': customer_id, 'b_version': version} for customer_id, version in versions.items()]
+        )
+
+    @staticmethod
+    def stale_customer_ids(db: Session, active_only: bool = True) -> List[int]:
+        """Customers whose metrics are stale, missing, or who have no aggregates yet"""
+        fresh = select(CustomerMetricAggregate.customer_id).where(
+            CustomerMetricAggregate.metrics_stale == False
+        )
+        has_metrics = select(CustomerMetric.customer_id)
+        query = db.query(Customer.id).filter(
+            or_(~Customer.id.in_(fresh), ~Customer.id.in_(has_metrics))
+        )
+        if active_only:
+            query = query.filter(Customer.status == "active")
+        return [row.id for row in query.all()]
+
+    @staticmethod
+    def load(customer_ids: List[int], db: Session) -> Dict[int, Dict]:
+        """Stored aggregates per customer"""
+        rows = db.query(CustomerMetricAggregate).filter(
+            CustomerMetricAggregate.customer_id.in_(customer_ids)
+        ).all()
+        return {
+            row.customer_id: {field: getattr(row, field) for field in MetricAggregateService.FIELDS}
+            for row in rows
+        }
+
+    @staticmethod
+    def rebuild(db: Session, customer_ids: List[int] = None) -> int:
+        """Recompute aggregates from history, e.g. after bulk imports that bypass the API"""
+        stats = MetricAggregateService.aggregate_customer_stats(db, customer_ids, active_only=False)
+        MetricAggregateService.store(stats, db)
+        MetricAggregateService.rebuild_months(db, customer_ids)
+        db.commit()
+        return len(stats)
+
+    @staticmethod
+    def _microseconds_between(later, earlier):
+        """
+        SQL expression for (later - earlier) in whole microseconds.
+        SQLite stores datetimes as text; seconds come from strftime('%s') and
+        the 6-digit fraction, when present, is read from the string so the
+        result is exact.
+        """
+        def microseconds(column):
+            return case(
+                (func.length(column) >= 26, cast(func.substr(column, 21, 6), Integer)),
+                else_=0
+            )
+
+        return (
+            (cast(func.strftime('%s', later), Integer) - cast(func.strftime('%s', earlier), Integer)) * 1000000
+            + microseconds(later) - microseconds(earlier)
+        )
+
+    @staticmethod
+    def _whole_days(microseconds):
+        """SQL expression for floor division of microseconds into days, like timedelta.days"""
+        day = 86400 * 1000000
+        return type_coerce(case(
+            (microseconds >= 0, microseconds // day),
+            else_=-((-microseconds + day - 1) // day)
+        ), Integer)
+
+    @staticmethod
+    def _payment_aggregates() -> List:
+        """Labelled SQL aggregates of PAYMENT_FIELDS over a group of payments"""
+        delay = MetricAggregateService._microseconds_between(Payment.payment_date, Payment.due_date)
+        days = MetricAggregateService._whole_days(delay)
+        is_paid = Payment.status == "paid"
+        return [
+            func.count(Payment.id).label('total_payments'),
+            func.sum(case((is_paid, 1), else_=0)).label('paid_count'),
+            func.sum(case((and_(is_paid, delay <= 0), 1), else_=0)).label('on_time_count'),
+            func.sum(case((is_paid, days), else_=0)).label('paid_days'),
+            func.sum(case((Payment.status == "overdue", 1), else_=0)).label('overdue_count'),
+            func.sum(case((delay > 0, 1), else_=0)).label('late_count'),
+            func.sum(case((delay > 0, days), else_=0)).label('late_days')
+        ]
+
+    @staticmethod
+    def aggregate_customer_stats(
+        db: Session,
+        customer_ids: List[int] = None,
+        active_only: bool = True
+    ) -> Dict[int, Dict]:
+        """
+        Per-customer payment and order aggregates, computed with one GROUP BY
+        query over payments and one over orders.
+        Returns customer_id -> aggregates for every requested customer.
+        """
+        customer_filter = []
+        if active_only:
+            customer_filter.append(Customer.status == "active")
+        if customer_ids is not None:
+            customer_filter.append(Customer.id.in_(customer_ids))
+        selected_customer_ids = select(Customer.id).where(*customer_filter)
+
+        stats = {
+            row.id: MetricAggregateService.empty()
+            for row in db.execute(selected_customer_ids).all()
+        }
+        if not stats:
+            return stats
+
+        payment_rows = db.query(
+            Payment.customer_id, *MetricAggregateService._payment_aggregates()
+        ).filter(
+            Payment.customer_id.in_(selected_customer_ids)
+        ).group_by(Payment.customer_id).all()
+
+        for row in payment_rows:
+            stats[row.customer_id].update(
+                {key: value for key, value in row._mapping.items() if key != 'customer_id'}
+            )
+
+        order_rows = db.query(
+            Order.customer_id,
+            func.count(Order.id).label('total_orders'),
+            func.sum(case((Order.status == "fulfilled", 1), else_=0)).label('fulfilled_orders'),
+            func.coalesce(func.sum(Order.total_quantity), 0).label('total_order_value')
+        ).filter(
+            Order.customer_id.in_(selected_customer_ids)
+        ).group_by(Order.customer_id).all()
+
+        for row in order_rows:
+            stats[row.customer_id].update(
+                {key: value for key, value in row._mapping.items() if key != 'customer_id'}
+            )
+
+        return stats
@@ -0,0 +1,108 @@
+"""
+Service for customer metric snapshot history
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, insert, update, delete
+from datetime import datetime, timedelta
+from typing import List, Dict
+from app.models import CustomerMetricSnapshot
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class MetricSnapshotService:
+    """
+    Appends a compact score snapshot per customer whenever metrics are
+    recalculated, and compacts old history: snapshots older than
+    settings.metric_snapshot_raw_days keep the last one per week, and older
+    than settings.metric_snapshot_weekly_days the last one per month.
+    """
+
+    # Score columns copied from customer_metrics rows
+    FIELDS = ["overall_score", "performance_score", "payment_frequency_score", "credit_period_score"]
+
+    # Compaction levels: granularity -> SQLite date() modifiers mapping a
+    # timestamp to the first day of its period. Weeks start on Monday and
+    # are not split at the year boundary.
+    PERIODS = {"week": ("weekday 0", "-6 days"), "month": ("start of month",)}
+
+    @staticmethod
+    def append(rows: List[Dict], db: Session):
+        """Append snapshots for customer_metrics rows as one statement batch. The caller commits."""
+        if not rows:
+            return
+        recorded_at = datetime.utcnow()
+        db.execute(insert(CustomerMetricSnapshot.__table__), [
+            dict(
+                {field: row.get(field) for field in MetricSnapshotService.FIELDS},
+                customer_id=row['customer_id'],
+                recorded_at=row.get('last_calculated') or recorded_at,
+                granularity="raw"
+            )
+            for row in rows
+        ])
+
+    @staticmethod
+    def history(
+        customer_id: int,
+        db: Session,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = 1000
+    ) -> List[CustomerMetricSnapshot]:
+        """A customer's snapshots in time order, served by the (customer_id, recorded_at) index"""
+        query = db.query(CustomerMetricSnapshot).filter(CustomerMetricSnapshot.customer_id == customer_id)
+        if start:
+            query = query.filter(CustomerMetricSnapshot.recorded_at >= start)
+        if end:
+            query = query.filter(CustomerMetricSnapshot.recorded_at <= end)
+        return query.order_by(CustomerMetricSnapshot.recorded_at).limit(limit).all()
+
+    @staticmethod
+    def compact(db: Session, now: datetime = None) -> Dict[str, int]:
+        """
+        Downsample old snapshots and commit.
+        Returns the number of snapshots removed at each granularity.
+        """
+        now = now or datetime.utcnow()
+        month_cutoff = now - timedelta(days=settings.metric_snapshot_weekly_days)
+        week_cutoff = now - timedelta(days=settings.metric_snapshot_raw_days)
+
+        # Months first: a week spanning a month end must not remove the
+        # month's last snapshot before the monthly pass keeps it
+        removed_monthly = MetricSnapshotService._downsample(
+            db, None, month_cutoff, "month", MetricSnapshotService.PERIODS["month"]
+        )
+        removed_weekly = MetricSnapshotService._downsample(
+            db, month_cutoff, week_cutoff, "week", MetricSnapshotService.PERIODS["week"]
+        )
+        db.commit()
+        return {"week": removed_weekly, "month": removed_monthly}
+
+    @staticmethod
+    def _downsample(db: Session, start: datetime, cutoff: datetime, granularity: str, period_modifiers: tuple) -> int:
+        """Keep the last snapshot per customer and period among those recorded from start (if given) to cutoff"""
+        table = CustomerMetricSnapshot.__table__
+        recorded = [table.c.recorded_at < cutoff]
+        if start is not None:
+            recorded.append(table.c.recorded_at >= start)
+        period = func.date(table.c.recorded_at, *period_modifiers)
+        ranked = select(
+            table.c.id,
+            func.row_number().over(
+                partition_by=[table.c.customer_id, period],
+                order_by=[table.c.recorded_at.desc(), table.c.id.desc()]
+            ).label('position')
+        ).where(*recorded).subquery()
+
+        removed = db.execute(
+            delete(table).where(table.c.id.in_(select(ranked.c.id).where(ranked.c.position > 1)))
+        ).rowcount
+        db.execute(
+            update(table).where(*recorded).values(granularity=granularity)
+        )
+        return removed
@@ -0,0 +1,161 @@
+"""
+Background scheduler for refreshing stale customer metrics
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Dict, Optional, Set
+from app.database import SessionLocal
+from app.services.metrics_service import MetricsService
+from app.services.metric_snapshot_service import MetricSnapshotService
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class MetricsRefreshScheduler:
+    """
+    Refreshes stale metrics in a background thread, so request handlers only
+    enqueue the customers they changed instead of recalculating inline.
+
+    The thread wakes when customers are enqueued, waits
+    settings.metrics_refresh_debounce_seconds so a burst of changes is
+    coalesced into one refresh, then refreshes all stale customers. It also
+    runs every settings.metrics_refresh_interval_seconds, retrying customers
+    left stale by a failed refresh. Rows written directly to the database
+    bypass the running aggregates; rebuild them with
+    MetricAggregateService.rebuild instead.
+
+    After a refresh, the thread also compacts metric snapshot history when
+    settings.metric_snapshot_compaction_interval_hours have passed since the
+    last compaction (and on its first run).
+    """
+
+    _pending: Set[int] = set()
+    _lock = threading.Lock()
+    _wake = threading.Event()
+    _stop = threading.Event()
+    _thread: Optional[threading.Thread] = None
+    _status: Dict = {
+        'running': False,
+        'last_run_at': None,
+        'last_refreshed': 0,
+        'last_skipped': 0,
+        'last_error': None,
+        'runs': 0,
+        'last_compacted_at': None,
+        'last_compaction_removed': None,
+    }
+    _next_compaction: Optional[float] = None  # time.monotonic() deadline; None compacts on the next run
+
+    @staticmethod
+    def start():
+        """Start the scheduler thread (no-op if disabled or already running)"""
+        if not settings.metrics_refresh_enabled:
+            return
+        with MetricsRefreshScheduler._lock:
+            if MetricsRefreshScheduler._thread is not None:
+                return
+            MetricsRefreshScheduler._stop.clear()
+            MetricsRefreshScheduler._thread = threading.Thread(
+                target=MetricsRefreshScheduler._run,
+                name="metrics-refresh",
+                daemon=True
+            )
+            MetricsRefreshScheduler._status['running'] = True
+            MetricsRefreshScheduler._thread.start()
+
+    @staticmethod
+    def stop(timeout: float = 10.0):
+        """Stop the scheduler thread, letting a refresh in progress finish"""
+        with MetricsRefreshScheduler._lock:
+            thread = MetricsRefreshScheduler._thread
+            MetricsRefreshScheduler._thread = None
+        if thread is None:
+            return
+        MetricsRefreshScheduler._stop.set()
+        MetricsRefreshScheduler._wake.set()
+        thread.join(timeout)
+        MetricsRefreshScheduler._status['running'] = False
+
+    @staticmethod
+    def enqueue(customer_ids: Iterable[int]):
+        """Schedule customers' metrics for refresh. Call after committing the change."""
+        with MetricsRefreshScheduler._lock:
+            MetricsRefreshScheduler._pending.update(customer_ids)
+        MetricsRefreshScheduler._wake.set()
+
+    @staticmethod
+    def status() -> Dict:
+        """Scheduler state and the outcome of its last refresh"""
+        with MetricsRefreshScheduler._lock:
+            return dict(MetricsRefreshScheduler._status, pending=len(MetricsRefreshScheduler._pending))
+
+    @staticmethod
+    def _run():
+        """Wait for enqueued customers or the interval, then refresh"""
+        while not MetricsRefreshScheduler._stop.is_set():
+            woken = MetricsRefreshScheduler._wake.wait(settings.metrics_refresh_interval_seconds)
+            if MetricsRefreshScheduler._stop.is_set():
+                break
+            if woken:
+                # Coalesce a burst of changes into one refresh
+                MetricsRefreshScheduler._stop.wait(settings.metrics_refresh_debounce_seconds)
+            MetricsRefreshScheduler._wake.clear()
+
+            with MetricsRefreshScheduler._lock:
+                customer_ids = sorted(MetricsRefreshScheduler._pending)
+                MetricsRefreshScheduler._pending = set()
+            MetricsRefreshScheduler._refresh(customer_ids)
+            MetricsRefreshScheduler._compact_if_due()
+
+    @staticmethod
+    def _refresh(customer_ids):
+        """Refresh stale customers (including the enqueued ones) from their running aggregates, in a dedicated session"""
+        db = SessionLocal()
+        try:
+            result = MetricsService.refresh_stale_metrics(db, customer_ids)
+            with MetricsRefreshScheduler._lock:
+                MetricsRefreshScheduler._status.update(
+                    last_refreshed=result['refreshed'],
+                    last_skipped=result['skipped'],
+                    last_error=None
+                )
+        except Exception as e:
+            db.rollback()
+            print(f"Error refreshing metrics: {e}")
+            with MetricsRefreshScheduler._lock:
+                MetricsRefreshScheduler._status['last_error'] = str(e)
+                # Retry these customers on the next run
+                MetricsRefreshScheduler._pending.update(customer_ids)
+        finally:
+            db.close()
+            with MetricsRefreshScheduler._lock:
+                MetricsRefreshScheduler._status['last_run_at'] = datetime.utcnow()
+                MetricsRefreshScheduler._status['runs'] += 1
+
+    @staticmethod
+    def _compact_if_due():
+        """Compact metric snapshot history if the compaction interval has passed"""
+        now = time.monotonic()
+        deadline = MetricsRefreshScheduler._next_compaction
+        if deadline is not None and now < deadline:
+            return
+        MetricsRefreshScheduler._next_compaction = now + settings.metric_snapshot_compaction_interval_hours * 3600
+
+        db = SessionLocal()
+        try:
+            removed = MetricSnapshotService.compact(db)
+            with MetricsRefreshScheduler._lock:
+                MetricsRefreshScheduler._status.update(
+                    last_compacted_at=datetime.utcnow(),
+                    last_compaction_removed=removed
+                )
+        except Exception as e:
+            db.rollback()
+            print(f"Error compacting metric snapshots: {e}")
+        finally:
+            db.close()
@@ -3,9 +3,16 @@ Service for calculating customer performance metrics
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import threading
 from datetime import datetime, timedelta
-from typing import List
-from app.models import Customer, Payment, Order, CustomerMetric
+from typing import List, Dict
+from app.models import Customer, Payment, Order, CustomerMetric, MetricsVersion
+from app.database import SessionLocal
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metrics_engine import MetricsEngine
+from app.services.metric_snapshot_service import MetricSnapshotService
+from app.services.worker_pool import WorkerPool
 import sys
 from pathlib import Path
 
@@ -17,6 +24,107 @@ from config import settings
 class MetricsService:
     """Service to calculate and update customer metrics"""
     
+    # Progress of the current (or last) parallel recalculation, for polling
+    _progress: Dict = {'status': "idle"}
+    
+    # Priority scores of all customers with metrics, reused until the metrics version changes
+    _priority_cache: Dict = {'key': None, 'scores': {}}
+    _priority_cache_lock = threading.Lock()
+    
+    @staticmethod
+    def payment_frequency_score(paid_count: int, on_time_count: int, total_days: int) -> float:
+        """
+        Payment frequency score (0-100) from a customer's paid payments:
+        how many there are, how many were on time and the sum of their
+        whole days from due date to payment
+        """
+        if paid_count == 0:
+            return 0.0
+        
+        on_time_percentage = (on_time_count / paid_count) * 100 if paid_count > 0 else 0
+        avg_days = total_days / paid_count if paid_count > 0 else 0
+        
+        # Score based on on-time percentage and average days
+        # On-time percentage contributes 70%, average days contributes 30%
+        on_time_score = on_time_percentage * 0.7
+        days_score = max(0, 100 - abs(avg_days) * 2) * 0.3  # Penalize late payments
+        
+        return min(100, max(0, on_time_score + days_score))
+    
+    @staticmethod
+    def credit_period_score(
+        total_payments: int,
+        overdue_count: int,
+        late_count: int,
+        late_days: int
+    ) -> float:
+        """
+        Credit period adherence score (0-100) from a customer's payment count,
+        overdue-status count, and the count and total whole days overdue of
+        payments made after their due date
+        """
+        if total_payments == 0:
+            return 50.0  # Neutral score if no payment history
+        
+        overdue_percentage = (overdue_count / total_payments) * 100 if total_payments > 0 else 0
+        
+        # Calculate average days over due date
+        avg_overdue_days = late_days / late_count if late_count else 0
+        
+        # Score decreases with overdue percentage and days
+        base_score = 100 - (overdue_percentage * 0.6)
+        days_penalty = min(30, avg_overdue_days * 0.5)  # Max 30 point penalty
+        
+        return max(0, min(100, base_score - days_penalty))
+    
+    @staticmethod
+    def performance_score(total_orders: int, fulfilled_orders: int, total_value: float) -> float:
+        """Performance score (0-100) from a customer's order count, fulfilled count and total quantity"""
+        if total_orders == 0:
+            return 0.0
+        
+        fulfillment_rate = (fulfilled_orders / total_orders) * 100 if total_orders > 0 else 0
+        
+        # Score based on:
+        # - Number of orders (30%)
+        # - Fulfillment rate (40%)
+        # - Order value consistency (30%)
+        order_count_score = min(100, (total_orders / 10) * 100) * 0.3  # Normalize to 10 orders = 100
+        fulfillment_score = fulfillment_rate * 0.4
+        value_score = min(100, (total_value / 1000) * 100) * 0.3  # Normalize to 1000 units = 100
+        
+        return min(100, max(0, order_count_score + fulfillment_score + value_score))
+    
+    @staticmethod
+    def overall_score(performance_score: float, payment_freq_score: float, credit_period_score: float) -> float:
+        """Calculate weighted overall score"""
+        return (
+            performance_score * settings.performance_weight +
+            payment_freq_score * settings.payment_frequency_weight +
+            credit_period_score * settings.credit_period_weight
+        )
+    
+    @staticmethod
+    def window_metrics(window_stats: Dict[int, Dict], performance_score: float) -> Dict:
+        """
+        Rolling-window score columns from a customer's per-window payment
+        aggregates. Performance has no window and uses the lifetime score.
+        """
+        values = {}
+        for days, stats in window_stats.items():
+            payment_freq_score = MetricsService.payment_frequency_score(
+                stats['paid_count'], stats['on_time_count'], stats['paid_days']
+            )
+            credit_period_score = MetricsService.credit_period_score(
+                stats['total_payments'], stats['overdue_count'], stats['late_count'], stats['late_days']
+            )
+            values[f'payment_frequency_score_{days}d'] = payment_freq_score
+            values[f'credit_period_score_{days}d'] = credit_period_score
+            values[f'overall_score_{days}d'] = MetricsService.overall_score(
+                performance_score, payment_freq_score, credit_period_score
+            )
+        return values
+    
     @staticmethod
     def calculate_payment_frequency_score(customer_id: int, db: Session) -> float:
         """Calculate payment frequency score (0-100)"""
@@ -28,25 +136,16 @@ class MetricsService:
         if not payments:
             return 0.0
         
-        total_payments = len(payments)
         on_time_payments = sum(1 for p in payments if p.payment_date <= p.due_date)
         
-        on_time_percentage = (on_time_payments / total_payments) * 100 if total_payments > 0 else 0
-        
-        # Calculate average days to payment
+        # Calculate total days to payment
         total_days = sum(
             (p.payment_date - p.due_date).days 
             for p in payments 
             if p.payment_date and p.due_date
         )
-        avg_days = total_days / total_payments if total_payments > 0 else 0
-        
-        # Score based on on-time percentage and average days
-        # On-time percentage contributes 70%, average days contributes 30%
-        on_time_score = on_time_percentage * 0.7
-        days_score = max(0, 100 - abs(avg_days) * 2) * 0.3  # Penalize late payments
         
-        return min(100, max(0, on_time_score + days_score))
+        return MetricsService.payment_frequency_score(len(payments), on_time_payments, total_days)
     
     @staticmethod
     def calculate_credit_period_score(customer_id: int, db: Session) -> float:
@@ -63,24 +162,14 @@ class MetricsService:
             return 50.0  # Neutral score if no payment history
         
         overdue_count = sum(1 for p in payments if p.status == "overdue")
-        total_payments = len(payments)
-        overdue_percentage = (overdue_count / total_payments) * 100 if total_payments > 0 else 0
         
-        # Calculate average days over due date
+        # Total days over due date
         overdue_payments = [p for p in payments if p.payment_date and p.due_date and p.payment_date > p.due_date]
-        if overdue_payments:
-            avg_overdue_days = sum(
-                (p.payment_date - p.due_date).days 
-                for p in overdue_payments
-            ) / len(overdue_payments)
-        else:
-            avg_overdue_days = 0
-        
-        # Score decreases with overdue percentage and days
-        base_score = 100 - (overdue_percentage * 0.6)
-        days_penalty = min(30, avg_overdue_days * 0.5)  # Max 30 point penalty
+        overdue_days = sum((p.payment_date - p.due_date).days for p in overdue_payments)
         
-        return max(0, min(100, base_score - days_penalty))
+        return MetricsService.credit_period_score(
+            len(payments), overdue_count, len(overdue_payments), overdue_days
+        )
     
     @staticmethod
     def calculate_performance_score(customer_id: int, db: Session) -> float:
@@ -95,26 +184,16 @@ class MetricsService:
         if not orders:
             return 0.0
         
-        total_orders = len(orders)
         fulfilled_orders = sum(1 for o in orders if o.status == "fulfilled")
-        fulfillment_rate = (fulfilled_orders / total_orders) * 100 if total_orders > 0 else 0
         
         # Calculate total order value
         total_value = sum(o.total_quantity for o in orders)
         
-        # Score based on:
-        # - Number of orders (30%)
-        # - Fulfillment rate (40%)
-        # - Order value consistency (30%)
-        order_count_score = min(100, (total_orders / 10) * 100) * 0.3  # Normalize to 10 orders = 100
-        fulfillment_score = fulfillment_rate * 0.4
-        value_score = min(100, (total_value / 1000) * 100) * 0.3  # Normalize to 1000 units = 100
-        
-        return min(100, max(0, order_count_score + fulfillment_score + value_score))
+        return MetricsService.performance_score(len(orders), fulfilled_orders, total_value)
     
     @staticmethod
-    def calculate_all_metrics(customer_id: int, db: Session) -> CustomerMetric:
-        """Calculate and update all metrics for a customer"""
+    def compute_customer_metrics(customer_id: int, db: Session) -> Dict:
+        """Compute a customer's CustomerMetric column values without writing them"""
         customer = db.query(Customer).filter(Customer.id == customer_id).first()
         if not customer:
             raise ValueError(f"Customer {customer_id} not found")
@@ -146,43 +225,44 @@ class MetricsService:
         total_order_value = sum(o.total_quantity for o in orders)
         
         # Calculate weighted overall score
-        overall_score = (
-            performance_score * settings.performance_weight +
-            payment_freq_score * settings.payment_frequency_weight +
-            credit_period_score * settings.credit_period_weight
+        overall_score = MetricsService.overall_score(
+            performance_score, payment_freq_score, credit_period_score
         )
         
+        window_stats = MetricAggregateService.window_stats([customer_id], db)[customer_id]
+        
+        return {
+            **MetricsService.window_metrics(window_stats, performance_score),
+            'customer_id': customer_id,
+            'payment_frequency_score': payment_freq_score,
+            'credit_period_score': credit_period_score,
+            'performance_score': performance_score,
+            'overall_score': overall_score,
+            'total_orders': len(orders),
+            'total_order_value': total_order_value,
+            'on_time_payment_percentage': on_time_percentage,
+            'average_days_to_payment': avg_days_to_payment,
+            'overdue_count': len(overdue_payments),
+            'total_payments': len(payments),
+            'last_calculated': datetime.utcnow()
+        }
+    
+    @staticmethod
+    def calculate_all_metrics(customer_id: int, db: Session) -> CustomerMetric:
+        """Calculate and update all metrics for a customer"""
+        values = MetricsService.compute_customer_metrics(customer_id, db)
+        
         # Update or create metrics
         metrics = db.query(CustomerMetric).filter(CustomerMetric.customer_id == customer_id).first()
         
         if metrics:
-            metrics.payment_frequency_score = payment_freq_score
-            metrics.credit_period_score = credit_period_score
-            metrics.performance_score = performance_score
-            metrics.overall_score = overall_score
-            metrics.total_orders = len(orders)
-            metrics.total_order_value = total_order_value
-            metrics.on_time_payment_percentage = on_time_percentage
-            metrics.average_days_to_payment = avg_days_to_payment
-            metrics.overdue_count = len(overdue_payments)
-            metrics.total_payments = len(payments)
-            metrics.last_calculated = datetime.utcnow()
+            for column, value in values.items():
+                setattr(metrics, column, value)
         else:
-            metrics = CustomerMetric(
-                customer_id=customer_id,
-                payment_frequency_score=payment_freq_score,
-                credit_period_score=credit_period_score,
-                performance_score=performance_score,
-                overall_score=overall_score,
-                total_orders=len(orders),
-                total_order_value=total_order_value,
-                on_time_payment_percentage=on_time_percentage,
-                average_days_to_payment=avg_days_to_payment,
-                overdue_count=len(overdue_payments),
-                total_payments=len(payments),
-                last_calculated=datetime.utcnow()
-            )
+            metrics = CustomerMetric(**values)
             db.add(metrics)
+        MetricSnapshotService.append([values], db)
+        MetricsService.bump_version(db)
         
         db.commit()
         db.refresh(metrics)
@@ -190,18 +270,332 @@ class MetricsService:
         return metrics
     
     @staticmethod
-    def recalculate_all_metrics(db: Session) -> int:
-        """Recalculate metrics for all customers"""
-        customers = db.query(Customer).filter(Customer.status == "active").all()
-        count = 0
+    def recalculate_all_metrics(db: Session, mode: str = None) -> int:
+        """
+        Recalculate metrics for all active customers.
+        mode is "columnar" (NumPy engine), "bulk" (set-based SQL),
+        "parallel" (per-customer scoring in worker processes) or
+        "per_customer"; defaults to settings.metrics_recalculation_mode.
+        """
+        mode = mode or settings.metrics_recalculation_mode
+        if mode not in ("columnar", "parallel", "bulk", "per_customer"):
+            raise ValueError(f"Unknown metrics recalculation mode: {mode}")
         
-        for customer in customers:
-            try:
-                MetricsService.calculate_all_metrics(customer.id, db)
-                count += 1
-            except Exception as e:
-                print(f"Error calculating metrics for customer {customer.id}: {e}")
-                continue
+        # Read before rescanning history: customers whose aggregates change
+        # during the rescan stay stale
+        versions = MetricAggregateService.stale_versions(db, active_only=True)
         
+        if mode == "columnar":
+            count = MetricsService.recalculate_metrics_columnar(db)
+        elif mode == "parallel":
+            count = MetricsService.recalculate_metrics_parallel(db)
+        elif mode == "bulk":
+            count = MetricsService.recalculate_metrics_bulk(db)
+        else:
+            customers = db.query(Customer).filter(Customer.status == "active").all()
+            count = 0
+            
+            for customer in customers:
+                try:
+                    MetricsService.calculate_all_metrics(customer.id, db)
+                    count += 1
+                except Exception as e:
+                    print(f"Error calculating metrics for customer {customer.id}: {e}")
+                    continue
+        
+        MetricAggregateService.clear_stale(versions, db)
+        db.commit()
         return count
+    
+    @staticmethod
+    def refresh_stale_metrics(db: Session, customer_ids: List[int] = None) -> Dict[str, int]:
+        """
+        Update metrics only for active customers marked stale (changed since
+        their last calculation) plus the given customers, e.g. those in the
+        current allocation batch. Scores are derived from the running
+        aggregates, without rescanning payment or order history; use
+        recalculate_all_metrics (or rebuild the aggregates) for a full rescan.
+        Returns how many customers were refreshed and how many were skipped.
+        """
+        targets = set(MetricAggregateService.stale_customer_ids(db))
+        if customer_ids:
+            targets.update(
+                row.id for row in db.query(Customer.id).filter(
+                    Customer.id.in_(customer_ids), Customer.status == "active"
+                ).all()
+            )
+        active_count = db.query(func.count(Customer.id)).filter(Customer.status == "active").scalar()
+        
+        refreshed = 0
+        if targets:
+            refreshed = MetricsService.refresh_from_aggregates(sorted(targets), db)
+            db.commit()
+        
+        return {'refreshed': refreshed, 'skipped': active_count - len(targets)}
+    
+    @staticmethod
+    def recalculate_metrics_parallel(db: Session, customer_ids: List[int] = None, workers: int = None) -> int:
+        """
+        Recalculate metrics for all active customers (or the given ones) with
+        the per-customer scoring path, sharded across the shared worker pool.
+        
+        Customers are split into contiguous id ranges, one shard per worker.
+        Each worker reads its shard with its own session and returns metric
+        rows; this process is the only writer and commits each shard as it
+        arrives. Fewer than settings.metrics_parallel_min_customers customers
+        are scored in-process, shard by shard. Progress is available from
+        recalculation_progress().
+        """
+        query = db.query(Customer.id).filter(Customer.status == "active")
+        if customer_ids is not None:
+            query = query.filter(Customer.id.in_(customer_ids))
+        ids = [row.id for row in query.order_by(Customer.id).all()]
+        if not ids:
+            return 0
+        
+        use_pool = WorkerPool.use_pool(len(ids), settings.metrics_parallel_min_customers)
+        shard_count = max(1, min(workers or settings.metrics_workers, len(ids)))
+        if use_pool:
+            shard_count = min(shard_count, WorkerPool.size())
+        shard_size = -(-len(ids) // shard_count)
+        shards = [ids[i:i + shard_size] for i in range(0, len(ids), shard_size)]
+        
+        progress = {
+            'status': "running",
+            'shards': len(shards),
+            'completed_shards': 0,
+            'customers': len(ids),
+            'completed_customers': 0,
+            'workers': WorkerPool.size() if use_pool else 1,
+            'started_at': datetime.utcnow(),
+            'finished_at': None
+        }
+        MetricsService._progress = progress
+        
+        count = 0
+        try:
+            if use_pool:
+                shard_rows = WorkerPool.imap_unordered(_compute_metrics_shard, shards)
+            else:
+                shard_rows = (_compute_metrics_shard(shard) for shard in shards)
+            for rows in shard_rows:
+                MetricsService.upsert_metrics(rows, db)
+                db.commit()
+                count += len(rows)
+                progress['completed_shards'] += 1
+                progress['completed_customers'] += len(rows)
+        except Exception:
+            progress['status'] = "failed"
+            progress['finished_at'] = datetime.utcnow()
+            raise
+        
+        progress['status'] = "completed"
+        progress['finished_at'] = datetime.utcnow()
+        return count
+    
+    @staticmethod
+    def recalculation_progress() -> Dict:
+        """Shard progress of the current or last parallel recalculation"""
+        return dict(MetricsService._progress)
+    
+    @staticmethod
+    def metrics_from_stats(customer_stats: Dict) -> Dict:
+        """CustomerMetric column values from one customer's aggregates"""
+        payment_freq_score = MetricsService.payment_frequency_score(
+            customer_stats['paid_count'], customer_stats['on_time_count'], customer_stats['paid_days']
+        )
+        credit_period_score = MetricsService.credit_period_score(
+            customer_stats['total_payments'], customer_stats['overdue_count'],
+            customer_stats['late_count'], customer_stats['late_days']
+        )
+        performance_score = MetricsService.performance_score(
+            customer_stats['total_orders'], customer_stats['fulfilled_orders'],
+            customer_stats['total_order_value']
+        )
+        paid_count = customer_stats['paid_count']
+        
+        return {
+            'payment_frequency_score': payment_freq_score,
+            'credit_period_score': credit_period_score,
+            'performance_score': performance_score,
+            'overall_score': MetricsService.overall_score(
+                performance_score, payment_freq_score, credit_period_score
+            ),
+            'total_orders': customer_stats['total_orders'],
+            'total_order_value': customer_stats['total_order_value'],
+            'on_time_payment_percentage': (customer_stats['on_time_count'] / paid_count * 100) if paid_count else 0,
+            'average_days_to_payment': customer_stats['paid_days'] / paid_count if paid_count else 0,
+            'overdue_count': customer_stats['overdue_count'],
+            'total_payments': customer_stats['total_payments']
+        }
+    
+    @staticmethod
+    def recalculate_metrics_bulk(db: Session, customer_ids: List[int] = None) -> int:
+        """
+        Recalculate metrics for all active customers (or the given ones) from
+        set-based aggregates and upsert customer_metrics in one batch.
+        Produces the same values as calculate_all_metrics; the stored running
+        aggregates are left alone.
+        """
+        customer_stats = MetricAggregateService.aggregate_customer_stats(db, customer_ids)
+        if not customer_stats:
+            return 0
+        
+        MetricsService.upsert_metrics(MetricsService._metric_rows(customer_stats, db), db)
+        db.commit()
+        return len(customer_stats)
+    
+    @staticmethod
+    def recalculate_metrics_columnar(db: Session, customer_ids: List[int] = None) -> int:
+        """
+        Recalculate metrics for all active customers (or the given ones) with
+        the columnar engine and upsert customer_metrics in one batch.
+        Produces the same values as calculate_all_metrics; the stored running
+        aggregates are left alone.
+        """
+        ids, _, metrics = MetricsEngine.compute(db, customer_ids)
+        if not len(ids):
+            return 0
+        
+        ids = ids.tolist()
+        calculated_at = datetime.utcnow()
+        metric_columns = {column: values.tolist() for column, values in metrics.items()}
+        window_stats = MetricAggregateService.window_stats(ids, db)
+        MetricsService.upsert_metrics([
+            dict(
+                {column: values[i] for column, values in metric_columns.items()},
+                **MetricsService.window_metrics(
+                    window_stats[customer_id], metric_columns['performance_score'][i]
+                ),
+                customer_id=customer_id,
+                last_calculated=calculated_at
+            )
+            for i, customer_id in enumerate(ids)
+        ], db)
+        db.commit()
+        return len(ids)
+    
+    @staticmethod
+    def refresh_from_aggregates(customer_ids: List[int], db: Session) -> int:
+        """
+        Update customers' metrics from their stored running aggregates,
+        without scanning payment or order history. Customers without
+        aggregates are built first. The caller commits.
+        """
+        MetricAggregateService.ensure(db, customer_ids)
+        versions = MetricAggregateService.stale_versions(db, customer_ids)
+        customer_stats = MetricAggregateService.load(customer_ids, db)
+        MetricsService.upsert_metrics(MetricsService._metric_rows(customer_stats, db), db)
+        MetricAggregateService.clear_stale(versions, db)
+        return len(customer_stats)
+    
+    @staticmethod
+    def _metric_rows(customer_stats: Dict[int, Dict], db: Session) -> List[Dict]:
+        """customer_metrics rows from per-customer aggregates and monthly payment buckets"""
+        calculated_at = datetime.utcnow()
+        window_stats = MetricAggregateService.window_stats(list(customer_stats), db)
+        rows = []
+        for customer_id, stats in customer_stats.items():
+            row = MetricsService.metrics_from_stats(stats)
+            row.update(MetricsService.window_metrics(window_stats[customer_id], row['performance_score']))
+            row['customer_id'] = customer_id
+            row['last_calculated'] = calculated_at
+            rows.append(row)
+        return rows
+    
+    @staticmethod
+    def upsert_metrics(rows: List[Dict], db: Session):
+        """
+        Insert or update customer_metrics rows (keyed by customer_id) as one
+        statement batch, and append them to the snapshot history
+        """
+        if not rows:
+            return
+        
+        statement = sqlite_insert(CustomerMetric.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=[CustomerMetric.__table__.c.customer_id],
+            set_={
+                column: getattr(statement.excluded, column)
+                for column in rows[0] if column != 'customer_id'
+            }
+        )
+        db.execute(statement, rows)
+        MetricSnapshotService.append(rows, db)
+        MetricsService.bump_version(db)
+    
+    @staticmethod
+    def bump_version(db: Session):
+        """Record that customer_metrics changed, in the caller's transaction"""
+        table = MetricsVersion.__table__
+        statement = sqlite_insert(table).values(id=1, version=1, updated_at=datetime.utcnow())
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={'version': table.c.version + 1, 'updated_at': statement.excluded.updated_at}
+        ))
+    
+    @staticmethod
+    def metrics_version(db: Session):
+        """Current (version, updated_at) of customer_metrics, as seen by this session"""
+        row = db.query(MetricsVersion.version, MetricsVersion.updated_at).filter(MetricsVersion.id == 1).first()
+        return (row.version, row.updated_at) if row else (0, None)
+    
+    @staticmethod
+    def priority_columns(window_days: int = 0) -> Dict[str, str]:
+        """
+        CustomerMetric column behind the allocation priority score and each of
+        its components: the lifetime scores, or with a window the rolling-window
+        payment scores (performance has no window)
+        """
+        suffix = f"_{window_days}d" if window_days else ""
+        return {
+            'performance_score': "performance_score",
+            'payment_frequency_score': f"payment_frequency_score{suffix}",
+            'credit_period_score': f"credit_period_score{suffix}",
+            'priority_score': f"overall_score{suffix}",
+        }
+    
+    @staticmethod
+    def priority_scores(db: Session) -> Dict[int, Dict[str, float]]:
+        """
+        Lifetime overall score, allocation priority score and the component
+        scores it is weighted from (see priority_columns) of every customer
+        with metrics, loaded in one query and cached in-process until the
+        metrics version (or the priority window setting) changes.
+        """
+        window_days = settings.priority_score_window_days
+        key = (MetricsService.metrics_version(db), window_days)
+        with MetricsService._priority_cache_lock:
+            if MetricsService._priority_cache['key'] == key:
+                return MetricsService._priority_cache['scores']
+        
+        rows = db.query(
+            CustomerMetric.customer_id, CustomerMetric.overall_score,
+            *[
+                getattr(CustomerMetric, column).label(name)
+                for name, column in MetricsService.priority_columns(window_days).items()
+            ]
+        ).all()
+        scores = {row.customer_id: dict(row._mapping) for row in rows}
+        
+        with MetricsService._priority_cache_lock:
+            MetricsService._priority_cache = {'key': key, 'scores': scores}
+        return scores
+
 
+def _compute_metrics_shard(customer_ids: List[int]) -> List[Dict]:
+    """
+    Compute metric rows for one shard of customers with a session of its own.
+    Module-level so it can be sent to worker processes.
+    """
+    db = SessionLocal()
+    try:
+        rows = []
+        for customer_id in customer_ids:
+            try:
+                rows.append(MetricsService.compute_customer_metrics(customer_id, db))
+            except Exception as e:
+                print(f"Error calculating metrics for customer {customer_id}: {e}")
+        return rows
+    finally:
+        db.close()
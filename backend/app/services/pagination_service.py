@@ -0,0 +1,81 @@
+"""
+Service for keyset (cursor) pagination of list endpoints
+"""
+from sqlalchemy import and_, or_
+from datetime import datetime
+from typing import List, Tuple, Optional
+import base64
+import json
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded for the endpoint's sort keys"""
+
+
+class PaginationService:
+    """
+    Pages a query by its sort keys instead of an offset: the next page starts
+    after the last row's key values, so deep pages cost the same as the first
+    when the keys are indexed. Keys are (column, descending) pairs and must end
+    with a unique column (the id) so every row has a distinct position.
+    Cursors are opaque url-safe strings holding the last row's key values.
+    """
+
+    @staticmethod
+    def encode_cursor(row, keys: List[Tuple]) -> str:
+        """Cursor pointing just after row"""
+        values = []
+        for column, _ in keys:
+            value = getattr(row, column.key)
+            values.append(value.isoformat() if isinstance(value, datetime) else value)
+        encoded = base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode())
+        return encoded.decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str, keys: List[Tuple]) -> List:
+        """Key values stored in a cursor, converted back to the columns' Python types"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(keys):
+                raise ValueError("wrong number of values")
+            return [
+                datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+                for (column, _), value in zip(keys, values)
+            ]
+        except (ValueError, TypeError) as e:
+            raise InvalidCursorError("Invalid cursor") from e
+
+    @staticmethod
+    def paginate(query, keys: List[Tuple], limit: int, cursor: Optional[str] = None, skip: int = 0):
+        """
+        Order query by keys and select the page after cursor (or at offset skip,
+        for the offset API). One extra row is fetched to tell whether a next
+        page exists; pass the result rows to page(). Works on ORM queries and
+        select() statements.
+        """
+        if cursor:
+            values = PaginationService.decode_cursor(cursor, keys)
+            # (k1, k2, ...) after (v1, v2, ...) in the sort order, spelled out
+            # as OR-ed prefixes so SQLite can use the index
+            after = []
+            for i, (column, descending) in enumerate(keys):
+                equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+                beyond = column < values[i] if descending else column > values[i]
+                after.append(and_(*equal_prefix, beyond))
+            # The redundant bound on the first key lets SQLite walk its index from the cursor
+            first_column, first_descending = keys[0]
+            bound = first_column <= values[0] if first_descending else first_column >= values[0]
+            query = query.filter(bound, or_(*after))
+        query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in keys])
+        if skip and not cursor:
+            query = query.offset(skip)
+        return query.limit(limit + 1)
+
+    @staticmethod
+    def page(rows: List, keys: List[Tuple], limit: int) -> Tuple[List, Optional[str]]:
+        """Trim the extra row from a paginate() result; returns (rows, next cursor or None)"""
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, PaginationService.encode_cursor(rows[-1], keys)
@@ -0,0 +1,122 @@
+"""
+Shared worker process pool for parallel allocation, metrics and simulations
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, List, Optional
+import sys
+from pathlib import Path
+
+# Add parent directory to path for config import
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from config import settings
+
+
+class WorkerPool:
+    """
+    One long-lived process pool, started with the app and reused by every
+    parallel code path, so a request never pays for starting processes.
+
+    Workers are spawned rather than forked: forking the multithreaded
+    server can copy locks held by other threads (logging, the SQLAlchemy
+    pool, SQLite) into a child, where they are never released. A spawned
+    worker imports the app afresh and opens its own database connections,
+    which takes a few seconds, once, at startup.
+
+    Shipping work to a worker costs pickling and a round trip, so callers
+    ask use_pool() whether a job is big enough; smaller jobs run in-process.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def size() -> int:
+        """Number of worker processes (settings.worker_pool_processes, or one per CPU up to 4)"""
+        if settings.worker_pool_processes:
+            return settings.worker_pool_processes
+        return min(4, os.cpu_count() or 1)
+
+    @staticmethod
+    def use_pool(work: int, min_work: int) -> bool:
+        """Whether a job of this size should run in the pool rather than in-process"""
+        return WorkerPool.size() > 1 and work >= min_work
+
+    @staticmethod
+    def start():
+        """Create the pool and start spawning its workers in the background (no-op without a pool)"""
+        if WorkerPool.size() <= 1:
+            return
+        executor = WorkerPool._get()
+        # Workers are started on demand; one task per worker brings them all up now
+        for _ in range(WorkerPool.size()):
+            executor.submit(_ready)
+
+    @staticmethod
+    def shutdown():
+        """Stop the workers, letting queued tasks finish"""
+        with WorkerPool._lock:
+            executor = WorkerPool._executor
+            WorkerPool._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def submit(fn: Callable, *args) -> Future:
+        """Run fn(*args) in a worker. fn must be a module-level function."""
+        try:
+            return WorkerPool._get().submit(fn, *args)
+        except BrokenProcessPool:
+            WorkerPool._reset()
+            raise
+
+    @staticmethod
+    def map(fn: Callable, *iterables) -> List:
+        """fn applied to each set of arguments in the workers, results in order"""
+        futures = [WorkerPool.submit(fn, *args) for args in zip(*iterables)]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            WorkerPool._reset()
+            raise
+
+    @staticmethod
+    def imap_unordered(fn: Callable, arguments: Iterable) -> Iterator:
+        """fn(argument) for each argument in the workers, yielded as each finishes"""
+        futures = [WorkerPool.submit(fn, argument) for argument in arguments]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        except BrokenProcessPool:
+            WorkerPool._reset()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _get() -> ProcessPoolExecutor:
+        with WorkerPool._lock:
+            if WorkerPool._executor is None:
+                WorkerPool._executor = ProcessPoolExecutor(
+                    max_workers=WorkerPool.size(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return WorkerPool._executor
+
+    @staticmethod
+    def _reset():
+        with WorkerPool._lock:
+            executor = WorkerPool._executor
+            WorkerPool._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def _ready() -> bool:
+    """No-op task used to start a worker"""
+    return True
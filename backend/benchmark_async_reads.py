@@ -0,0 +1,146 @@
+"""
+Load test: async read endpoints vs the sync path while heavy jobs run.
+
+Starts the API server on a fresh database and measures lookup latency in two
+phases - idle, then while enough concurrent allocation simulations (slow,
+read-only sync requests) run to fill the server's threadpool, which every
+sync handler runs on:
+- async: GET /inventory/{id} and GET /orders/{id} (async handlers on the event loop)
+- sync:  GET /metrics/customer/{id} and GET /allocation/runs (sync handlers on the threadpool)
+Prints req/s and p50/p95 latency for each path and phase.
+
+Usage:
+    python benchmark_async_reads.py [--duration 10] [--heavy 48] [--probes 4]
+"""
+import argparse
+import http.client
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmark_sqlite_profile import request, start_server, seed, percentile
+
+PATHS = {
+    "async": ["/inventory/{id}", "/orders/{id}"],
+    "sync": ["/metrics/customer/{id}?compute=false", "/allocation/runs?limit=10"],
+}
+
+# Dry-run allocation of every pending order for a grid of settings
+HEAVY_PATH = "/allocation/simulate"
+HEAVY_BODY = {
+    "algorithm": "greedy",
+    "grid": {"performance_weight": [0.2, 0.3, 0.4], "max_allocation_percentage": [0.3, 0.4]},
+    "include_customers": False,
+}
+
+
+def seed_orders(port, customer_ids, items, orders):
+    """Create inventory items and orders for the lookups"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for i in range(items):
+        request(connection, "POST", "/inventory/", {
+            "product_code": f"BENCH-{i + 1:04d}", "product_name": f"Benchmark Item {i + 1}",
+            "available_quantity": 1000,
+        })
+    for _ in range(orders):
+        request(connection, "POST", "/orders/", {
+            "customer_id": random.choice(customer_ids),
+            "items": [
+                {"inventory_id": random.randint(1, items), "requested_quantity": random.randint(10, 100)}
+                for _ in range(3)
+            ],
+        })
+    connection.close()
+
+
+def probe(port, duration, probes, ids):
+    """Run lookups on each path from its own threads for duration seconds; returns per-path latencies"""
+    latencies = {kind: [] for kind in PATHS}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(kind):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        local = []
+        while time.perf_counter() < deadline:
+            path = random.choice(PATHS[kind]).format(id=random.choice(ids))
+            started = time.perf_counter()
+            request(connection, "GET", path)
+            local.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            latencies[kind].extend(local)
+
+    threads = [threading.Thread(target=worker, args=(kind,)) for kind in PATHS for _ in range(probes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def heavy_load(port, heavy, stop):
+    """Keep heavy sync requests in flight until stop is set"""
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        while not stop.is_set():
+            try:
+                request(connection, "POST", HEAVY_PATH, HEAVY_BODY)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(heavy)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def report(phase, latencies, duration):
+    """Print one phase's throughput and latency per path"""
+    for kind, values in latencies.items():
+        print(
+            f"{phase:<8} {kind:<6} {len(values) / duration:>8.1f} "
+            f"{percentile(values, 0.50):>9.1f} {percentile(values, 0.95):>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare async and sync read latency under heavy load")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--heavy", type=int, default=48, help="concurrent heavy requests (threadpool has 40 threads)")
+    parser.add_argument("--probes", type=int, default=4, help="concurrent lookup threads per path")
+    parser.add_argument("--customers", type=int, default=200, help="customers to seed")
+    parser.add_argument("--payments", type=int, default=5000, help="payments to seed")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(Path(directory) / "benchmark.db", args.port, True)
+        try:
+            customer_ids = seed(args.port, args.customers, args.payments)
+            seed_orders(args.port, customer_ids, 50, 500)
+            ids = list(range(1, 51))
+
+            print(f"{args.probes} lookup threads per path, {args.duration:g}s per phase, {args.heavy} heavy requests in flight\n")
+            print(f"{'phase':<8} {'path':<6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+            report("idle", probe(args.port, args.duration, args.probes, ids), args.duration)
+
+            stop = threading.Event()
+            threads = heavy_load(args.port, args.heavy, stop)
+            time.sleep(1)
+            latencies = probe(args.port, args.duration, args.probes, ids)
+            stop.set()
+            report("loaded", latencies, args.duration)
+            for thread in threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark the SQLite performance profile under concurrent API load.
+
+Starts the API server twice on a fresh database - once with SQLite's stock
+settings (sqlite_performance_profile=False) and once with the configured
+profile - and drives each with concurrent reader and writer threads:
+- readers list customers, payments and the metrics leaderboard
+- writers record payments (which also update running metric aggregates
+  and trigger the background metrics refresh)
+Prints requests/second, latency and error counts ("database is locked"
+surfaces as 500 responses) for both runs.
+
+Usage:
+    python benchmark_sqlite_profile.py [--duration 15] [--readers 8] [--writers 4]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+READ_PATHS = [
+    "/customers/?limit=100",
+    "/payments/?limit=100",
+    "/metrics/leaderboard?limit=50",
+]
+
+
+def request(connection, method, path, body=None):
+    """Send one request on a keep-alive connection; returns the status code"""
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def payment_body(customer_ids):
+    """A random payment for one of the customers, early or late"""
+    due_date = datetime(2024, 1, 1) + timedelta(days=random.randint(0, 700))
+    payment_date = due_date + timedelta(days=random.randint(-10, 30))
+    return {
+        "customer_id": random.choice(customer_ids),
+        "payment_date": payment_date.isoformat(),
+        "due_date": due_date.isoformat(),
+        "amount": round(random.uniform(1000, 50000), 2),
+    }
+
+
+def start_server(database_path, port, profile):
+    """Start uvicorn on a database with the profile on or off and wait until it answers"""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{database_path}",
+        SQLITE_PERFORMANCE_PROFILE=str(profile).lower(),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            if request(connection, "GET", "/health") == 200:
+                connection.close()
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def seed(port, customers, payments):
+    """Create customers and payment history through the API"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for i in range(customers):
+        request(connection, "POST", "/customers/", {"name": f"Benchmark Customer {i + 1}", "credit_limit": 100000})
+    connection.request("GET", f"/customers/?limit={customers}")
+    customer_ids = [customer["id"] for customer in json.loads(connection.getresponse().read())]
+    for _ in range(payments):
+        request(connection, "POST", "/payments/", payment_body(customer_ids))
+    request(connection, "POST", "/metrics/recalculate-all?force=true")
+    connection.close()
+    return customer_ids
+
+
+def run_load(port, customer_ids, duration, readers, writers):
+    """Drive the server with reader and writer threads; returns per-kind results"""
+    results = {kind: {"ok": 0, "errors": 0, "latencies": []} for kind in ("read", "write")}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(kind):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        ok, errors, latencies = 0, 0, []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if kind == "read":
+                    status = request(connection, "GET", random.choice(READ_PATHS))
+                else:
+                    status = request(connection, "POST", "/payments/", payment_body(customer_ids))
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status is not None and status < 400:
+                ok += 1
+            else:
+                errors += 1
+        connection.close()
+        with lock:
+            results[kind]["ok"] += ok
+            results[kind]["errors"] += errors
+            results[kind]["latencies"].extend(latencies)
+
+    threads = [threading.Thread(target=worker, args=("read",)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write",)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def percentile(values, fraction):
+    """Value at a fraction of the sorted values, in milliseconds"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def benchmark(profile, args, port):
+    """Run the load against a fresh database with the profile on or off"""
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(Path(directory) / "benchmark.db", port, profile)
+        try:
+            customer_ids = seed(port, args.customers, args.payments)
+            return run_load(port, customer_ids, args.duration, args.readers, args.writers)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite performance profile under concurrent API load")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per run")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent reader threads")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writer threads")
+    parser.add_argument("--customers", type=int, default=200, help="customers to seed")
+    parser.add_argument("--payments", type=int, default=2000, help="payments to seed")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.duration:g}s per run\n")
+    print(f"{'profile':<10} {'kind':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for profile in (False, True):
+        results = benchmark(profile, args, args.port)
+        for kind, result in results.items():
+            print(
+                f"{'tuned' if profile else 'stock':<10} {kind:<6} "
+                f"{result['ok'] / args.duration:>8.1f} "
+                f"{percentile(result['latencies'], 0.50):>8.1f} "
+                f"{percentile(result['latencies'], 0.95):>8.1f} "
+                f"{result['errors']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,16 +8,80 @@ class Settings(BaseSettings):
     # Database configuration
     database_url: str = "sqlite:///./order_allocation.db"
     
+    # SQLite performance profile, applied as PRAGMAs on every new connection.
+    # WAL lets readers run alongside a writer; NORMAL sync is durable in WAL mode
+    # except on power loss. cache_size is in pages, or KiB when negative.
+    # Set sqlite_performance_profile to False for SQLite's stock settings.
+    sqlite_performance_profile: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size: int = -64000  # 64 MB
+    sqlite_mmap_size: int = 268435456  # 256 MB
+    sqlite_temp_store: str = "MEMORY"
+    sqlite_busy_timeout_ms: int = 5000
+    
     # Allocation algorithm weights
     performance_weight: float = 0.30
     payment_frequency_weight: float = 0.25
     credit_period_weight: float = 0.25
     stock_availability_weight: float = 0.20
     
+    # Score used as allocation priority: 0 for lifetime overall_score, or a
+    # rolling window (90, 180 or 365 days) to use overall_score_<days>d
+    priority_score_window_days: int = 0
+    
     # Minimum allocation rules
     min_allocation_percentage: float = 0.05  # 5% minimum allocation
     max_allocation_percentage: float = 0.40  # 40% maximum allocation per customer
     
+    # How recalculate_all_metrics computes scores: "columnar" (NumPy over streamed
+    # history), "bulk" (set-based SQL aggregates), "parallel" (per-customer
+    # scoring sharded across processes) or "per_customer"
+    metrics_recalculation_mode: str = "columnar"
+    
+    # Rows per batch when the columnar metrics engine streams payments and orders
+    metrics_batch_size: int = 100000
+    
+    # Parallel metrics recalculation: number of customer id-range shards
+    metrics_workers: int = 4
+    
+    # Parallel allocation: number of shards SKUs are split across
+    allocation_workers: int = 4
+    
+    # Worker processes shared by parallel allocation, parallel metrics and
+    # simulations, spawned once at startup (0: one per CPU, up to 4; 1: no pool)
+    worker_pool_processes: int = 0
+    
+    # Jobs below these sizes run in-process, where they finish before the
+    # inputs could be shipped to workers: order lines of a parallel
+    # allocation, configs x order lines of a simulation, and customers of a
+    # parallel metrics recalculation
+    allocation_parallel_min_lines: int = 50000
+    simulation_parallel_min_lines: int = 200000
+    metrics_parallel_min_customers: int = 200
+    
+    # Times an allocation run is reloaded and retried when stock it read was changed concurrently
+    allocation_max_retries: int = 3
+    
+    # Background refresh of stale metrics: handlers enqueue changed customers,
+    # refreshed after a debounce delay, and all stale customers every interval
+    metrics_refresh_enabled: bool = True
+    metrics_refresh_interval_seconds: float = 60.0
+    metrics_refresh_debounce_seconds: float = 2.0
+    
+    # Metric snapshot compaction: snapshots older than raw_days are downsampled
+    # to one per week, and older than weekly_days to one per month. The
+    # background metrics scheduler compacts every compaction_interval_hours.
+    metric_snapshot_raw_days: int = 30
+    metric_snapshot_weekly_days: int = 365
+    metric_snapshot_compaction_interval_hours: float = 24.0
+    
+    # Seconds GET /dashboard/summary serves cached totals before recounting
+    dashboard_summary_ttl_seconds: float = 5.0
+    
+    # Upper bound on configurations evaluated by one simulation request
+    simulation_max_configs: int = 500
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
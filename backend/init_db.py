@@ -1,12 +1,13 @@
 """
 Database initialization script
 """
-from app.database import init_db, engine
-from app.models import Base
+from app.database import init_db
+import app.models  # registers the tables with Base
 
 if __name__ == "__main__":
+    # Creates missing tables and adds new columns and indexes to existing ones
     print("Initializing database...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     print("Database initialized successfully!")
     print("Database file: order_allocation.db")
 
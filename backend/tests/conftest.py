@@ -0,0 +1,114 @@
+"""
+Shared fixtures: the app runs against a temporary SQLite database seeded
+with random customers, inventory, orders and payments
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# The app reads the database URL from settings at import time
+_directory = tempfile.TemporaryDirectory(prefix="order-allocation-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_directory.name) / 'test.db'}"
+os.environ["METRICS_REFRESH_ENABLED"] = "false"
+# A small worker pool, so parallel paths run in worker processes even on one CPU
+os.environ["WORKER_POOL_PROCESSES"] = "2"
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.database import SessionLocal, engine
+from app.models import Customer, Inventory, Order, OrderItem, Payment
+from app.services.metric_aggregate_service import MetricAggregateService
+
+
+def populate(db, customers=30, inventory=40, orders=150, payments=500, seed=7):
+    """Insert random data; every seventh customer is inactive"""
+    rng = random.Random(seed)
+    for i in range(customers):
+        db.add(Customer(name=f"Customer {i}", status="inactive" if i % 7 == 6 else "active"))
+    for i in range(inventory):
+        db.add(Inventory(
+            product_code=f"P{i:04d}",
+            product_name=f"Product {i}",
+            available_quantity=rng.choice([0, 37.5, 50, 100, 500, 1000]),
+            reserved_quantity=rng.choice([0, 0, 10])
+        ))
+    db.flush()
+
+    # Due dates over the last two years, so rolling windows are populated
+    start = datetime.utcnow() - timedelta(days=730)
+    for _ in range(payments):
+        due_date = start + timedelta(days=rng.randint(0, 720), seconds=rng.randint(0, 86399),
+                                     microseconds=rng.randint(0, 999999))
+        db.add(Payment(
+            customer_id=rng.randint(1, customers),
+            due_date=due_date,
+            payment_date=due_date + timedelta(days=rng.randint(-20, 40), seconds=rng.randint(-86400, 86400)),
+            amount=100.0,
+            status=rng.choice(["paid", "paid", "overdue", "pending", "partial"])
+        ))
+
+    for _ in range(orders):
+        order = Order(customer_id=rng.randint(1, customers), status=rng.choice(["pending"] * 4 + ["fulfilled"]))
+        db.add(order)
+        db.flush()
+        total = 0
+        for _ in range(rng.randint(1, 5)):
+            quantity = rng.choice([5, 7.5, 10, 20, 50, 100])
+            db.add(OrderItem(order_id=order.id, inventory_id=rng.randint(1, inventory), requested_quantity=quantity))
+            total += quantity
+        order.total_quantity = total
+
+    db.commit()
+    MetricAggregateService.ensure(db)
+    db.commit()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient over a seeded database (startup creates the tables)"""
+    with TestClient(app) as test_client:
+        db = SessionLocal()
+        try:
+            populate(db)
+        finally:
+            db.close()
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    """Session on the seeded database"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def database_copy(client, tmp_path):
+    """Session on a copy of the seeded database, for tests that write"""
+    path = tmp_path / "copy.db"
+    source = sqlite3.connect(engine.url.database)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+    copy_engine = create_engine(f"sqlite:///{path}")
+    session = sessionmaker(autocommit=False, autoflush=False, bind=copy_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        copy_engine.dispose()
@@ -0,0 +1,68 @@
+"""
+One allocation at a time: while a background job runs, another job and a
+synchronous allocation are rejected with 409
+"""
+import threading
+import time
+
+import pytest
+
+from app.services.allocation_job_service import AllocationJobService
+from app.services.allocation_service import AllocationService
+
+
+@pytest.fixture
+def blocked_allocation(monkeypatch):
+    """Allocations wait on the returned event, reporting each phase first"""
+    release = threading.Event()
+
+    def allocate_orders(order_ids=None, db=None, recalculate_metrics=True, algorithm="greedy",
+                        parallel=False, stats=None, progress=None):
+        progress("loading")
+        assert release.wait(10)
+        progress("persisting")
+        stats['run_id'] = None
+        return []
+
+    monkeypatch.setattr(AllocationService, "allocate_orders", allocate_orders)
+    yield release
+    release.set()
+
+
+def wait_for(client, job_id, status):
+    for _ in range(200):
+        job = client.get(f"/allocation/jobs/{job_id}").json()
+        if job['status'] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not reach {status}: {job}")
+
+
+def test_second_allocation_conflicts_while_a_job_runs(client, blocked_allocation):
+    response = client.post("/allocation/jobs", json={'recalculate_metrics': False})
+    assert response.status_code == 202
+    job_id = response.json()['job_id']
+    job = wait_for(client, job_id, "running")
+    assert AllocationJobService.active_job_id() == job_id
+
+    conflict = client.post("/allocation/jobs", json={})
+    assert conflict.status_code == 409
+    assert job_id in conflict.json()['detail']
+
+    sync_conflict = client.post("/allocation/allocate", json={})
+    assert sync_conflict.status_code == 409
+    assert sync_conflict.json()['detail'] == conflict.json()['detail']
+
+    blocked_allocation.set()
+    job = wait_for(client, job_id, "completed")
+    assert (job['phase'], job['progress']) == ("completed", 1.0)
+    assert AllocationJobService.active_job_id() is None
+
+    # Free again once the job has finished
+    response = client.post("/allocation/jobs", json={'recalculate_metrics': False})
+    assert response.status_code == 202
+    wait_for(client, response.json()['job_id'], "completed")
+
+
+def test_unknown_job(client):
+    assert client.get("/allocation/jobs/not-a-job").status_code == 404
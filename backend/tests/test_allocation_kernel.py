@@ -0,0 +1,217 @@
+"""
+The vectorized engine (v1.1-np) allocates exactly like the greedy v1.0 engine,
+the lp engine keeps customers within their shares without stranding stock,
+and every engine gives the same result sharded across the worker pool
+"""
+import random
+import time
+
+import pytest
+
+from app.services.allocation_service import AllocationService, _allocate_shard
+from app.services.allocation_snapshot import AllocationSnapshot
+from app.services.worker_pool import WorkerPool
+from config import settings
+
+
+def random_snapshot(seed):
+    """
+    Snapshot with zero and tied priorities, empty or negative stock, and
+    customers with several lines (and repeated lines) for the same item
+    """
+    rng = random.Random(seed)
+    snapshot = AllocationSnapshot()
+    snapshot.min_allocation_percentage = rng.choice([0.0, 0.05, 0.2])
+    snapshot.max_allocation_percentage = rng.choice([0.2, 0.4, 1.0])
+
+    n_customers = rng.randint(1, 12)
+    snapshot.customer_ids = rng.sample(range(1, 100), n_customers)
+    snapshot.priorities = AllocationSnapshot.normalize_priorities({
+        customer_id: rng.choice([0.0, 0.0, 25.0, 50.0, 50.0, rng.uniform(0, 100)])
+        for customer_id in snapshot.customer_ids
+    })
+
+    inventory_ids = list(range(1, rng.randint(2, 10)))
+    snapshot.available = {
+        inv_id: rng.choice([-10.0, 0.0, 1.0, 37.5, 100.0, 1000.0]) for inv_id in inventory_ids
+    }
+
+    order_id = 0
+    item_id = 0
+    for customer_id in snapshot.customer_ids:
+        for _ in range(rng.randint(1, 3)):
+            order_id += 1
+            for _ in range(rng.randint(1, 4)):
+                item_id += 1
+                line = {
+                    'order_item_id': item_id,
+                    'order_id': order_id,
+                    'customer_id': customer_id,
+                    'inventory_id': rng.choice(inventory_ids),
+                    'requested_quantity': rng.choice([0.0, 1.0, 5.0, 7.5, 50.0, 400.0])
+                }
+                snapshot.lines.append(line)
+                if rng.random() < 0.2:
+                    # Duplicate line for the same order and item
+                    item_id += 1
+                    snapshot.lines.append(dict(line, order_item_id=item_id))
+    return snapshot
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_vectorized_matches_greedy(seed):
+    snapshot = random_snapshot(seed)
+
+    greedy_allocations, greedy_totals = _allocate_shard("greedy", snapshot)
+    vectorized_allocations, vectorized_totals = _allocate_shard("vectorized", snapshot)
+
+    def key(a):
+        return (a['inventory_id'], a['order_id'], a['order_item_id'])
+
+    assert [key(a) for a in vectorized_allocations] == [key(a) for a in greedy_allocations]
+    assert [a['quantity'] for a in vectorized_allocations] == pytest.approx(
+        [a['quantity'] for a in greedy_allocations], rel=1e-9, abs=1e-9
+    )
+    assert list(vectorized_totals) == list(greedy_totals)
+    assert list(vectorized_totals.values()) == pytest.approx(list(greedy_totals.values()), rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("algorithm", ["greedy", "vectorized", "lp"])
+def test_sharded_matches_serial(algorithm, monkeypatch):
+    monkeypatch.setattr(settings, "allocation_parallel_min_lines", 0)
+    assert WorkerPool.size() > 1
+
+    for seed in range(20):
+        snapshot = random_snapshot(seed)
+        in_stock = sum(1 for available in snapshot.available.values() if available > 0)
+
+        serial_allocations, serial_totals = _allocate_shard(algorithm, snapshot)
+        allocations, totals, workers = AllocationService._allocate_parallel(snapshot, algorithm)
+
+        assert workers == max(1, min(settings.allocation_workers, WorkerPool.size(), in_stock))
+        assert allocations == serial_allocations, seed
+        assert list(totals.items()) == list(serial_totals.items()), seed
+
+
+def test_small_allocation_runs_in_process(monkeypatch):
+    monkeypatch.setattr(settings, "allocation_parallel_min_lines", 10 ** 9)
+    snapshot = random_snapshot(3)
+
+    allocations, totals, workers = AllocationService._allocate_parallel(snapshot, "greedy")
+
+    assert workers == 1
+    assert (allocations, totals) == _allocate_shard("greedy", snapshot)
+
+
+def test_random_snapshots_cover_edge_cases():
+    snapshots = [random_snapshot(seed) for seed in range(200)]
+    priorities = [p for s in snapshots for p in s.priorities.values()]
+    stock = [a for s in snapshots for a in s.available.values()]
+
+    assert 0.0 in priorities
+    assert any(len(set(s.priorities.values())) < len(s.priorities) for s in snapshots)
+    assert any(a < 0 for a in stock) and 0.0 in stock
+    assert any(
+        len({(l['order_id'], l['inventory_id']) for l in s.lines}) < len(s.lines) for s in snapshots
+    )
+
+
+def pair_bounds(snapshot):
+    """
+    Per (item, customer): demand and the lp engine's minimum and maximum
+    share, for in-stock items
+    """
+    demand = {}
+    for line in snapshot.lines:
+        if snapshot.available[line['inventory_id']] > 0:
+            key = (line['inventory_id'], line['customer_id'])
+            demand[key] = demand.get(key, 0) + line['requested_quantity']
+    bounds = {}
+    for (inv_id, customer_id), pair_demand in demand.items():
+        stock = snapshot.available[inv_id]
+        lower = min(stock * snapshot.min_allocation_percentage, pair_demand)
+        if snapshot.priorities[customer_id] <= 0:
+            lower = 0.0
+        upper = max(min(stock * snapshot.max_allocation_percentage, pair_demand), lower)
+        bounds[(inv_id, customer_id)] = (pair_demand, lower, upper)
+    return bounds
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_lp_respects_shares_stock_and_leaves_nothing_stranded(seed):
+    snapshot = random_snapshot(seed)
+    allocations, totals = _allocate_shard("lp", snapshot)
+    customer_by_item = {line['order_item_id']: line['customer_id'] for line in snapshot.lines}
+    requested_by_item = {line['order_item_id']: line['requested_quantity'] for line in snapshot.lines}
+    tolerance = 1e-9
+
+    allocated = {}
+    for a in allocations:
+        assert 0 < a['quantity'] <= requested_by_item[a['order_item_id']] + tolerance
+        key = (a['inventory_id'], customer_by_item[a['order_item_id']])
+        allocated[key] = allocated.get(key, 0) + a['quantity']
+
+    bounds = pair_bounds(snapshot)
+    infeasible_items, shortfall = AllocationService._min_share_shortfall(snapshot)
+    expected_shortfall = 0.0
+    for inv_id, stock in snapshot.available.items():
+        if stock <= 0:
+            assert inv_id not in totals
+            continue
+        pairs = {key: value for key, value in bounds.items() if key[0] == inv_id}
+        total = sum(allocated.get(key, 0) for key in pairs)
+        assert total <= stock + tolerance
+        assert totals.get(inv_id, 0) == pytest.approx(total, abs=tolerance)
+
+        minimums = sum(lower for _, lower, _ in pairs.values())
+        feasible = minimums <= stock * (1 + 1e-9)
+        if not feasible:
+            expected_shortfall += minimums - stock
+        for key, (pair_demand, lower, upper) in pairs.items():
+            quantity = allocated.get(key, 0)
+            assert quantity <= min(upper, pair_demand) + tolerance
+            if feasible:
+                assert quantity >= lower - tolerance
+        # Stock left over only if every customer is at its maximum share
+        if total < stock - tolerance:
+            assert all(allocated.get(key, 0) >= upper - tolerance for key, (_, _, upper) in pairs.items())
+
+    assert shortfall == pytest.approx(expected_shortfall, abs=tolerance)
+    assert (infeasible_items > 0) == (expected_shortfall > tolerance)
+
+
+def test_lp_covers_infeasible_minimums():
+    assert any(AllocationService._min_share_shortfall(random_snapshot(seed))[0] for seed in range(200))
+
+
+def large_snapshot(lines=100000, customers=2000, items=5000, seed=11):
+    rng = random.Random(seed)
+    snapshot = AllocationSnapshot()
+    snapshot.min_allocation_percentage = 0.05
+    snapshot.max_allocation_percentage = 0.4
+    snapshot.customer_ids = list(range(1, customers + 1))
+    snapshot.priorities = AllocationSnapshot.normalize_priorities({
+        customer_id: rng.uniform(0, 100) for customer_id in snapshot.customer_ids
+    })
+    snapshot.available = {inv_id: float(rng.randint(0, 500)) for inv_id in range(1, items + 1)}
+    for item_id in range(1, lines + 1):
+        customer_id = rng.randint(1, customers)
+        snapshot.lines.append({
+            'order_item_id': item_id,
+            'order_id': customer_id,
+            'customer_id': customer_id,
+            'inventory_id': rng.randint(1, items),
+            'requested_quantity': float(rng.randint(1, 50))
+        })
+    return snapshot
+
+
+def test_lp_allocates_100k_lines_within_budget():
+    snapshot = large_snapshot()
+
+    started = time.perf_counter()
+    allocations, totals = _allocate_shard("lp", snapshot)
+    elapsed = time.perf_counter() - started
+
+    assert allocations and sum(totals.values()) > 0
+    assert elapsed < 5.0
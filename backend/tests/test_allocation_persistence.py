@@ -0,0 +1,78 @@
+"""
+Allocation results are persisted consistently: every order's items,
+allocation rows, totals and status agree, including orders with several
+lines for the same inventory item
+"""
+import pytest
+from sqlalchemy import func
+
+from app.models import Allocation, Customer, Inventory, Order, OrderItem
+from app.services.allocation_service import AllocationService
+
+
+def add_order(db, customer_id, lines):
+    order = Order(customer_id=customer_id, status="pending", total_quantity=sum(q for _, q in lines))
+    db.add(order)
+    db.flush()
+    for inventory_id, quantity in lines:
+        db.add(OrderItem(order_id=order.id, inventory_id=inventory_id, requested_quantity=quantity))
+    db.commit()
+    return order.id
+
+
+def add_item(db, code, available):
+    item = Inventory(product_code=code, product_name=code, available_quantity=available, reserved_quantity=0)
+    db.add(item)
+    db.commit()
+    return item.id
+
+
+def order_state(db, order_id):
+    db.expire_all()
+    order = db.get(Order, order_id)
+    items = {item.id: item.allocated_quantity for item in order.order_items}
+    allocated = db.query(func.coalesce(func.sum(Allocation.allocated_quantity), 0.0)).filter(
+        Allocation.order_id == order_id
+    ).scalar()
+    return order, items, allocated
+
+
+def test_duplicate_lines_for_one_item(database_copy):
+    db = database_copy
+    customer_id = db.query(Customer.id).filter(Customer.status == "active").first().id
+    item_id = add_item(db, "DUPLICATE-LINES", 1000.0)
+    order_id = add_order(db, customer_id, [(item_id, 30.0), (item_id, 20.0)])
+
+    [result] = AllocationService.allocate_orders(order_ids=[order_id], db=db, recalculate_metrics=False)
+
+    order, items, allocated = order_state(db, order_id)
+    # Each line gets its own request, not the item's combined request twice
+    assert sorted(items.values()) == [20.0, 30.0]
+    assert allocated == pytest.approx(50.0)
+    assert (result['total_requested'], result['total_allocated']) == (50.0, pytest.approx(50.0))
+    assert (order.status, order.total_quantity) == ("allocated", pytest.approx(50.0))
+    item = db.get(Inventory, item_id)
+    assert (item.available_quantity, item.reserved_quantity) == (pytest.approx(950.0), pytest.approx(50.0))
+
+
+def test_every_order_of_a_run_is_persisted(database_copy):
+    db = database_copy
+    customer_ids = [row.id for row in db.query(Customer.id).filter(Customer.status == "active").limit(3)]
+    item_id = add_item(db, "SHARED-ITEM", 1000.0)
+    order_ids = [add_order(db, customer_id, [(item_id, 40.0)]) for customer_id in customer_ids]
+
+    results = AllocationService.allocate_orders(order_ids=order_ids, db=db, recalculate_metrics=False)
+
+    assert sorted(result['order_id'] for result in results) == sorted(order_ids)
+    reserved = 0.0
+    for result in results:
+        order, items, allocated = order_state(db, result['order_id'])
+        # The first order of the run is flushed along with the rest
+        assert allocated > 0
+        assert sum(items.values()) == pytest.approx(allocated) == pytest.approx(result['total_allocated'])
+        assert order.total_quantity == pytest.approx(allocated)
+        assert order.status == ("allocated" if allocated >= 0.95 * 40.0 else "partially_allocated")
+        reserved += allocated
+    item = db.get(Inventory, item_id)
+    assert item.reserved_quantity == pytest.approx(reserved)
+    assert item.available_quantity == pytest.approx(1000.0 - reserved)
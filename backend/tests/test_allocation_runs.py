@@ -0,0 +1,71 @@
+"""
+Allocation runs record their stats, including minimum shares the lp engine
+could not fill, and list exactly the allocations they wrote
+"""
+import pytest
+
+from app.models import AllocationRun, Order
+from app.services.allocation_service import AllocationService
+from config import settings
+
+
+def test_lp_run_records_unfilled_minimum_shares(database_copy, monkeypatch):
+    # Minimum shares of 40% can't all be met once three customers want an item
+    monkeypatch.setattr(settings, "min_allocation_percentage", 0.4)
+    monkeypatch.setattr(settings, "max_allocation_percentage", 0.6)
+    stats = {}
+    AllocationService.allocate_orders(db=database_copy, recalculate_metrics=False, algorithm="lp", stats=stats)
+
+    run = database_copy.get(AllocationRun, stats['run_id'])
+    assert run.infeasible_items > 0
+    assert run.min_share_shortfall > 0
+    assert (run.infeasible_items, run.min_share_shortfall) == (stats['infeasible_items'], stats['min_share_shortfall'])
+
+
+def test_feasible_and_greedy_runs_record_no_shortfall(database_copy, monkeypatch):
+    monkeypatch.setattr(settings, "min_allocation_percentage", 0.0)
+    stats = {}
+    AllocationService.allocate_orders(db=database_copy, recalculate_metrics=False, algorithm="lp", stats=stats)
+    run = database_copy.get(AllocationRun, stats['run_id'])
+    assert (run.infeasible_items, run.min_share_shortfall) == (0, 0.0)
+
+    stats = {}
+    AllocationService.allocate_orders(db=database_copy, recalculate_metrics=False, algorithm="greedy", stats=stats)
+    run = database_copy.get(AllocationRun, stats['run_id'])
+    assert run.infeasible_items is None and run.min_share_shortfall is None
+
+
+def allocate(client, order_ids):
+    response = client.post("/allocation/allocate", json={'order_ids': order_ids, 'recalculate_metrics': False})
+    assert response.status_code == 200
+    return int(response.headers["X-Allocation-Run-Id"]), response.json()
+
+
+def test_run_allocations_are_what_the_run_wrote(client, db):
+    pending = [row.id for row in db.query(Order.id).filter(Order.status == "pending").order_by(Order.id)]
+    first_run, first_results = allocate(client, pending[0:20:2])
+    second_run, second_results = allocate(client, pending[1:20:2])
+    assert first_run != second_run
+
+    for run_id, results in [(first_run, first_results), (second_run, second_results)]:
+        allocations = client.get(f"/allocation/runs/{run_id}/allocations").json()
+        assert allocations
+        assert {a['run_id'] for a in allocations} == {run_id}
+        assert len({a['id'] for a in allocations}) == len(allocations)
+
+        allocated = {}
+        for a in allocations:
+            allocated[a['order_id']] = allocated.get(a['order_id'], 0) + a['allocated_quantity']
+        expected = {r['order_id']: r['total_allocated'] for r in results if r['total_allocated'] > 0}
+        assert allocated == pytest.approx(expected)
+
+        run = client.get(f"/allocation/runs/{run_id}").json()
+        assert run['status'] == "completed"
+        assert run['allocations_count'] == len(allocations)
+        assert run['total_allocated'] == pytest.approx(sum(allocated.values()))
+        assert run['order_ids'] == (pending[0:20:2] if run_id == first_run else pending[1:20:2])
+
+
+def test_unknown_run(client):
+    assert client.get("/allocation/runs/999999").status_code == 404
+    assert client.get("/allocation/runs/999999/allocations").status_code == 404
@@ -0,0 +1,95 @@
+"""
+Simulations expand grids, reject unknown settings, write nothing, and with
+the current settings allocate exactly like a real run
+"""
+import pytest
+from sqlalchemy import func
+
+from app.models import Allocation, AllocationRun, CustomerMetric, Inventory, Order
+from app.services.allocation_service import AllocationService
+from app.services.allocation_simulation_service import AllocationSimulationService
+from config import settings
+
+
+def drop_some_metrics(db):
+    """Make sure some customers with pending orders have no metrics"""
+    customer_ids = sorted({row.customer_id for row in db.query(Order.customer_id).filter(Order.status == "pending")})
+    db.query(CustomerMetric).filter(CustomerMetric.customer_id.in_(customer_ids[::2])).delete()
+    db.commit()
+    return customer_ids[::2]
+
+
+def table_state(db):
+    db.expire_all()
+    return {
+        'allocations': db.query(func.count(Allocation.id)).scalar(),
+        'runs': db.query(func.count(AllocationRun.id)).scalar(),
+        'metrics': sorted(row.customer_id for row in db.query(CustomerMetric.customer_id)),
+        'reserved': sorted((row.id, row.reserved_quantity, row.version) for row in db.query(Inventory)),
+        'orders': sorted((row.id, row.status) for row in db.query(Order.id, Order.status)),
+    }
+
+
+def test_expand_grid():
+    configs = AllocationSimulationService.expand_grid({
+        'performance_weight': [0.2, 0.5],
+        'min_allocation_percentage': [0.0, 0.05, 0.1],
+    })
+
+    assert len(configs) == 6
+    assert configs[0] == {'performance_weight': 0.2, 'min_allocation_percentage': 0.0}
+    assert configs[-1] == {'performance_weight': 0.5, 'min_allocation_percentage': 0.1}
+    assert len({tuple(sorted(c.items())) for c in configs}) == 6
+
+
+def test_unknown_grid_setting(client):
+    with pytest.raises(ValueError, match="allocation_weight"):
+        AllocationSimulationService.expand_grid({'allocation_weight': [1.0], 'performance_weight': [0.3]})
+
+    response = client.post("/allocation/simulate", json={'grid': {'allocation_weight': [1.0]}})
+    assert response.status_code == 400
+    assert "allocation_weight" in response.json()['detail']
+
+
+def test_simulation_writes_nothing(client, database_copy):
+    drop_some_metrics(database_copy)
+    before = table_state(database_copy)
+
+    results = AllocationSimulationService.simulate(
+        AllocationSimulationService.expand_grid({'max_allocation_percentage': [0.2, 0.4]}),
+        database_copy,
+        algorithm="greedy"
+    )
+
+    assert len(results) == 2
+    assert any(result['total_allocated'] > 0 for result in results)
+    assert table_state(database_copy) == before
+
+
+@pytest.mark.parametrize("algorithm", ["greedy", "vectorized", "lp"])
+def test_current_settings_match_real_run(client, database_copy, algorithm):
+    without_metrics = drop_some_metrics(database_copy)
+    assert without_metrics
+
+    [result] = AllocationSimulationService.simulate([{}], database_copy, algorithm=algorithm)
+    stats = {}
+    AllocationService.allocate_orders(
+        db=database_copy, recalculate_metrics=False, algorithm=algorithm, stats=stats
+    )
+
+    allocated = {}
+    for customer_id, quantity in database_copy.query(Order.customer_id, Allocation.allocated_quantity).join(
+        Allocation, Allocation.order_id == Order.id
+    ).filter(Allocation.run_id == stats['run_id']):
+        allocated[customer_id] = allocated.get(customer_id, 0) + quantity
+
+    assert result['total_allocated'] > 0
+    assert result['total_allocated'] == pytest.approx(sum(allocated.values()))
+    simulated = {c['customer_id']: c['allocated'] for c in result['customers'] if c['allocated'] > 0}
+    assert simulated == pytest.approx(allocated)
+    assert result['config'] == {
+        field: getattr(settings, field) for field in AllocationSimulationService.CONFIG_FIELDS
+    }
+    # Customers without metrics were scored like the real run scored them
+    priorities = {c['customer_id']: c['priority'] for c in result['customers']}
+    assert any(priorities[customer_id] > 0 for customer_id in without_metrics if customer_id in priorities)
@@ -0,0 +1,82 @@
+"""
+The dashboard summary matches the tables and is served from a cache until
+its TTL expires or a refresh is requested; list totals match the rows
+"""
+import time
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Allocation, Customer, Inventory, Order, Payment
+from app.services.dashboard_service import DashboardService
+from config import settings
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(DashboardService, "_cache", {'expires': 0.0, 'summary': None})
+
+
+def add_customer():
+    db = SessionLocal()
+    try:
+        db.add(Customer(name="Dashboard", status="active"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_summary_matches_tables(client, db, empty_cache):
+    summary = client.get("/dashboard/summary?refresh=true").json()
+
+    orders = db.query(Order).all()
+    payments = db.query(Payment).all()
+    inventory = db.query(Inventory).all()
+    overdue = [p for p in payments if p.status == "overdue"]
+    assert summary['customers'] == db.query(Customer).count()
+    assert summary['active_customers'] == db.query(Customer).filter(Customer.status == "active").count()
+    assert summary['inventory_items'] == len(inventory)
+    assert summary['orders'] == len(orders)
+    assert summary['pending_orders'] == sum(1 for o in orders if o.status == "pending")
+    assert summary['orders_by_status'] == {
+        status: sum(1 for o in orders if o.status == status) for status in {o.status for o in orders}
+    }
+    assert summary['payments'] == len(payments)
+    assert summary['allocations'] == db.query(Allocation).count()
+    assert summary['overdue_payments'] == len(overdue)
+    assert summary['overdue_amount'] == pytest.approx(sum(p.amount for p in overdue))
+    assert summary['total_available_quantity'] == pytest.approx(sum(i.available_quantity for i in inventory))
+    assert summary['total_reserved_quantity'] == pytest.approx(sum(i.reserved_quantity or 0 for i in inventory))
+
+
+def test_summary_is_cached_until_refreshed(client, empty_cache, monkeypatch):
+    monkeypatch.setattr(settings, "dashboard_summary_ttl_seconds", 60.0)
+    first = client.get("/dashboard/summary").json()
+    add_customer()
+
+    cached = client.get("/dashboard/summary").json()
+    assert cached == first
+
+    refreshed = client.get("/dashboard/summary?refresh=true").json()
+    assert refreshed['customers'] == first['customers'] + 1
+    assert refreshed['generated_at'] > first['generated_at']
+    # A refresh also renews the cache
+    assert client.get("/dashboard/summary").json() == refreshed
+
+
+def test_summary_expires_after_ttl(client, empty_cache, monkeypatch):
+    monkeypatch.setattr(settings, "dashboard_summary_ttl_seconds", 0.2)
+    first = client.get("/dashboard/summary").json()
+    add_customer()
+    assert client.get("/dashboard/summary").json() == first
+
+    time.sleep(0.3)
+    assert client.get("/dashboard/summary").json()['customers'] == first['customers'] + 1
+
+
+def test_metrics_total_count_header(client):
+    response = client.get("/metrics/?limit=5&status=active&min_score=10&compute_missing=true")
+    everything = client.get("/metrics/?limit=1000&status=active&min_score=10").json()
+
+    assert len(response.json()) == min(5, len(everything))
+    assert int(response.headers["X-Total-Count"]) == len(everything) > 5
@@ -0,0 +1,104 @@
+"""
+Inventory edits and allocation runs reserve stock optimistically: a stale
+version is rejected, and a run whose stock changed underneath it reloads and
+retries a bounded number of times without ever over-reserving
+"""
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Allocation, AllocationRun, Inventory
+from app.services.allocation_service import AllocationConflictError, AllocationService, _allocate_shard
+from app.services.allocation_snapshot import AllocationSnapshot
+from config import settings
+
+
+def test_stale_version_is_rejected(client):
+    item = client.get("/inventory/1").json()
+
+    response = client.put("/inventory/1", json={'product_name': "Renamed", 'version': item['version']})
+    assert response.status_code == 200
+    assert response.json()['version'] == item['version'] + 1
+
+    response = client.put("/inventory/1", json={'product_name': "Stale edit", 'version': item['version']})
+    assert response.status_code == 409
+    assert client.get("/inventory/1").json()['product_name'] == "Renamed"
+
+
+def contested_item(db):
+    """Id of the inventory item a run would allocate most of"""
+    snapshot = AllocationSnapshot.load(db, compute_missing_metrics=False)
+    _, inventory_totals = _allocate_shard("greedy", snapshot)
+    item_id = max(inventory_totals, key=inventory_totals.get)
+    assert inventory_totals[item_id] > 1
+    return item_id
+
+
+def stock(db):
+    db.expire_all()
+    return {item.id: (item.available_quantity, item.reserved_quantity) for item in db.query(Inventory)}
+
+
+def run_allocations(db, run_id):
+    return dict(
+        db.query(Allocation.inventory_id, func.sum(Allocation.allocated_quantity))
+        .filter(Allocation.run_id == run_id).group_by(Allocation.inventory_id)
+    )
+
+
+def edit_stock_before_persisting(db, item_id, edits):
+    """
+    Progress callback that sets an item's unreserved stock to 1, 2, 3, ...
+    right before each of the first `edits` persists
+    """
+    done = []
+
+    def progress(phase):
+        if phase == "persisting" and len(done) < edits:
+            with Session(db.get_bind()) as other:
+                item = other.get(Inventory, item_id)
+                item.available_quantity = (item.reserved_quantity or 0) + 1.0 + len(done)
+                other.commit()
+            done.append(phase)
+
+    return progress, done
+
+
+def test_run_retries_after_concurrent_stock_change(database_copy):
+    db = database_copy
+    item_id = contested_item(db)
+    reserved = stock(db)[item_id][1]
+    progress, edits = edit_stock_before_persisting(db, item_id, 1)
+
+    stats = {}
+    AllocationService.allocate_orders(db=db, recalculate_metrics=False, stats=stats, progress=progress)
+
+    assert edits and stats['retries'] == 1
+    after = stock(db)
+    allocated = run_allocations(db, stats['run_id'])
+    # The retry allocated against the edited stock
+    assert 0 < allocated[item_id] <= 1.0 + 1e-9
+    assert after[item_id] == pytest.approx((reserved + 1.0 - allocated[item_id], reserved + allocated[item_id]))
+    assert all(available >= -1e-9 for available, _ in after.values())
+    run = db.get(AllocationRun, stats['run_id'])
+    assert (run.status, run.retries) == ("completed", 1)
+
+
+def test_run_gives_up_after_max_retries(database_copy, monkeypatch):
+    monkeypatch.setattr(settings, "allocation_max_retries", 2)
+    db = database_copy
+    item_id = contested_item(db)
+    progress, edits = edit_stock_before_persisting(db, item_id, 10)
+    before = stock(db)
+
+    stats = {}
+    with pytest.raises(AllocationConflictError):
+        AllocationService.allocate_orders(db=db, recalculate_metrics=False, stats=stats, progress=progress)
+
+    # One attempt plus two retries, and nothing reserved by any of them
+    assert len(edits) == 3
+    after = stock(db)
+    assert after[item_id] == (before[item_id][1] + 3.0, before[item_id][1])
+    assert {k: v for k, v in after.items() if k != item_id} == {k: v for k, v in before.items() if k != item_id}
+    assert run_allocations(db, stats['run_id']) == {}
+    assert db.get(AllocationRun, stats['run_id']).status == "failed"
@@ -0,0 +1,94 @@
+"""
+Snapshot compaction keeps the last snapshot per customer and Monday-based
+week, then per calendar month, including across week, month and year ends
+"""
+from datetime import datetime
+
+import pytest
+
+from app.models import Customer, CustomerMetricSnapshot
+from app.services.metric_snapshot_service import MetricSnapshotService
+from config import settings
+
+
+NOW = datetime(2025, 3, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def compaction_settings(monkeypatch):
+    # Raw for 30 days (since 2025-01-30), weekly for a year (since 2024-03-01)
+    monkeypatch.setattr(settings, "metric_snapshot_raw_days", 30)
+    monkeypatch.setattr(settings, "metric_snapshot_weekly_days", 365)
+
+
+def record(db, recorded_at_values):
+    customer = Customer(name="Snapshot history", status="active")
+    db.add(customer)
+    db.flush()
+    for score, recorded_at in enumerate(recorded_at_values):
+        db.add(CustomerMetricSnapshot(
+            customer_id=customer.id, recorded_at=recorded_at, granularity="raw", overall_score=float(score)
+        ))
+    db.commit()
+    return customer.id
+
+
+def history(db, customer_id):
+    db.expire_all()
+    return [
+        (snapshot.recorded_at, snapshot.granularity)
+        for snapshot in MetricSnapshotService.history(customer_id, db)
+    ]
+
+
+def test_weekly_compaction_boundaries(db, compaction_settings):
+    customer_id = record(db, [
+        datetime(2024, 12, 29, 10, 0),        # Sunday: last day of its week
+        datetime(2024, 12, 29, 23, 59, 59),
+        datetime(2024, 12, 30, 0, 0),         # Monday: the week spans the year end
+        datetime(2025, 1, 1, 12, 0),
+        datetime(2025, 1, 5, 23, 59, 59),
+        datetime(2025, 1, 6, 0, 0),           # next Monday
+        datetime(2025, 2, 20, 8, 0),          # newer than the raw cutoff
+        datetime(2025, 2, 20, 9, 0),
+    ])
+
+    MetricSnapshotService.compact(db, NOW)
+
+    assert history(db, customer_id) == [
+        (datetime(2024, 12, 29, 23, 59, 59), "week"),
+        (datetime(2025, 1, 5, 23, 59, 59), "week"),
+        (datetime(2025, 1, 6, 0, 0), "week"),
+        (datetime(2025, 2, 20, 8, 0), "raw"),
+        (datetime(2025, 2, 20, 9, 0), "raw"),
+    ]
+
+
+def test_monthly_compaction_boundaries(db, compaction_settings):
+    customer_id = record(db, [
+        datetime(2023, 1, 15, 9, 0),
+        datetime(2023, 1, 31, 23, 59, 59),    # Tuesday; its week runs into February
+        datetime(2023, 2, 1, 0, 0),
+        datetime(2023, 2, 28, 12, 0),
+        datetime(2023, 12, 31, 23, 0),        # year end
+        datetime(2024, 1, 1, 0, 0),
+        datetime(2024, 2, 27, 0, 0),          # Tuesday of the week spanning the monthly cutoff
+        datetime(2024, 3, 1, 12, 0),          # weekly from here
+        datetime(2024, 3, 3, 9, 0),
+    ])
+
+    removed = MetricSnapshotService.compact(db, NOW)
+
+    assert history(db, customer_id) == [
+        (datetime(2023, 1, 31, 23, 59, 59), "month"),
+        (datetime(2023, 2, 28, 12, 0), "month"),
+        (datetime(2023, 12, 31, 23, 0), "month"),
+        (datetime(2024, 1, 1, 0, 0), "month"),
+        (datetime(2024, 2, 27, 0, 0), "month"),
+        (datetime(2024, 3, 3, 9, 0), "week"),
+    ]
+    assert removed['month'] >= 2 and removed['week'] >= 1
+
+    # Compacting again changes nothing
+    assert MetricSnapshotService.compact(db, NOW) == {'week': 0, 'month': 0}
+    assert len(history(db, customer_id)) == 6
@@ -0,0 +1,99 @@
+"""
+Set-based metrics recalculation produces the same customer_metrics as the
+per-customer calculate_all_metrics path
+"""
+import pytest
+
+from app.database import SessionLocal
+from app.models import Customer, CustomerMetric
+from app.services.metrics_service import MetricsService
+from app.services.worker_pool import WorkerPool
+from config import settings
+
+
+@pytest.fixture(scope="module")
+def customer_without_history(client):
+    """An active customer with no payments or orders"""
+    db = SessionLocal()
+    try:
+        customer = Customer(name="No history", status="active")
+        db.add(customer)
+        db.commit()
+        return customer.id
+    finally:
+        db.close()
+
+
+def expected_metrics(db):
+    """calculate_all_metrics values of every active customer, without writing them"""
+    customer_ids = [row.id for row in db.query(Customer.id).filter(Customer.status == "active")]
+    expected = {}
+    for customer_id in customer_ids:
+        values = MetricsService.compute_customer_metrics(customer_id, db)
+        del values['last_calculated']
+        expected[customer_id] = values
+    return expected
+
+
+def clear_metrics(db):
+    db.query(CustomerMetric).delete()
+    db.commit()
+
+
+def assert_metrics_match(db, expected):
+    """customer_metrics holds exactly the expected customers' rows, with the expected values"""
+    db.expire_all()
+    rows = {row.customer_id: row for row in db.query(CustomerMetric)}
+    assert set(rows) == set(expected)
+    for customer_id, values in expected.items():
+        actual = {column: getattr(rows[customer_id], column) for column in values}
+        assert actual == pytest.approx(values, rel=1e-9, abs=1e-9), customer_id
+
+
+@pytest.mark.parametrize("recalculate", [
+    MetricsService.recalculate_metrics_bulk,
+    MetricsService.recalculate_metrics_columnar,
+])
+def test_matches_per_customer_metrics(db, customer_without_history, recalculate):
+    expected = expected_metrics(db)
+    assert customer_without_history in expected
+    clear_metrics(db)
+
+    assert recalculate(db) == len(expected)
+    assert_metrics_match(db, expected)
+
+
+@pytest.mark.parametrize("min_customers", [0, 10 ** 9])
+def test_parallel_matches_per_customer_metrics(db, customer_without_history, monkeypatch, min_customers):
+    # In the worker pool, and in-process below the size threshold
+    monkeypatch.setattr(settings, "metrics_parallel_min_customers", min_customers)
+    expected = expected_metrics(db)
+    clear_metrics(db)
+
+    assert MetricsService.recalculate_metrics_parallel(db, workers=3) == len(expected)
+    assert_metrics_match(db, expected)
+
+    progress = MetricsService.recalculation_progress()
+    assert progress['status'] == "completed"
+    assert progress['workers'] == (WorkerPool.size() if min_customers == 0 else 1)
+    assert progress['completed_shards'] == progress['shards'] > 1
+    assert progress['completed_customers'] == progress['customers'] == len(expected)
+
+
+def test_columnar_matches_across_batches(db, customer_without_history, monkeypatch):
+    # Stream payments and orders a few rows at a time
+    monkeypatch.setattr(settings, "metrics_batch_size", 7)
+    expected = expected_metrics(db)
+    clear_metrics(db)
+
+    assert MetricsService.recalculate_metrics_columnar(db) == len(expected)
+    assert_metrics_match(db, expected)
+
+
+def test_columnar_customer_subset(db, customer_without_history):
+    expected = expected_metrics(db)
+    subset = sorted(expected)[::3]
+    clear_metrics(db)
+
+    assert MetricsService.recalculate_metrics_columnar(db, subset) == len(subset)
+    assert_metrics_match(db, {customer_id: expected[customer_id] for customer_id in subset})
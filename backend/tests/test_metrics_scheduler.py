@@ -0,0 +1,117 @@
+"""
+Write handlers enqueue the customers they change, and the background
+scheduler coalesces a burst of enqueues into one debounced refresh
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Customer
+from app.services.metrics_scheduler import MetricsRefreshScheduler
+from config import settings
+
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    """Customer ids passed to MetricsRefreshScheduler.enqueue, one list per call"""
+    calls = []
+    monkeypatch.setattr(MetricsRefreshScheduler, "enqueue", lambda customer_ids: calls.append(list(customer_ids)))
+    return calls
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """Running scheduler with a short debounce; refreshes are recorded instead of run"""
+    monkeypatch.setattr(settings, "metrics_refresh_enabled", True)
+    monkeypatch.setattr(settings, "metrics_refresh_debounce_seconds", 0.3)
+    monkeypatch.setattr(settings, "metrics_refresh_interval_seconds", 3600.0)
+    monkeypatch.setattr(MetricsRefreshScheduler, "_pending", set())
+    monkeypatch.setattr(MetricsRefreshScheduler, "_compact_if_due", lambda: None)
+    MetricsRefreshScheduler._wake.clear()
+
+    refreshes = []
+    refreshed = threading.Event()
+
+    def refresh(customer_ids):
+        refreshes.append((time.monotonic(), customer_ids))
+        refreshed.set()
+
+    monkeypatch.setattr(MetricsRefreshScheduler, "_refresh", refresh)
+    MetricsRefreshScheduler.start()
+    try:
+        yield refreshes, refreshed
+    finally:
+        MetricsRefreshScheduler.stop()
+
+
+def test_burst_is_coalesced_into_one_refresh(scheduler):
+    refreshes, refreshed = scheduler
+
+    started = time.monotonic()
+    MetricsRefreshScheduler.enqueue([3])
+    time.sleep(0.05)
+    MetricsRefreshScheduler.enqueue([1, 3])
+    MetricsRefreshScheduler.enqueue([2])
+
+    assert refreshed.wait(5)
+    time.sleep(0.5)
+    assert [customer_ids for _, customer_ids in refreshes] == [[1, 2, 3]]
+    # Not before the debounce delay
+    assert refreshes[0][0] - started >= settings.metrics_refresh_debounce_seconds
+    assert MetricsRefreshScheduler.status()['pending'] == 0
+
+
+def test_later_enqueue_gets_its_own_refresh(scheduler):
+    refreshes, refreshed = scheduler
+
+    MetricsRefreshScheduler.enqueue([4])
+    assert refreshed.wait(5)
+    refreshed.clear()
+    MetricsRefreshScheduler.enqueue([5])
+    assert refreshed.wait(5)
+
+    assert [customer_ids for _, customer_ids in refreshes] == [[4], [5]]
+
+
+def test_write_handlers_enqueue_changed_customers(client, enqueued):
+    due_date = datetime.utcnow() - timedelta(days=3)
+    payment = client.post("/payments/", json={
+        'customer_id': 6, 'due_date': due_date.isoformat(),
+        'payment_date': due_date.isoformat(), 'amount': 50.0
+    }).json()
+    client.put(f"/payments/{payment['id']}", json={'status': "overdue"})
+    client.delete(f"/payments/{payment['id']}")
+
+    order = client.post("/orders/", json={
+        'customer_id': 8, 'items': [{'inventory_id': 2, 'requested_quantity': 3}]
+    }).json()
+    client.put(f"/orders/{order['id']}", json={'status': "fulfilled"})
+    client.delete(f"/orders/{order['id']}")
+
+    assert enqueued == [[6], [6], [6], [8], [8], [8]]
+
+
+def test_missing_metrics_are_scheduled(client, enqueued):
+    db = SessionLocal()
+    try:
+        customer = Customer(name="Scheduled", status="active")
+        db.add(customer)
+        db.commit()
+        customer_id = customer.id
+    finally:
+        db.close()
+
+    response = client.get(f"/metrics/customer/{customer_id}")
+    assert response.status_code == 202
+    assert response.json()['status'] == "scheduled"
+    assert enqueued == [[customer_id]]
+
+    response = client.get(f"/metrics/customer/{customer_id}?compute=true")
+    assert response.status_code == 200
+    assert response.json()['customer_id'] == customer_id
+    assert enqueued == [[customer_id]]
+
+    assert client.get("/metrics/customer/999999").status_code == 404
@@ -0,0 +1,84 @@
+"""
+Following X-Next-Cursor through a list endpoint returns the same rows, in
+the same order, as offset paging; malformed cursors are rejected with 400
+"""
+import base64
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def allocated(client):
+    """Allocate pending orders so there is allocation history to page through"""
+    response = client.post("/allocation/allocate", json={})
+    assert response.status_code == 200
+    return response
+
+
+def cursor_pages(client, path, limit):
+    separator = "&" if "?" in path else "?"
+    rows, pages, cursor = [], 0, None
+    while True:
+        url = f"{path}{separator}limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= limit
+        rows.extend(page)
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return rows, pages
+
+
+def offset_pages(client, path, limit):
+    separator = "&" if "?" in path else "?"
+    rows, skip = [], 0
+    while True:
+        page = client.get(f"{path}{separator}limit={limit}&skip={skip}").json()
+        rows.extend(page)
+        if len(page) < limit:
+            return rows
+        skip += limit
+
+
+@pytest.mark.parametrize("path", [
+    "/customers/",
+    "/inventory/",
+    "/orders/",
+    "/orders/?status=pending",
+    "/payments/",
+    "/payments/?status=paid",
+    "/allocation/history",
+])
+def test_cursor_pages_match_offset_pages(client, allocated, path):
+    rows, pages = cursor_pages(client, path, 3)
+    expected = offset_pages(client, path, 3)
+
+    assert len(expected) > 3
+    assert pages == -(-len(expected) // 3)
+    assert [row['id'] for row in rows] == [row['id'] for row in expected]
+    assert len({row['id'] for row in rows}) == len(rows)
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("path", ["/customers/", "/payments/", "/allocation/history"])
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    encode("{}"),
+    encode("[1, 2, 3]"),
+    encode('["not a date", 1]'),
+])
+def test_malformed_cursor_is_rejected(client, path, cursor):
+    response = client.get(path, params={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Invalid cursor"
+
+
+def test_cursor_of_another_endpoint_is_rejected(client):
+    # Payments are keyed by (payment_date, id), customers by id alone
+    cursor = client.get("/payments/?limit=2").headers["X-Next-Cursor"]
+    assert client.get("/customers/", params={'cursor': cursor}).status_code == 400
@@ -0,0 +1,39 @@
+"""
+List endpoints eager-load nested models: the number of queries per request
+(X-Query-Count) doesn't grow with the page size
+"""
+import pytest
+
+
+@pytest.fixture(scope="module")
+def allocated(client):
+    """Allocate pending orders so there is allocation history to list"""
+    response = client.post("/allocation/allocate", json={})
+    assert response.status_code == 200
+    return response
+
+
+def query_count(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return int(response.headers["X-Query-Count"]), response.json()
+
+
+def test_orders_query_count_is_constant(client):
+    small, small_page = query_count(client, "/orders/?limit=5")
+    large, large_page = query_count(client, "/orders/?limit=100")
+
+    assert len(small_page) == 5
+    assert len(large_page) == 100
+    assert all(order['order_items'] for order in large_page)
+    # One query for the page, one for the items of all its orders
+    assert small == large == 2
+
+
+def test_allocation_history_query_count_is_constant(client, allocated):
+    small, small_page = query_count(client, "/allocation/history?limit=5")
+    large, large_page = query_count(client, "/allocation/history?limit=100")
+
+    assert len(small_page) == 5
+    assert len(large_page) > 5
+    assert small == large
@@ -0,0 +1,101 @@
+"""
+The hot queries of allocation, metrics and the list endpoints are served by
+their indexes: EXPLAIN QUERY PLAN searches (or walks in order) the expected
+index and never reads a whole table
+"""
+import re
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from app.api import allocation, customers, payments
+from app.database import Base
+from app.models import Allocation, Customer, Order, OrderItem, Payment
+from app.services.pagination_service import PaginationService
+
+# A plan step reading a whole table: "SCAN orders", but not
+# "SCAN orders USING INDEX ..." (an ordered index walk)
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def cursor_page(statement, keys, *last_row):
+    """A list endpoint's page after a cursor"""
+    row = SimpleNamespace(**dict(zip([column.key for column, _ in keys], last_row)))
+    cursor = PaginationService.encode_cursor(row, keys)
+    return PaginationService.paginate(statement, keys, 100, cursor)
+
+
+def hot_queries():
+    """(description, statement, index) triples mirroring the queries the app runs on hot paths"""
+    pending = Order.status == "pending"
+    pending_order_ids = select(Order.id).where(pending)
+    return [
+        ("pending orders of a batch (allocation snapshot)",
+         select(Order.id, Order.customer_id, Order.total_quantity).where(pending),
+         "ix_orders_status_customer"),
+        ("customers with pending orders (allocation snapshot, metrics refresh)",
+         select(Order.customer_id).where(pending).distinct(),
+         "ix_orders_status_customer"),
+        ("orders by status and customer (GET /orders/)",
+         select(Order).where(Order.status == "pending", Order.customer_id == 1),
+         "ix_orders_status_customer"),
+        ("items of pending orders (allocation snapshot)",
+         select(OrderItem.id, OrderItem.order_id, OrderItem.inventory_id, OrderItem.requested_quantity)
+         .where(OrderItem.order_id.in_(pending_order_ids)),
+         "ix_order_items_order_inventory"),
+        ("inventory of pending orders (allocation snapshot)",
+         select(OrderItem.inventory_id).where(OrderItem.order_id.in_(pending_order_ids)),
+         "ix_order_items_order_inventory"),
+        ("order item of an order and product",
+         select(OrderItem).where(OrderItem.order_id == 1, OrderItem.inventory_id == 1),
+         "ix_order_items_order_inventory"),
+        ("customer payments (metrics)",
+         select(Payment).where(Payment.customer_id == 1),
+         "ix_payments_customer_status_date"),
+        ("customer paid payments (payment frequency score)",
+         select(Payment).where(Payment.customer_id == 1, Payment.status == "paid"),
+         "ix_payments_customer_status_date"),
+        ("customer payments by status, newest first (GET /payments/)",
+         select(Payment).where(Payment.customer_id == 1, Payment.status == "paid")
+         .order_by(Payment.payment_date.desc()).limit(100),
+         "ix_payments_customer_status_date"),
+        ("allocations of an order (GET /allocation/order/{id})",
+         select(Allocation).where(Allocation.order_id == 1),
+         "ix_allocations_order_inventory"),
+        ("allocations of an order and product (GET /allocation/history)",
+         select(Allocation).where(Allocation.order_id == 1, Allocation.inventory_id == 1),
+         "ix_allocations_order_inventory"),
+        ("allocation history, newest first (GET /allocation/history)",
+         select(Allocation).order_by(Allocation.allocation_date.desc()).limit(100),
+         "ix_allocations_allocation_date"),
+        ("customer page after a cursor (GET /customers/?cursor=)",
+         cursor_page(select(Customer), customers.PAGE_KEYS, 500),
+         "INTEGER PRIMARY KEY"),
+        ("payment page after a cursor (GET /payments/?cursor=)",
+         cursor_page(select(Payment), payments.PAGE_KEYS, datetime(2024, 1, 1), 500),
+         "ix_payments_payment_date"),
+        ("allocation history page after a cursor (GET /allocation/history?cursor=)",
+         cursor_page(select(Allocation), allocation.HISTORY_PAGE_KEYS, datetime(2024, 1, 1), 500),
+         "ix_allocations_allocation_date"),
+    ]
+
+
+@pytest.fixture(scope="module")
+def schema_engine(tmp_path_factory):
+    """A fresh database with the app's schema, so plans don't depend on the seeded data"""
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("description, statement, index", hot_queries())
+def test_hot_query_uses_index(schema_engine, description, statement, index):
+    sql = str(statement.compile(dialect=schema_engine.dialect, compile_kwargs={"literal_binds": True}))
+    with schema_engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+    assert not [step for step in plan if FULL_SCAN.match(step)], f"{description} scans a table: {plan}"
+    assert any(index in step for step in plan), f"{description} doesn't use {index}: {plan}"
@@ -0,0 +1,67 @@
+"""
+Rolling-window payment aggregates summed from the monthly buckets equal the
+aggregates of the payments due in the window's months
+"""
+from datetime import datetime
+
+from app.models import Customer, CustomerMetric, Payment
+from app.services.metric_aggregate_service import MetricAggregateService
+from app.services.metrics_service import MetricsService
+
+
+def test_window_start_months():
+    assert MetricAggregateService.window_start_months(datetime(2026, 3, 15)) == {
+        90: "2026-01", 180: "2025-10", 365: "2025-04"
+    }
+    assert MetricAggregateService.window_start_months(datetime(2026, 12, 31)) == {
+        90: "2026-10", 180: "2026-07", 365: "2026-01"
+    }
+
+
+def expected_window_stats(db, customer_ids, today=None):
+    starts = MetricAggregateService.window_start_months(today)
+    expected = {
+        customer_id: {days: dict.fromkeys(MetricAggregateService.PAYMENT_FIELDS, 0) for days in starts}
+        for customer_id in customer_ids
+    }
+    for payment in db.query(Payment).filter(Payment.customer_id.in_(customer_ids)):
+        delta = MetricAggregateService.payment_delta(payment)
+        for days, start in starts.items():
+            if MetricAggregateService.payment_month(payment) >= start:
+                stats = expected[payment.customer_id][days]
+                for field in MetricAggregateService.PAYMENT_FIELDS:
+                    stats[field] += delta[field]
+    return expected
+
+
+def test_window_stats_match_payments(client, db):
+    customer_ids = [row.id for row in db.query(Customer.id)]
+
+    stats = MetricAggregateService.window_stats(customer_ids, db)
+
+    assert stats == expected_window_stats(db, customer_ids)
+    # Windows are nested and the seeded history reaches into each of them
+    assert any(s[90]['total_payments'] for s in stats.values())
+    for customer_stats in stats.values():
+        assert customer_stats[90]['total_payments'] <= customer_stats[180]['total_payments'] \
+            <= customer_stats[365]['total_payments']
+
+
+def test_window_stats_in_the_past(client, db):
+    customer_ids = [row.id for row in db.query(Customer.id)]
+    a_year_ago = datetime(datetime.utcnow().year - 1, 6, 30)
+
+    assert MetricAggregateService.window_stats(customer_ids, db, a_year_ago) == \
+        expected_window_stats(db, customer_ids, a_year_ago)
+
+
+def test_window_scores_are_stored(client, db):
+    customer_id = db.query(Payment.customer_id).filter(Payment.status == "paid").first().customer_id
+
+    metrics = MetricsService.calculate_all_metrics(customer_id, db)
+
+    window_stats = expected_window_stats(db, [customer_id])[customer_id]
+    expected = MetricsService.window_metrics(window_stats, metrics.performance_score)
+    db.expire_all()
+    stored = db.query(CustomerMetric).filter(CustomerMetric.customer_id == customer_id).one()
+    assert {column: getattr(stored, column) for column in expected} == expected
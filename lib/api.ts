@@ -89,11 +89,37 @@ export const allocationAPI = {
 
 // Metrics APIs
 export const metricsAPI = {
+  getAll: (params?: {
+    skip?: number;
+    limit?: number;
+    sort_by?: string;
+    order?: 'asc' | 'desc';
+    min_score?: number;
+    max_score?: number;
+    status?: string;
+    compute_missing?: boolean;
+  }) => {
+    const queryParams = new URLSearchParams();
+    if (params?.skip) queryParams.append('skip', params.skip.toString());
+    if (params?.limit) queryParams.append('limit', params.limit.toString());
+    if (params?.sort_by) queryParams.append('sort_by', params.sort_by);
+    if (params?.order) queryParams.append('order', params.order);
+    if (params?.min_score !== undefined) queryParams.append('min_score', params.min_score.toString());
+    if (params?.max_score !== undefined) queryParams.append('max_score', params.max_score.toString());
+    if (params?.status) queryParams.append('status', params.status);
+    if (params?.compute_missing) queryParams.append('compute_missing', 'true');
+    return api.get(`/metrics/?${queryParams.toString()}`);
+  },
   getCustomerMetrics: (customerId: number) => api.get(`/metrics/customer/${customerId}`),
   recalculateCustomer: (customerId: number) => api.post(`/metrics/customer/${customerId}/recalculate`),
   recalculateAll: () => api.post('/metrics/recalculate-all'),
 };
 
+// Dashboard APIs
+export const dashboardAPI = {
+  getSummary: (refresh = false) => api.get(`/dashboard/summary${refresh ? '?refresh=true' : ''}`),
+};
+
 // Health check
 export const healthCheck = () => api.get('/health');
 